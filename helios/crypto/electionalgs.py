@@ -12,6 +12,7 @@ import uuid
 import datetime
 
 from phoebus import phoebus
+from phoebus.mixnet.DLogTable import DLogTable
 from helios.crypto.elgamal import Ciphertext
 
 class HeliosObject(object):
@@ -444,40 +445,6 @@ class CastVote(HeliosObject):
 
     return issues
 
-class DLogTable(object):
-  """
-  Keeping track of discrete logs
-  """
-
-  def __init__(self, base, modulus):
-    self.dlogs = {}
-    self.dlogs[1] = 0
-    self.last_dlog_result = 1
-    self.counter = 0
-
-    self.base = base
-    self.modulus = modulus
-
-  def increment(self):
-    self.counter += 1
-
-    # new value
-    new_value = (self.last_dlog_result * self.base) % self.modulus
-
-    # record the discrete log
-    self.dlogs[new_value] = self.counter
-
-    # record the last value
-    self.last_dlog_result = new_value
-
-  def precompute(self, up_to):
-    while self.counter < up_to:
-      self.increment()
-
-  def lookup(self, value):
-    return self.dlogs.get(value, None)
-
-
 class Tally(HeliosObject):
   """
   A running homomorphic tally
@@ -629,8 +596,8 @@ class Tally(HeliosObject):
     Each decryption factor set is a list of lists of decryption factors (questions/answers).
     """
 
-    # pre-compute a dlog table
-    dlog_table = DLogTable(base = public_key.g, modulus = public_key.p)
+    # the dlog table is shared by all the elections with the same generator
+    dlog_table = DLogTable.get(public_key.g, public_key.p)
     dlog_table.precompute(self.num_tallied)
 
     result = []
@@ -644,7 +611,7 @@ class Tally(HeliosObject):
         dec_factor_list = [df[q_num][a_num] for df in decryption_factors]
         raw_value = self.tally[q_num][a_num].decrypt(dec_factor_list, public_key)
 
-        q_result.append(dlog_table.lookup(raw_value))
+        q_result.append(dlog_table.lookup(raw_value, self.num_tallied))
 
       result.append(q_result)
 
@@ -10,11 +10,27 @@ ben@adida.net
 
 import math, hashlib, logging
 import randpool, number
+from phoebus.mixnet.arithmetic import powmod, multi_powmod
+from phoebus.mixnet.FixedBaseTable import FixedBaseTable
+from phoebus.mixnet.WorkerPool import WorkerPool
 
 import numtheory
 
 from algs import Utils
 
+def _decryption_factor_and_commitment(shared, item):
+    """
+    the decryption factor alpha^x of a ciphertext and the commitment
+    (g^w, alpha^w) of its proof, to be used with WorkerPool.
+
+    only the public (g, p) are shared: x and w are secret, so each item
+    (alpha, x, w) is sent with its task through the pipes of the pool,
+    and never written to the shared file.
+    """
+    g, p = shared
+    alpha, x, w = item
+    return powmod(alpha, x, p), FixedBaseTable.get(g, p).pow(w), powmod(alpha, w, p)
+
 class Cryptosystem(object):
     def __init__(self):
       self.p = None
@@ -40,7 +56,7 @@ class Cryptosystem(object):
       # find g that generates the q-order subgroup
       while True:
         EG.g = Utils.random_mpz_lt(EG.p)
-        if pow(EG.g, EG.q, EG.p) == 1:
+        if powmod(EG.g, EG.q, EG.p) == 1:
           break
 
       return EG
@@ -69,7 +85,7 @@ class KeyPair(object):
       self.pk.q = q
       
       self.sk.x = Utils.random_mpz_lt(q)
-      self.pk.y = pow(g, self.sk.x, p)
+      self.pk.y = powmod(g, self.sk.x, p)
       
       self.sk.public_key = self.pk
 
@@ -90,15 +106,15 @@ class PublicKey:
         # make sure m is in the right subgroup
         if encode_message:
           y = plaintext.m + 1
-          if pow(y, self.q, self.p) == 1:
+          if powmod(y, self.q, self.p) == 1:
             m = y
           else:
             m = -y % self.p
         else:
           m = plaintext.m
         
-        ciphertext.alpha = pow(self.g, r, self.p)
-        ciphertext.beta = (m * pow(self.y, r, self.p)) % self.p
+        ciphertext.alpha = powmod(self.g, r, self.p)
+        ciphertext.beta = (m * powmod(self.y, r, self.p)) % self.p
         
         return ciphertext
 
@@ -137,8 +153,8 @@ class PublicKey:
       verify the proof of knowledge of the secret key
       g^response = commitment * y^challenge
       """
-      left_side = pow(self.g, dlog_proof.response, self.p)
-      right_side = (dlog_proof.commitment * pow(self.y, dlog_proof.challenge, self.p)) % self.p
+      left_side = powmod(self.g, dlog_proof.response, self.p)
+      right_side = (dlog_proof.commitment * powmod(self.y, dlog_proof.challenge, self.p)) % self.p
       
       expected_challenge = challenge_generator(dlog_proof.commitment) % self.q
       
@@ -146,6 +162,9 @@ class PublicKey:
 
 
 class SecretKey:
+    # never shared with the mixnet worker processes (see WorkerPool)
+    SECRET = True
+
     def __init__(self):
         self.x = None
         self.public_key = None
@@ -158,7 +177,7 @@ class SecretKey:
         """
         provide the decryption factor, not yet inverted because of needed proof
         """
-        return pow(ciphertext.alpha, self.x, self.pk.p)
+        return powmod(ciphertext.alpha, self.x, self.pk.p)
 
     def decryption_factor_and_proof(self, ciphertext, challenge_generator=None):
         """
@@ -174,6 +193,39 @@ class SecretKey:
 
         return dec_factor, proof
 
+    def decryption_factors_and_proofs(self, ciphertexts, challenge_generator=None):
+        """
+        decryption_factor_and_proof for a whole list of ciphertexts, returns
+        the list of factors and the list of proofs.
+
+        the exponentiations are spread over the mixnet worker processes, with
+        a fixed-base table for g. The random w of each proof is drawn here,
+        so that the workers never share a random number generator state.
+        x and the ws are sent with the tasks, never in the shared object
+        of the pool, which is written to disk.
+        """
+        if not challenge_generator:
+            challenge_generator = fiatshamir_challenge_generator
+
+        ws = [Utils.random_mpz_lt(self.pk.q) for ciphertext in ciphertexts]
+        items = [(ciphertext.alpha, self.x, w) for ciphertext, w in zip(ciphertexts, ws)]
+        results = WorkerPool.get().map(_decryption_factor_and_commitment, (self.pk.g, self.pk.p), items)
+
+        dec_factors = []
+        proofs = []
+        for w, (dec_factor, A, B) in zip(ws, results):
+            # as in ZKProof.generate
+            proof = ZKProof()
+            proof.commitment['A'] = A
+            proof.commitment['B'] = B
+            proof.challenge = challenge_generator(proof.commitment)
+            proof.response = (w + (self.x * proof.challenge)) % self.pk.q
+
+            dec_factors.append(dec_factor)
+            proofs.append(proof)
+
+        return dec_factors, proofs
+
     def decrypt(self, ciphertext, dec_factor = None, decode_m=False):
         """
         Decrypt a ciphertext. Optional parameter decides whether to encode the message into the proper subgroup.
@@ -207,13 +259,13 @@ class SecretKey:
         and alpha^t = b * beta/m ^ c
         """
         
-        m = (Utils.inverse(pow(ciphertext.alpha, self.x, self.pk.p), self.pk.p) * ciphertext.beta) % self.pk.p
+        m = (Utils.inverse(powmod(ciphertext.alpha, self.x, self.pk.p), self.pk.p) * ciphertext.beta) % self.pk.p
         beta_over_m = (ciphertext.beta * Utils.inverse(m, self.pk.p)) % self.pk.p
 
         # pick a random w
         w = Utils.random_mpz_lt(self.pk.q)
-        a = pow(self.pk.g, w, self.pk.p)
-        b = pow(ciphertext.alpha, w, self.pk.p)
+        a = powmod(self.pk.g, w, self.pk.p)
+        b = powmod(ciphertext.alpha, w, self.pk.p)
 
         c = int(hashlib.sha1(str(a) + "," + str(b)).hexdigest(),16)
 
@@ -233,7 +285,7 @@ class SecretKey:
       Prover computes response = w + x*challenge mod q, where x is the secret key.
       """
       w = Utils.random_mpz_lt(self.pk.q)
-      commitment = pow(self.pk.g, w, self.pk.p)
+      commitment = powmod(self.pk.g, w, self.pk.p)
       challenge = challenge_generator(commitment) % self.pk.q
       response = (w + (self.x * challenge)) % self.pk.q
       
@@ -277,8 +329,8 @@ class Ciphertext:
         that's no good when we do plaintext encoding of 1.
         """
         new_c = Ciphertext()
-        new_c.alpha = (self.alpha * pow(self.pk.g, r, self.pk.p)) % self.pk.p
-        new_c.beta = (self.beta * pow(self.pk.y, r, self.pk.p)) % self.pk.p
+        new_c.alpha = (self.alpha * powmod(self.pk.g, r, self.pk.p)) % self.pk.p
+        new_c.beta = (self.beta * powmod(self.pk.y, r, self.pk.p)) % self.pk.p
         new_c.pk = self.pk
 
         return new_c
@@ -317,8 +369,8 @@ class Ciphertext:
       proof = ZKProof()
 
       # compute A=g^w, B=y^w
-      proof.commitment['A'] = pow(self.pk.g, w, self.pk.p)
-      proof.commitment['B'] = pow(self.pk.y, w, self.pk.p)
+      proof.commitment['A'] = powmod(self.pk.g, w, self.pk.p)
+      proof.commitment['B'] = powmod(self.pk.y, w, self.pk.p)
 
       # generate challenge
       proof.challenge = challenge_generator(proof.commitment);
@@ -343,8 +395,8 @@ class Ciphertext:
       proof.response = Utils.random_mpz_lt(self.pk.q);
 
       # now we compute A and B
-      proof.commitment['A'] = (Utils.inverse(pow(self.alpha, proof.challenge, self.pk.p), self.pk.p) * pow(self.pk.g, proof.response, self.pk.p)) % self.pk.p
-      proof.commitment['B'] = (Utils.inverse(pow(beta_over_plaintext, proof.challenge, self.pk.p), self.pk.p) * pow(self.pk.y, proof.response, self.pk.p)) % self.pk.p
+      proof.commitment['A'] = (Utils.inverse(powmod(self.alpha, proof.challenge, self.pk.p), self.pk.p) * powmod(self.pk.g, proof.response, self.pk.p)) % self.pk.p
+      proof.commitment['B'] = (Utils.inverse(powmod(beta_over_plaintext, proof.challenge, self.pk.p), self.pk.p) * powmod(self.pk.y, proof.response, self.pk.p)) % self.pk.p
 
       return proof
     
@@ -394,11 +446,11 @@ class Ciphertext:
       """
       
       # check that g^response = A * alpha^challenge
-      first_check = (pow(self.pk.g, proof.response, self.pk.p) == ((pow(self.alpha, proof.challenge, self.pk.p) * proof.commitment['A']) % self.pk.p))
+      first_check = (powmod(self.pk.g, proof.response, self.pk.p) == ((powmod(self.alpha, proof.challenge, self.pk.p) * proof.commitment['A']) % self.pk.p))
       
       # check that y^response = B * (beta/m)^challenge
       beta_over_m = (self.beta * Utils.inverse(plaintext.m, self.pk.p)) % self.pk.p
-      second_check = (pow(self.pk.y, proof.response, self.pk.p) == ((pow(beta_over_m, proof.challenge, self.pk.p) * proof.commitment['B']) % self.pk.p))
+      second_check = (powmod(self.pk.y, proof.response, self.pk.p) == ((powmod(beta_over_m, proof.challenge, self.pk.p) * proof.commitment['B']) % self.pk.p))
       
       # print "1,2: %s %s " % (first_check, second_check)
       return (first_check and second_check)
@@ -424,18 +476,19 @@ class Ciphertext:
       # check the overall challenge
       return (challenge_generator([p.commitment for p in proof.proofs]) == (sum([p.challenge for p in proof.proofs]) % self.pk.q))
       
-    def verify_decryption_proof(self, plaintext, proof):
+    def verify_decryption_proof(self, plaintext, proof, challenge_generator=None):
       """
       Checks for the DDH tuple g, alpha, y, beta/plaintext
       (PoK of secret key x.)
       """
-      return False
+      beta_over_m = (self.beta * Utils.inverse(plaintext.m, self.pk.p)) % self.pk.p
+      return proof.verify(self.pk.g, self.alpha, self.pk.y, beta_over_m, self.pk.p, self.pk.q, challenge_generator)
       
     def verify_decryption_factor(self, dec_factor, dec_proof, public_key):
       """
       when a ciphertext is decrypted by a dec factor, the proof needs to be checked
       """
-      pass
+      return dec_proof.verify(public_key.g, self.alpha, public_key.y, dec_factor, public_key.p, public_key.q)
       
     def decrypt(self, decryption_factors, public_key):
       """
@@ -479,8 +532,8 @@ class ZKProof(object):
       proof = cls()
 
       # compute A = little_g^w, B=little_h^w
-      proof.commitment['A'] = pow(little_g, w, p)
-      proof.commitment['B'] = pow(little_h, w, p)
+      proof.commitment['A'] = powmod(little_g, w, p)
+      proof.commitment['B'] = powmod(little_h, w, p)
 
       # get challenge
       proof.challenge = challenge_generator(proof.commitment)
@@ -495,11 +548,15 @@ class ZKProof(object):
     """
     Verify a DH tuple proof
     """
-    # check that little_g^response = A * big_g^challenge
-    first_check = (pow(little_g, self.response, p) == ((pow(big_g, self.challenge, p) * self.commitment['A']) % p))
-    
-    # check that little_h^response = B * big_h^challenge
-    second_check = (pow(little_h, self.response, p) == ((pow(big_h, self.challenge, p) * self.commitment['B']) % p))
+    # check that little_g^response = A * big_g^challenge, and that
+    # little_h^response = B * big_h^challenge, each as a single simultaneous
+    # exponentiation: little_g^response * big_g^-challenge = A
+    try:
+      first_check = (multi_powmod([little_g, big_g], [self.response, -self.challenge], p) == self.commitment['A'] % p)
+      second_check = (multi_powmod([little_h, big_h], [self.response, -self.challenge], p) == self.commitment['B'] % p)
+    except ValueError:
+      # big_g or big_h is not invertible, so it is not a group element
+      return False
 
     # check the challenge?
     third_check = True
@@ -543,19 +600,16 @@ class TrusteeThresholdCommitment:
     self.public_coefficients = public_coefficients
     self.encrypted_partial_private_keys = encrypted_partial_private_keys
   
-  def to_plone(self, election):
-    from helios.models import Trustee
-    trustees = Trustee.get_by_election(election)
+  def to_plone(self, election, trustees=None):
+    if trustees is None:
+      from helios.models import Trustee
+      trustees = Trustee.get_by_election(election)
     
-    # The election public key may not be ready yet
-    from helios.views import ELGAMAL_PARAMS
-    import phoebus.mixnet.EGCryptoSystem
     import phoebus.mixnet.Ciphertext
     import phoebus.mixnet.threshold.ThresholdEncryptionCommitment
-    import math
     
-    nbits = ((int(math.log(ELGAMAL_PARAMS.p, 2)) - 1) & ~255) + 256
-    cryptosystem = phoebus.mixnet.EGCryptoSystem.EGCryptoSystem.load(nbits, ELGAMAL_PARAMS.p, ELGAMAL_PARAMS.g)
+    cryptosystem = election.get_threshold_cryptosystem()
+    nbits = cryptosystem.get_nbits()
     
     def to_ciphertext(idx):
       ciphertext = phoebus.mixnet.Ciphertext.Ciphertext(nbits, trustees[idx].public_key_hash)
@@ -15,21 +15,53 @@ from django.core.serializers.json import DjangoJSONEncoder
 
 from . import LDObject
 
+class LDObjectFieldDescriptor(object):
+    """
+    Stands in for SubfieldBase's descriptor: the JSON string loaded from the
+    DB is kept as is, and only converted by to_python() the first time the
+    attribute is read. Values that are never read are saved back verbatim.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+
+        value = obj.__dict__[self.field.name]
+        if isinstance(value, basestring):
+            value = self.field.to_python(value)
+            obj.__dict__[self.field.name] = value
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.field.name] = value
+
 class LDObjectField(models.TextField):
     """
     LDObject is a generic textfield that neatly serializes/unserializes
     JSON objects seamlessly.
     
     deserialization_params added on 2011-01-09 to provide additional hints at deserialization time
-    """
 
-    # Used so to_python() is called
-    __metaclass__ = models.SubfieldBase
+    values are deserialized lazily, see LDObjectFieldDescriptor
+    """
 
     def __init__(self, type_hint=None, **kwargs):
         self.type_hint = type_hint
         super(LDObjectField, self).__init__(**kwargs)
 
+    def contribute_to_class(self, cls, name):
+        super(LDObjectField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, LDObjectFieldDescriptor(self))
+
+    def pre_save(self, model_instance, add):
+        # don't deserialize a value only to serialize it again
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super(LDObjectField, self).pre_save(model_instance, add)
+
     def to_python(self, value):
         """Convert our string value to LDObject after we load it from the DB"""
 
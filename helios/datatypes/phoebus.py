@@ -42,7 +42,8 @@ class Trustee(LegacyObject):
     }
 
 class ElectionMixnet(LegacyObject):
-    FIELDS = ['name', 'mixnet_type', 'mix_order', 'email']
+    FIELDS = ['name', 'mixnet_type', 'mix_order', 'email', 'status',
+              'mix_rounds_done', 'mix_rounds_total']
 
 class ThresholdEncryptionCommitment(LegacyObject):
     WRAPPED_OBJ_CLASS = crypto_elgamal.TrusteeThresholdCommitment
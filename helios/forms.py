@@ -16,6 +16,9 @@ class ElectionForm(forms.Form):
   election_type = forms.ChoiceField(label="type", choices = Election.ELECTION_TYPES)
   workflow_type = forms.ChoiceField(label="workflow", 
           choices = Election.WORKFLOW_TYPES)
+  mix_proof_backend = forms.ChoiceField(label="mixnet proof", required=False,
+          choices = Election.MIX_PROOF_BACKENDS, initial='benaloh',
+          help_text='the proof of shuffle made by the Helios mixnets of a mixnet election')
   use_voter_aliases = forms.BooleanField(required=False, initial=False, help_text='If selected, voter identities will be replaced with aliases, e.g. "V12", in the ballot tracking center')
   #use_advanced_audit_features = forms.BooleanField(required=False, initial=True, help_text='disable this only if you want a simple election with reduced security but a simpler user interface')
   randomize_answer_order = forms.BooleanField(required=False, initial=False, help_text='enable this if you want the answers to questions to appear in random order for each voter')
@@ -31,6 +34,10 @@ class ElectionForm(forms.Form):
   voting_ends_at = SplitDateTimeField(help_text = 'UTC date and time when voting ends',
                                    widget=SplitSelectDateTimeWidget, required=False)
 
+  def clean_mix_proof_backend(self):
+    # elections created without choosing a proof use the default one
+    return self.cleaned_data['mix_proof_backend'] or 'benaloh'
+
 class ElectionTimeExtensionForm(forms.Form):
   voting_extended_until = SplitDateTimeField(help_text = 'UTC date and time voting extended to',
                                    widget=SplitSelectDateTimeWidget, required=False)
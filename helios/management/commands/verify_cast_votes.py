@@ -13,26 +13,20 @@ from helios import utils as helios_utils
 
 from helios.models import *
 
-def get_cast_vote_to_verify():
-    # fixme: add "select for update" functionality here
-    votes = CastVote.objects.filter(verified_at=None, invalidated_at=None).order_by('-cast_at')
-    if len(votes) > 0:
-        return votes[0]
-    else:
-        return None
+# number of cast votes claimed and verified at once
+BATCH_SIZE = 100
 
 class Command(BaseCommand):
-    args = ''
+    args = '[batch_size]'
     help = 'verify votes that were cast'
     
     def handle(self, *args, **options):
-        while True:
-            cast_vote = get_cast_vote_to_verify()
-            if not cast_vote:
-                break
+        batch_size = int(args[0]) if args else BATCH_SIZE
 
-            cast_vote.verify_and_store()
+        # several instances of this command can run at once, each claims
+        # its own batches of cast votes
+        while CastVote.verify_and_store_batch(batch_size):
+            pass
 
         # once broken out of the while loop, quit and wait for next invocation
         # this happens when there are no votes left to verify
-            
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0007_castvote_browser_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mixedanswers',
+            name='shuffling_proof_data',
+            field=models.BinaryField(null=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0008_mixedanswers_shuffling_proof_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixingCheckpoint',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('question', models.PositiveIntegerField(default=0)),
+                ('round', models.IntegerField(default=-1)),
+                ('original_hash', models.CharField(max_length=64, null=True)),
+                ('collection_data', models.BinaryField(null=True)),
+                ('mapping_data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mixnet', models.ForeignKey(related_name='checkpoints', to='helios.ElectionMixnet')),
+            ],
+            options={
+                'ordering': ['question', 'round'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mixingcheckpoint',
+            unique_together=set([('mixnet', 'question', 'round')]),
+        ),
+        migrations.AddField(
+            model_name='electionmixnet',
+            name='mix_rounds_done',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='electionmixnet',
+            name='mix_rounds_total',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+    ]
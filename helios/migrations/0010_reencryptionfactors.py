@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0009_mixing_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReencryptionFactors',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('election', models.ForeignKey(related_name='reencryption_factors', to='helios.Election')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0010_reencryptionfactors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='mix_proof_backend',
+            field=models.CharField(default=b'benaloh', max_length=50, choices=[(b'benaloh', b'Cut-and-choose shuffling proof'), (b'shuffle_argument', b'Linear-size shuffle argument (Terelius-Wikstrom)')]),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import helios_auth.jsonfield
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0011_election_mix_proof_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='threshold_public_key',
+            field=helios_auth.jsonfield.JSONField(null=True),
+            preserve_default=True,
+        ),
+    ]
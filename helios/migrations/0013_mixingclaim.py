@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helios', '0012_election_threshold_public_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixingClaim',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('question', models.PositiveIntegerField(default=0)),
+                ('token', models.CharField(max_length=100)),
+                ('renewed_at', models.DateTimeField()),
+                ('mixnet', models.ForeignKey(related_name='claims', to='helios.ElectionMixnet')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mixingclaim',
+            unique_together=set([('mixnet', 'question')]),
+        ),
+    ]
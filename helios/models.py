@@ -14,11 +14,12 @@ import random
 import StringIO
 import csv
 import copy
+import itertools
 import json as json_module
 
 import helios.views
 
-from django.db import models, transaction
+from django.db import models, transaction, IntegrityError
 import json
 from django.conf import settings
 from django.core.mail import send_mail
@@ -39,6 +40,10 @@ from helios_auth.jsonfield import JSONField
 import csv, copy
 import unicodecsv
 
+# PloneVote cryptosystems of threshold elections, by (p, g)
+# (see Election.get_threshold_cryptosystem)
+THRESHOLD_CRYPTOSYSTEMS = {}
+
 class HeliosModel(models.Model, datatypes.LDObjectContainer):
   class Meta:
     abstract = True
@@ -48,11 +53,127 @@ class MixedAnswers(HeliosModel):
   mixnet = models.ForeignKey('ElectionMixnet', related_name='mixed_answers')
   question = models.PositiveIntegerField(default=0)
   mixed_answers = LDObjectField(type_hint='phoebus/MixedAnswers', null=True)
+  # JSON proof, only used by mixes stored before shuffling_proof_data
   shuffling_proof = models.TextField(null=True)
+  # binary proof (see phoebus/mixnet/BinaryFormat.py)
+  shuffling_proof_data = models.BinaryField(null=True)
 
   class Meta:
       unique_together = (('mixnet', 'question'))
 
+  def set_shuffling_proof(self, proof):
+    data = io.BytesIO()
+    proof.to_stream(data)
+    self.shuffling_proof_data = data.getvalue()
+    self.shuffling_proof = None
+
+  def get_shuffling_proof(self):
+    """
+    the stored proof as a phoebus.mixnet.ShufflingProof, or the proof class
+    of the backend it was made with (see phoebus/mixnet/ProofBackends.py)
+    """
+    import phoebus.phoebus
+    from phoebus.mixnet.ProofBackends import proof_from_dict, proof_from_stream
+    pk, nbits = phoebus.phoebus.mixnet_pk(self.mixnet.election.public_key)
+
+    if self.shuffling_proof_data is not None:
+      return proof_from_stream(io.BytesIO(str(self.shuffling_proof_data)),
+                               pk, nbits)
+    return proof_from_dict(json_module.loads(self.shuffling_proof), pk, nbits)
+
+  def get_shuffling_proof_dict(self):
+    if self.shuffling_proof_data is None:
+      return json_module.loads(self.shuffling_proof)
+    return self.get_shuffling_proof().to_dict()
+
+  def get_shuffling_proof_data(self):
+    if self.shuffling_proof_data is not None:
+      return str(self.shuffling_proof_data)
+    data = io.BytesIO()
+    self.get_shuffling_proof().to_stream(data)
+    return data.getvalue()
+
+
+class MixingCheckpoint(models.Model):
+  """
+  Saved state of a question being mixed by a local mixnet, so that mixing
+  can resume after a crash (see helios.workflows.mixnet.MixCheckpoint).
+
+  The row of round -1 stores the secret shuffle mapping and the hash of the
+  collection it shuffles, the other rows store each completed round of the
+  shuffling proof. Checkpoints are deleted once the question is mixed, and
+  do not outlive settings.HELIOS_MIXNET_CHECKPOINT_TIMEOUT after a failed
+  mix (see delete_expired).
+  """
+  SHUFFLE_ROUND = -1
+
+  mixnet = models.ForeignKey('ElectionMixnet', related_name='checkpoints')
+  question = models.PositiveIntegerField(default=0)
+  round = models.IntegerField(default=SHUFFLE_ROUND)
+  # hash of the original collection (shuffle row only)
+  original_hash = models.CharField(max_length=64, null=True)
+  # binary collection and mapping (see phoebus/mixnet/BinaryFormat.py)
+  collection_data = models.BinaryField(null=True)
+  mapping_data = models.BinaryField()
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    unique_together = (('mixnet', 'question', 'round'))
+    ordering = ['question', 'round']
+
+  @classmethod
+  def delete_expired(cls):
+    """
+    delete the checkpoints older than settings.HELIOS_MIXNET_CHECKPOINT_TIMEOUT
+    of the mixnets that are not mixing, left behind by failed mixes that
+    were never resumed
+    """
+    expired = datetime.datetime.now() - \
+        datetime.timedelta(seconds=settings.HELIOS_MIXNET_CHECKPOINT_TIMEOUT)
+    cls.objects.filter(created_at__lt=expired).exclude(
+      mixnet__status='mixing').delete()
+
+
+class MixingClaim(models.Model):
+  """
+  Claim of a question of a local mixnet by the task mixing it, so that a
+  redelivered task does not mix the same question while the first one is
+  still running (see ElectionMixnet.claim_question).
+
+  The claim is renewed as the mix makes progress. A claim that has not been
+  renewed for settings.HELIOS_MIXNET_CLAIM_TIMEOUT seconds belongs to a lost
+  task, and another task may take the question over.
+  """
+  mixnet = models.ForeignKey('ElectionMixnet', related_name='claims')
+  question = models.PositiveIntegerField(default=0)
+  token = models.CharField(max_length=100)
+  renewed_at = models.DateTimeField()
+
+  class Meta:
+    unique_together = (('mixnet', 'question'))
+
+
+class MixingClaimLost(Exception):
+  """
+  raised when another task holds the claim of the question being mixed
+  """
+  pass
+
+
+class ReencryptionFactors(models.Model):
+  """
+  A chunk of re-encryption factors precomputed for the local mixnets of an
+  election while voting is open (see helios.workflows.mixnet.ElectionFactorPool).
+
+  Factors are secret and used only once: they are deleted as they are drawn,
+  and when mixing is over.
+  """
+  election = models.ForeignKey('Election', related_name='reencryption_factors')
+  count = models.PositiveIntegerField()
+  # binary factors (see phoebus/mixnet/ReencryptionFactorPool.py)
+  data = models.BinaryField()
+  created_at = models.DateTimeField(auto_now_add=True)
+
 
 class ElectionMixnet(HeliosModel):
 
@@ -81,6 +202,10 @@ class ElectionMixnet(HeliosModel):
   status = models.CharField(max_length=255, choices=MIXNET_STATUS_CHOICES, default='pending')
   mix_error = models.TextField(null=True, blank=True)
 
+  # progress of local mixing, in rounds of the shuffling proofs
+  mix_rounds_done = models.PositiveIntegerField(default=0)
+  mix_rounds_total = models.PositiveIntegerField(default=0)
+
   class Meta:
     ordering = ['-mix_order']
     unique_together = [('election', 'mix_order'), ('election', 'name')]
@@ -104,14 +229,81 @@ class ElectionMixnet(HeliosModel):
   def can_mix(self):
     return self.status in ['pending'] and not self.election.tallied
 
-  def reset_mixing(self):
+  def can_resume_mixing(self):
+    """
+    a local mixnet left in the mixing state was interrupted (eg. by a worker
+    crash) and resumes from its checkpoints
+    """
+    return self.status == 'mixing' and self.mixnet_type == 'local' \
+        and not self.election.tallied
+
+  def _claims_expired_before(self):
+    return datetime.datetime.now() - \
+        datetime.timedelta(seconds=settings.HELIOS_MIXNET_CLAIM_TIMEOUT)
+
+  def claim_question(self, q, token):
+    """
+    claim question q for the task identified by token, or renew its claim.
+    An expired claim of another task is taken over.
+
+    raises MixingClaimLost if another task holds a live claim on q
+    """
+    now = datetime.datetime.now()
+    try:
+      with transaction.atomic():
+        MixingClaim.objects.create(mixnet=self, question=q, token=token,
+                                   renewed_at=now)
+      return
+    except IntegrityError:
+      pass
+
+    # a single conditional update, so that only one task gets the claim
+    live = self.claims.filter(question=q).filter(
+      models.Q(token=token) | models.Q(renewed_at__lt=self._claims_expired_before()))
+    if not live.update(token=token, renewed_at=now):
+      raise MixingClaimLost("question %d of mixnet %s is being mixed by another task" % (q, self.name))
+
+  def claim_stalled_mixing(self):
+    """
+    claim a local mixnet left in the mixing state, to resume it. Returns
+    False while it is still being mixed, that is if its mixing started or
+    one of its questions made progress within the claim timeout (see
+    MixingClaim). Only one of concurrent callers gets True.
+    """
+    expired = self._claims_expired_before()
+    if self.claims.filter(renewed_at__gte=expired).exists():
+      return False
+    if self.mixing_started_at and self.mixing_started_at >= expired:
+      return False
+
+    now = datetime.datetime.now()
+    claimed = ElectionMixnet.objects.filter(
+      id=self.id, status='mixing',
+      mixing_started_at=self.mixing_started_at).update(mixing_started_at=now)
+    if claimed:
+      self.mixing_started_at = now
+    return bool(claimed)
+
+  def reset_mixing(self, keep_progress=False):
+    """
+    set the mixnet back to pending. With keep_progress, questions already
+    mixed and checkpoints are kept, and mixing again resumes from them.
+    """
     if self.status == 'finished':
       raise Exception("Cannot reset finished mixnet")
 
     # TODO: also reset mixnets with higher that current mix_order
 
     self.mixing_started_at = None
-    self.mixed_answers.filter().delete()
+    if not keep_progress:
+      self.mixed_answers.filter().delete()
+      self.checkpoints.filter().delete()
+      self.claims.filter().delete()
+      self.mix_rounds_done = 0
+    else:
+      # only the checkpoints of the shuffles to resume are kept
+      mixed = self.mixed_answers.values_list('question', flat=True)
+      self.checkpoints.filter(question__in=list(mixed)).delete()
     self.status = 'pending'
     self.mix_error = None
 
@@ -136,48 +328,127 @@ class ElectionMixnet(HeliosModel):
       votes = mixnet.mixed_answers.get(question=question).mixed_answers.answers
     return votes
 
-  @transaction.atomic
-  def _do_mix_one_question(self, mix_cls, q):
+  def _do_mix_one_question(self, mix_cls, q, token):
+    from helios.workflows.mixnet import MixCheckpoint
     mixnet = mix_cls(self.election)
     
     votes = self.get_original_answers(question=q)
-    # returns array of phoebus/MixedVote objects
-    new_votes, proof = mixnet.mix(self.election, votes, self.mix_order == 0, question_num=q)
-    self.mixed_answers.filter(question=q).delete()
-    mixed_votes = MixedAnswers(mixnet=self, question=q)
-    mixed_votes.mixed_answers = new_votes.ld_object
-    mixed_votes.shuffling_proof = json_module.dumps(proof.to_dict())
-    mixed_votes.save()
-
-  def _do_mix_votes(self, mix_cls):
-    for q in xrange(0, len(self.election.questions)):
+    # returns array of phoebus/MixedVote objects. Not in a transaction, so
+    # that checkpoints are committed as the mix progresses.
+    checkpoint = MixCheckpoint(self, q, token)
+    new_votes, proof = mixnet.mix(self.election, votes, self.mix_order == 0,
+                                  question_num=q,
+                                  checkpoint=checkpoint,
+                                  factor_pool=self.election.get_mix_factor_pool(),
+                                  proof_backend=self.election.mix_proof_backend)
+
+    with transaction.atomic():
+      # only the task holding the claim saves its mix
+      self.claim_question(q, token)
+      self.mixed_answers.filter(question=q).delete()
+      mixed_votes = MixedAnswers(mixnet=self, question=q)
+      mixed_votes.mixed_answers = new_votes.ld_object
+      mixed_votes.set_shuffling_proof(proof)
+      mixed_votes.save()
+      self.checkpoints.filter(question=q).delete()
+      self.claims.filter(question=q).delete()
+
+    # proofs without rounds count as a single round, done with the question
+    if not self.election.mix_proof_has_rounds():
+      checkpoint._add_rounds_done(1)
+
+  def start_mixing(self):
+    """
+    mark the mixnet as mixing (or resume an interrupted mix) and return the
+    questions left to mix, each of which can be mixed independently with
+    mix_question(...). Remote mixnets are not mixed here: returns None.
+    """
+    MixingCheckpoint.delete_expired()
+
+    if self.can_resume_mixing():
+      self.election.append_log("mixnet %s resumed mixing" % self.name)
+    elif not self.can_mix():
+      raise Exception("Cannot initialize mixing. Already mixed ???")
+    elif self.mixnet_type == "remote":
+      #raise Exception("Remote mixnets not implemented yet.")
+      return None
+    else:
+      # only one of concurrent deliveries of the tally task starts mixing
+      now = datetime.datetime.now()
+      if not ElectionMixnet.objects.filter(id=self.id, status='pending').update(
+          status='mixing', mixing_started_at=now):
+        raise Exception("Cannot initialize mixing. Already mixing ???")
+      self.mixing_started_at = now
+      self.status = 'mixing'
+
+    # questions completed before mixing was interrupted are not mixed again
+    rounds = self.election.mix_proof_rounds()
+    mixed = set(self.mixed_answers.values_list('question', flat=True))
+    self.mix_rounds_total = rounds * len(self.election.questions)
+    self.mix_rounds_done = rounds * len(mixed)
+    self.save()
+
+    return [q for q in xrange(0, len(self.election.questions))
+            if q not in mixed]
+
+  def mix_question(self, mix_cls, q):
+    """
+    mix question q, returns False if mixing failed (the mixnet is then in
+    the error state). Questions of the same mixnet may be mixed in parallel.
+
+    raises MixingClaimLost if another task is mixing q (see claim_question)
+    """
+    if self.mixed_answers.filter(question=q).exists():
+      return True
+
+    token = heliosutils.random_string(12)
+    self.claim_question(q, token)
+    try:
       self.election.append_log("mixnet %s started mixing question %d" % (self.name, q))
-      self._do_mix_one_question(mix_cls, q)
+      self._do_mix_one_question(mix_cls, q, token)
       self.election.append_log("mixnet %s finished mixing question %d" % (self.name, q))
+    except MixingClaimLost:
+      raise
+    except Exception, e:
+      self.claims.filter(question=q, token=token).delete()
+      self.status = 'error'
+      self.mix_error = traceback.format_exc()
+      # only these fields, as other questions update the progress meanwhile
+      self.save(update_fields=['status', 'mix_error'])
+      return False
+    return True
+
+  def finish_mixing(self):
+    """
+    mark the mixnet as finished once every question is mixed
+    """
+    mixnet = ElectionMixnet.objects.get(id=self.id)
+    mixed = mixnet.mixed_answers.count()
+    if mixnet.status != 'mixing' or mixed < len(self.election.questions):
+      return False
 
-    self.mixing_finished_at = datetime.datetime.now()
     self.status = 'finished'
+    self.mix_error = None
+    self.mixing_finished_at = datetime.datetime.now()
+    self.mix_rounds_done = self.mix_rounds_total = mixnet.mix_rounds_total
     self.save()
+    # any checkpoint left behind holds a secret mapping no longer needed
+    self.checkpoints.filter().delete()
+    self.claims.filter().delete()
+    return True
 
   def mix_votes(self, mix_cls):
-
-    if not self.can_mix():
-      raise Exception("Cannot initialize mixing. Already mixed ???")
-
-    if self.mixnet_type == "remote":
-      #raise Exception("Remote mixnets not implemented yet.")
+    """
+    mix all the questions, one after the other
+    """
+    questions = self.start_mixing()
+    if questions is None:
       return
 
-    self.mixing_started_at = datetime.datetime.now()
-    self.status = 'mixing'
-    self.save()
-
-    try:
-        self._do_mix_votes(mix_cls)
-    except Exception, e:
-        self.status = 'error'
-        self.mix_error = traceback.format_exc()
-        self.save()
+    for q in questions:
+      if not self.mix_question(mix_cls, q):
+        return
+    self.finish_mixing()
   
   @property
   def admin_url(self):
@@ -214,6 +485,16 @@ class Election(HeliosModel):
   election_type = models.CharField(max_length=250, null=False, default='election', choices = ELECTION_TYPES)
   workflow_type = models.CharField(max_length=250, null=False, default='homomorphic',
       choices = WORKFLOW_TYPES)
+
+  MIX_PROOF_BACKENDS = (
+    ('benaloh', 'Cut-and-choose shuffling proof'),
+    ('shuffle_argument', 'Linear-size shuffle argument (Terelius-Wikstrom)')
+  )
+
+  # proof of shuffle made by the local mixnets (see
+  # phoebus/mixnet/ProofBackends.py)
+  mix_proof_backend = models.CharField(max_length=50, null=False,
+      default='benaloh', choices = MIX_PROOF_BACKENDS)
   private_p = models.BooleanField(default=False, null=False)
 
   description = models.TextField()
@@ -299,6 +580,11 @@ class Election(HeliosModel):
   # no longer needed since it's all trustees
   result_proof = JSONField(null=True)
 
+  # threshold public key of k-of-n elections, stored when the election is
+  # frozen (see freeze)
+  threshold_public_key = JSONField(null=True)
+  _threshold_public_key = None
+
   # help email
   help_email = models.EmailField(null=True)
 
@@ -614,24 +900,39 @@ class Election(HeliosModel):
 
     self.result_released_at = datetime.datetime.utcnow()
   
-  def get_threshold_combinator(self, q_num, a_num):
+  def get_threshold_ciphertext(self, pk, q_num, a_num):
+    """
+    the encrypted tally of an answer, as a PloneVote ciphertext
+    """
     from phoebus.mixnet.Ciphertext import Ciphertext
-    from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import ThresholdDecryptionCombinator
-    
-    tesu = self.get_threshold_setup()
-    pk = tesu.generate_public_key()
     
     ciphertext = Ciphertext(pk.cryptosystem.get_nbits(), pk.get_fingerprint())
     for bit in self.encrypted_tally.tally[q_num][a_num]:
       ciphertext.append(bit.alpha, bit.beta)
     
-    trustees = Trustee.get_by_election(self)
+    return ciphertext
+  
+  def get_threshold_bulk_combinator(self, pk=None):
+    """
+    a combinator for the whole tally, with one ciphertext per answer
+    """
+    from phoebus.mixnet.threshold.ThresholdBulkDecryptionCombinator import ThresholdBulkDecryptionCombinator
+    
+    if pk is None:
+      pk = self.get_threshold_public_key()
     
-    return ThresholdDecryptionCombinator(pk, ciphertext, len(trustees), self.trustee_threshold)
+    tally = self.encrypted_tally.tally
+    ciphertexts = [self.get_threshold_ciphertext(pk, q_num, a_num) for q_num in xrange(0, len(tally)) for a_num in xrange(0, len(tally[q_num]))]
+    
+    return ThresholdBulkDecryptionCombinator(pk, ciphertexts, pk.num_trustees, self.trustee_threshold)
   
   def combine_decryptions(self):
     """
-    combine all of the decryption results
+    combine all of the decryption results, returns the trustees whose
+    partial decryptions were not used, being invalid or not needed
+
+    raises InsuficientPartialDecryptionsError, with the rejected trustees
+    in its unused_trustees attribute, if too few of them are valid
     """
     if not self.ready_for_decryption_combination():
         raise Exception("Not all trustees decryption factors ready")
@@ -643,33 +944,45 @@ class Election(HeliosModel):
       self.result = self.workflow.decrypt_tally(self, decryption_factors)
       self.append_log(ElectionLog.DECRYPTIONS_COMBINED)
       self.save()
+      return []
     else:
+      from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import InvalidPartialDecryptionError, InsuficientPartialDecryptionsError
+      
       trustees = Trustee.get_by_election(self)
       tally = self.encrypted_tally.tally
       
-      tesu = self.get_threshold_setup()
-      pk = tesu.generate_public_key()
+      pk = self.get_threshold_public_key()
+      
+      # combine the decryptions of all the answers at once, one ciphertext
+      # per answer with a block for each of its bits
+      answers = [(q_num, a_num) for q_num in xrange(0, len(tally)) for a_num in xrange(0, len(tally[q_num]))]
+      combinator = self.get_threshold_bulk_combinator(pk)
       
-      result = []
+      # only the first threshold valid partial decryptions are used, the
+      # others are not even verified here (see tasks.election_audit_decryptions)
+      unused_trustees = []
+      for trustee in xrange(0, len(trustees)):
+        if not combinator.needs_partial_decryptions():
+          unused_trustees.append(trustees[trustee])
+          continue
+        try:
+          combinator.add_partial_decryptions(trustee, [trustees[trustee].to_plone_partial_decryption(pk, q_num, a_num) for q_num, a_num in answers])
+        except (IndexError, InvalidPartialDecryptionError):
+          unused_trustees.append(trustees[trustee])
+      try:
+        values = combinator.decrypt_to_values(parallel=True)
+      except InsuficientPartialDecryptionsError, e:
+        e.unused_trustees = unused_trustees
+        raise
       
-      # combine the decryptions
-      for q_num in xrange(0, len(tally)):
-        result_q = []
-        for a_num in xrange(0, len(tally[q_num])):
-          result_a = []
-          for bit_num in xrange(0, len(tally[q_num][a_num])):
-            combinator = self.get_threshold_combinator(q_num, a_num)
-            for trustee in xrange(0, len(trustees)):
-              combinator.add_partial_decryption(trustee, trustees[trustee].to_plone_partial_decryptions(pk, q_num, a_num)[bit_num])
-            bitstream = combinator.decrypt_to_bitstream()
-            bitstream.seek(0)
-            result_a.append(bitstream.get_num(bitstream.get_length()))
-          result_q.append(result_a)
-        result.append(result_q)
+      result = [[] for q_num in xrange(0, len(tally))]
+      for (q_num, a_num), result_a in zip(answers, values):
+        result[q_num].append(result_a)
       
       self.result = result
       self.append_log(ElectionLog.DECRYPTIONS_COMBINED)
       self.save()
+      return unused_trustees
 
   def generate_voters_hash(self):
     """
@@ -734,24 +1047,55 @@ class Election(HeliosModel):
     self.eligibility = [{'auth_system': auth_system} for auth_system in auth_systems]
     self.save()
 
-  def get_threshold_setup(self):
+  def get_threshold_cryptosystem(self):
+    """
+    the PloneVote cryptosystem of threshold elections, loaded (and verified)
+    once per process
+    """
     # The election public key may not be ready yet
     from helios.views import ELGAMAL_PARAMS
     
-    import phoebus.mixnet.EGCryptoSystem
-    import math
-    nbits = ((int(math.log(ELGAMAL_PARAMS.p, 2)) - 1) & ~255) + 256
-    cryptosystem = phoebus.mixnet.EGCryptoSystem.EGCryptoSystem.load(nbits, ELGAMAL_PARAMS.p, ELGAMAL_PARAMS.g)
+    params_key = (ELGAMAL_PARAMS.p, ELGAMAL_PARAMS.g)
+    if params_key not in THRESHOLD_CRYPTOSYSTEMS:
+      import phoebus.mixnet.EGCryptoSystem
+      import math
+      nbits = ((int(math.log(ELGAMAL_PARAMS.p, 2)) - 1) & ~255) + 256
+      THRESHOLD_CRYPTOSYSTEMS[params_key] = phoebus.mixnet.EGCryptoSystem.EGCryptoSystem.load(nbits, ELGAMAL_PARAMS.p, ELGAMAL_PARAMS.g)
+    
+    return THRESHOLD_CRYPTOSYSTEMS[params_key]
+
+  def get_threshold_setup(self):
+    cryptosystem = self.get_threshold_cryptosystem()
     
     trustees = Trustee.get_by_election(self)
     from phoebus.mixnet.threshold.ThresholdEncryptionSetUp import ThresholdEncryptionSetUp
     tesu = ThresholdEncryptionSetUp(cryptosystem, len(trustees), self.trustee_threshold)
     
     for idx in xrange(0, len(trustees)):
-      tesu.add_trustee_commitment(idx, trustees[idx].commitment.to_plone(self))
+      tesu.add_trustee_commitment(idx, trustees[idx].commitment.to_plone(self, trustees))
     
     return tesu
 
+  def get_threshold_public_key(self):
+    """
+    the threshold public key, kept on this instance.
+
+    It is loaded from threshold_public_key, stored when the election is
+    frozen (see freeze), or else built from the trustee commitments.
+    """
+    if self._threshold_public_key is not None:
+      return self._threshold_public_key
+    
+    from phoebus.mixnet.threshold.ThresholdPublicKey import ThresholdPublicKey
+    
+    if self.threshold_public_key:
+      pk = ThresholdPublicKey.from_dict(self.threshold_public_key, self.get_threshold_cryptosystem())
+    else:
+      pk = self.get_threshold_setup().generate_public_key()
+    
+    self._threshold_public_key = pk
+    return pk
+
   def freeze(self):
     """
     election is frozen when the voter registration, questions, and trustees are finalized
@@ -777,10 +1121,11 @@ class Election(HeliosModel):
       
       self.public_key = combined_pk
     else:
-      # k-of-n threshold encryption
-      tesu = self.get_threshold_setup()
-      
-      phoebus_pk = tesu.generate_public_key()
+      # k-of-n threshold encryption. Commitments can no longer be uploaded,
+      # so the key is stored once and for all.
+      phoebus_pk = self.get_threshold_setup().generate_public_key()
+      self.threshold_public_key = phoebus_pk.to_dict()
+      self._threshold_public_key = phoebus_pk
       import helios.crypto.elgamal
       helios_pk = helios.crypto.elgamal.PublicKey()
       helios_pk.y = phoebus_pk._key
@@ -831,6 +1176,9 @@ class Election(HeliosModel):
     except IndexError:
       mixnet = self.mixnets.filter()[0]
 
+    if mixnet.status == "mixing" and mixnet.can_resume_mixing():
+      return mixnet
+
     if not mixnet.status == "pending":
       try:
         return self.mixnets.get(mix_order=mixnet.mix_order+1)
@@ -839,6 +1187,43 @@ class Election(HeliosModel):
 
     return mixnet
 
+  def get_mix_factor_pool(self):
+    """
+    the pool of re-encryption factors precomputed for the local mixnets
+    """
+    from helios.workflows.mixnet import ElectionFactorPool
+    return ElectionFactorPool(self)
+
+  def mix_proof_has_rounds(self):
+    """
+    whether the proofs of shuffle of the local mixnets are made of rounds
+    (each shuffling the votes again)
+    """
+    return self.mix_proof_backend == 'benaloh'
+
+  def mix_proof_rounds(self):
+    """
+    number of rounds of each proof of shuffle, used to report the progress
+    of mixing. A proof without rounds counts as one.
+    """
+    from phoebus.mixnet import params as mixnet_params
+    if self.mix_proof_has_rounds():
+      return mixnet_params.SHUFFLING_PROOF_SECURITY_PARAMETER
+    return 1
+
+  def mix_factors_needed(self):
+    """
+    number of re-encryption factors used by the local mixnets to mix the
+    votes of every voter: one per ballot (of a single block) and question,
+    for the shuffle and each round of its proof
+    """
+    shuffles = 1
+    if self.mix_proof_has_rounds():
+      shuffles += self.mix_proof_rounds()
+    local_mixnets = self.mixnets.filter(mixnet_type='local').count()
+    return self.voter_set.count() * len(self.questions) * shuffles * \
+        local_mixnets
+
   def get_mixnet(self):
     """
     Retrieve next mixnet
@@ -1330,6 +1715,35 @@ class Voter(HeliosModel):
     return CastVote(vote = self.vote, vote_hash = self.vote_hash, cast_at = self.cast_at, voter=self)
 
 
+class VoteVerificationElection(object):
+  """
+  the parts of an election needed to verify its votes, with the election
+  hash computed once, so that worker processes need neither the DB nor
+  to serialize the election for every vote
+  """
+  def __init__(self, election):
+    self.uuid = election.uuid
+    self.hash = election.hash
+    self.public_key = election.public_key
+    self.questions = election.questions
+
+# number of votes of the same election verified together, with their proofs
+# checked in a single batch, by each task of CastVote.verify_and_store_batch
+VOTE_VERIFICATION_CHUNK_SIZE = 25
+
+def _verify_cast_votes(shared, index):
+  """
+  verify the index-th chunk of votes of a batch, all for the same election,
+  to be used with WorkerPool
+  """
+  elections, chunks = shared
+  election_id, votes = chunks[index]
+
+  # the votes may still be the JSON strings loaded from the DB
+  field = CastVote._meta.get_field('vote')
+  votes = [field.to_python(vote) for vote in votes]
+  return type(votes[0]).verify_all(votes, elections[election_id])
+
 class CastVote(HeliosModel):
   # the reference to the voter provides the voter_uuid
   voter = models.ForeignKey(Voter)
@@ -1424,6 +1838,59 @@ class CastVote(HeliosModel):
 
     return result
 
+  @classmethod
+  def verify_and_store_batch(cls, limit):
+    """
+    claim up to limit cast votes that are waiting for verification, skipping
+    those claimed by other verifiers, verify them in the mixnet worker
+    processes and store the results with bulk updates.
+    Returns the number of cast votes processed.
+    """
+    from phoebus.mixnet.WorkerPool import WorkerPool
+
+    # the rows stay locked until the results are stored
+    with transaction.atomic():
+      waiting = cls.objects.filter(verified_at=None, invalidated_at=None).exclude(quarantined_p=True, released_from_quarantine_at=None).order_by('-cast_at')
+      ids = heliosutils.lock_ids_skip_locked(waiting, limit)
+      cast_votes = list(cls.objects.filter(id__in=ids).select_related('voter__election'))
+      if not cast_votes:
+        return 0
+
+      elections = {}
+      by_election = {}
+      for cast_vote in cast_votes:
+        election = cast_vote.voter.election
+        if election.id not in elections:
+          elections[election.id] = VoteVerificationElection(election)
+        by_election.setdefault(election.id, []).append(cast_vote)
+
+      # cast_votes is reordered along the chunks, to match the results
+      cast_votes = []
+      chunks = []
+      for election_id, election_votes in by_election.iteritems():
+        for start in xrange(0, len(election_votes), VOTE_VERIFICATION_CHUNK_SIZE):
+          chunk = election_votes[start:start + VOTE_VERIFICATION_CHUNK_SIZE]
+          cast_votes.extend(chunk)
+          chunks.append((election_id, [cv.__dict__['vote'] for cv in chunk]))
+
+      results = WorkerPool.get().map(_verify_cast_votes, (elections, chunks), xrange(len(chunks)))
+      results = list(itertools.chain.from_iterable(results))
+
+      now = datetime.datetime.utcnow()
+      valid = [cast_vote for cast_vote, result in zip(cast_votes, results) if result]
+      cls.objects.filter(id__in=[cv.id for cv in valid]).update(verified_at=now)
+      cls.objects.filter(id__in=[cv.id for cv, result in zip(cast_votes, results) if not result]).update(invalidated_at=now)
+
+      # as in Voter.store_vote, each voter keeps its latest valid cast vote
+      latest = {}
+      for cast_vote in valid:
+        if cast_vote.voter_id not in latest or latest[cast_vote.voter_id].cast_at <= cast_vote.cast_at:
+          latest[cast_vote.voter_id] = cast_vote
+      for voter_id, cast_vote in latest.iteritems():
+        Voter.objects.filter(id=voter_id).filter(models.Q(cast_at=None) | models.Q(cast_at__lte=cast_vote.cast_at)).update(vote=cast_vote.__dict__['vote'], vote_hash=cast_vote.vote_hash, cast_at=cast_vote.cast_at)
+
+    return len(cast_votes)
+
   def issues(self, election):
     """
     Look for consistency problems
@@ -1533,23 +2000,19 @@ class Trustee(HeliosModel):
   def datatype(self):
     return self.election.datatype.replace('Election', 'Trustee')
 
-  def to_plone_partial_decryptions(self, pk, q_num, a_num):
+  def to_plone_partial_decryption(self, pk, q_num, a_num):
+    """
+    the partial decryption of an answer, with one block per bit
+    """
     from phoebus.mixnet.threshold.PartialDecryption import PartialDecryption, PartialDecryptionBlock, PartialDecryptionBlockProof
     
-    pds = []
+    pd = PartialDecryption(pk.cryptosystem.get_nbits())
     for bit in xrange(0, len(self.decryption_proofs[q_num][a_num])):
-      pd = PartialDecryption(pk.cryptosystem.get_nbits())
-      pdbp = PartialDecryptionBlockProof(
-        self.decryption_proofs[q_num][a_num][bit].challenge,
-        self.decryption_proofs[q_num][a_num][bit].commitment['A'],
-        self.decryption_proofs[q_num][a_num][bit].commitment['B'],
-        self.decryption_proofs[q_num][a_num][bit].response
-      )
-      pdb = PartialDecryptionBlock(self.decryption_factors[q_num][a_num][bit], pdbp)
-      pd.add_partial_decryption_block(pdb)
-      pds.append(pd)
+      proof = self.decryption_proofs[q_num][a_num][bit]
+      pdbp = PartialDecryptionBlockProof(proof.challenge, proof.commitment['A'], proof.commitment['B'], proof.response)
+      pd.add_partial_decryption_block(PartialDecryptionBlock(self.decryption_factors[q_num][a_num][bit], pdbp))
     
-    return pds
+    return pd
 
   def verify_decryption_proofs(self):
     """
@@ -1558,27 +2021,26 @@ class Trustee(HeliosModel):
     if self.election.trustee_threshold <= 0:
       return self.election.workflow.verify_encryption_proof(self.election, self)
     else:
-      # PloneVote uses a completely different proof
+      # PloneVote uses a completely different proof, which we check for all
+      # the answers at once
+      from phoebus.mixnet.threshold.PartialDecryptionBatchVerifier import PartialDecryptionBatchVerifier
+      from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import InvalidPartialDecryptionError
+      
       index = list(Trustee.get_by_election(self.election)).index(self)
       
-      tesu = self.election.get_threshold_setup()
-      pk = tesu.generate_public_key()
+      pk = self.election.get_threshold_public_key()
+      verifier = PartialDecryptionBatchVerifier(pk, index)
       
       tally = self.election.encrypted_tally.tally
-      for q_num in xrange(0, len(tally)):
-        for a_num in xrange(0, len(tally[q_num])):
-          pds = self.to_plone_partial_decryptions(pk, q_num, a_num)
-          for bit_num in xrange(0, len(pds)):
-            combinator = self.election.get_threshold_combinator(q_num, a_num)
-            
-            #try:
-            #  combinator.add_partial_decryption(index, self.to_plone_partial_decryption(pk, q_num, a_num)) # this verifies the decryption
-            #except Exception as e:
-            #  raise e
-            #  return False
-            combinator.add_partial_decryption(index, pds[bit_num]) # this verifies the decryption
+      try:
+        for q_num in xrange(0, len(tally)):
+          for a_num in xrange(0, len(tally[q_num])):
+            ciphertext = self.election.get_threshold_ciphertext(pk, q_num, a_num)
+            verifier.add_partial_decryption(ciphertext, self.to_plone_partial_decryption(pk, q_num, a_num))
+      except (IndexError, InvalidPartialDecryptionError):
+        return False
       
-      return True
+      return verifier.verify()
   
   
   @property
@@ -1,6 +1,8 @@
 # Phoebus elections tests
 
 import uuid
+import contextlib
+import datetime
 import tempfile
 import os
 import json
@@ -21,6 +23,17 @@ from helios.views import ELGAMAL_PARAMS
 from helios import utils, datatypes
 from phoebus import phoebus as ph
 
+def _remove_parent_shared_files(shared, index):
+    """
+    Removes the files shared with the mixnet worker processes by their
+    parent, to be used with WorkerPool.map.
+    """
+    prefix = 'mixnet-%d-' % os.getppid()
+    for name in os.listdir(tempfile.gettempdir()):
+        if name.startswith(prefix):
+            os.remove(os.path.join(tempfile.gettempdir(), name))
+    return index
+
 class WebTest(django_webtest.WebTest):
     """
     Helper TestCase class.
@@ -67,9 +80,10 @@ class PhoebusElectionTests(WebTest):
         self.admin = auth_models.User.objects.get(user_id="admin")
         super(PhoebusElectionTests, self).setUp()
 
-    def _create_election(self, candidates=CANDIDATES):
+    def _create_election(self, candidates=CANDIDATES,
+                         short_name='test-election'):
         election = models.Election()
-        election.short_name = 'test-election'
+        election.short_name = short_name
         election.name = 'Test election'
         election.description = 'Test election description'
         election.election_type = 'election'
@@ -463,3 +477,1165 @@ class PhoebusElectionTests(WebTest):
         newproof = ShufflingProof.from_dict(jsondata, mixpk, nbits)
         print newproof.verify(e.ballots_as_cipher_collection(),
                         emixed.ballots_as_cipher_collection())
+
+    def _threshold_election(self, invalid_trustees=()):
+        """
+        Creates a frozen 2 out of 3 threshold election with a tally of one
+        question and two answers, and the partial decryptions of its trustees.
+        Those of invalid_trustees are tampered with.
+
+        Returns the election, its trustees and the plaintexts of the tally.
+        """
+        from phoebus.mixnet.threshold.PartialDecryption import \
+            PartialDecryptionBlockProof
+        from helios.crypto import elgamal
+        from helios.workflows import mixnet
+
+        election = self._create_election(short_name=str(uuid.uuid1()))
+        cryptosystem, public_key, threshold_keys = self._threshold_setup(
+            election.get_threshold_cryptosystem())
+        election.trustee_threshold = 2
+        election.frozen_at = datetime.datetime.utcnow()
+        election.threshold_public_key = public_key.to_dict()
+
+        helios_pk = elgamal.PublicKey()
+        helios_pk.p = cryptosystem.get_prime()
+        helios_pk.g = cryptosystem.get_generator()
+        helios_pk.q = (helios_pk.p - 1) / 2
+        helios_pk.y = public_key._key
+        plaintexts = [[[3, 5], [7]]]
+        election.questions = [{'question': 'q', 'short_name': 'q',
+                               'answers': ['a', 'b'], 'min': 0, 'max': 1}]
+        election.encrypted_tally = mixnet.Tally(election=election)
+        election.encrypted_tally.tally = [[
+            [helios_pk.encrypt(elgamal.Plaintext(m, helios_pk)) for m in bits]
+            for bits in q] for q in plaintexts]
+        election.save()
+
+        trustees = []
+        for i, threshold_key in enumerate(threshold_keys):
+            factors, proofs = [[]], [[]]
+            for a_num in range(len(plaintexts[0])):
+                ciphertext = election.get_threshold_ciphertext(public_key, 0,
+                                                               a_num)
+                if i in invalid_trustees:
+                    partial_decryption = self._invalid_partial_decryption(
+                        threshold_key, ciphertext)
+                else:
+                    partial_decryption = \
+                        threshold_key.generate_partial_decryption(ciphertext)
+                factors[0].append([])
+                proofs[0].append([])
+                for b_num in range(partial_decryption.get_length()):
+                    block = partial_decryption[b_num]
+                    proof = elgamal.ZKProof()
+                    proof.challenge = block.proof.c
+                    proof.commitment = {'A': block.proof.a, 'B': block.proof.b}
+                    proof.response = block.proof.t
+                    factors[0][-1].append(block.value)
+                    proofs[0][-1].append(proof)
+            trustee = models.Trustee(uuid=str(uuid.uuid1()), election=election,
+                                     name="trustee %d" % i,
+                                     email="trustee%d@%s" % (i, election.uuid),
+                                     decryption_factors=factors,
+                                     decryption_proofs=proofs)
+            trustee.save()
+            trustees.append(trustee)
+        return election, trustees, plaintexts
+
+    def test_combine_threshold_decryptions(self):
+        election, trustees, plaintexts = self._threshold_election()
+        unused = election.combine_decryptions()
+        self.assertEqual(election.result, plaintexts)
+        # the third trustee was not needed
+        self.assertEqual([t.id for t in unused], [trustees[2].id])
+
+        # an invalid share is skipped, and the next trustee is used instead
+        election, trustees, plaintexts = self._threshold_election([1])
+        unused = election.combine_decryptions()
+        self.assertEqual(election.result, plaintexts)
+        self.assertEqual([t.id for t in unused], [trustees[1].id])
+
+    def test_combine_threshold_decryptions_insufficient(self):
+        from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import \
+            InsuficientPartialDecryptionsError
+
+        election, trustees, plaintexts = self._threshold_election([0, 2])
+        try:
+            election.combine_decryptions()
+        except InsuficientPartialDecryptionsError, e:
+            self.assertEqual([t.id for t in e.unused_trustees],
+                             [trustees[0].id, trustees[2].id])
+        else:
+            self.fail("too few valid partial decryptions were combined")
+        self.assertEqual(election.result, None)
+
+    def test_combine_decryptions_view_insufficient(self):
+        from django.core import mail
+
+        election, trustees, plaintexts = self._threshold_election([0, 2])
+        self._setup_login(self.admin)
+        response = self.client.post(
+            "/helios/elections/%s/combine_decryptions" % election.uuid,
+            {"csrf_token": self.client.session['csrf_token']})
+        self._clear_login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Not enough valid partial decryptions")
+        for trustee in (trustees[0], trustees[2]):
+            self.assertContains(response, trustee.email)
+        self.assertNotContains(response, trustees[1].email)
+        self.assertEqual(models.Election.objects.get(id=election.id).result,
+                         None)
+
+        # the rejected trustees are still audited
+        self.assertEqual(len(mail.outbox), 1)
+        for trustee in (trustees[0], trustees[2]):
+            self.assertTrue(trustee.email in mail.outbox[0].body)
+
+    def test_election_audit_decryptions(self):
+        from django.core import mail
+        from helios import tasks
+
+        election, trustees, plaintexts = self._threshold_election([1])
+        self.assertEqual([t.verify_decryption_proofs() for t in trustees],
+                         [True, False, True])
+
+        tasks.election_audit_decryptions(election_id=election.id,
+                                         trustee_ids=[trustees[2].id])
+        self.assertEqual(len(mail.outbox), 0)
+
+        tasks.election_audit_decryptions(
+            election_id=election.id,
+            trustee_ids=[trustees[1].id, trustees[2].id])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(trustees[1].email in mail.outbox[0].body)
+        self.assertFalse(trustees[2].email in mail.outbox[0].body)
+
+    def test_freeze_stores_threshold_public_key(self):
+        from phoebus.mixnet.threshold.ThresholdEncryptionSetUp import \
+            ThresholdEncryptionSetUp
+        from helios.crypto import elgamal
+
+        election = self._create_election(short_name=str(uuid.uuid1()))
+        election.trustee_threshold = 2
+        election.openreg = True
+        election.questions = [{'question': 'q', 'short_name': 'q',
+                               'answers': ['a', 'b'], 'min': 0, 'max': 1}]
+        election.save()
+        models.ElectionMixnet(election=election, name='local').save()
+
+        cryptosystem = election.get_threshold_cryptosystem()
+        key_pairs = [cryptosystem.new_key_pair() for i in range(3)]
+        setup = ThresholdEncryptionSetUp(cryptosystem, 3, 2)
+        for i, key_pair in enumerate(key_pairs):
+            setup.add_trustee_public_key(i, key_pair.public_key)
+        for i, key_pair in enumerate(key_pairs):
+            commitment = setup.generate_commitment()
+            public_key = elgamal.PublicKey()
+            public_key.p = cryptosystem.get_prime()
+            public_key.g = cryptosystem.get_generator()
+            public_key.q = (public_key.p - 1) / 2
+            public_key.y = key_pair.public_key._key
+            models.Trustee(
+                uuid=str(uuid.uuid1()), election=election,
+                name="trustee %d" % i,
+                email="trustee%d@%s" % (i, election.uuid),
+                public_key=public_key,
+                public_key_hash=key_pair.public_key.get_fingerprint(),
+                commitment=elgamal.TrusteeThresholdCommitment(
+                    commitment.public_coefficients,
+                    [[elgamal.Ciphertext(alpha, beta) for alpha, beta in c]
+                     for c in commitment.encrypted_partial_private_keys])
+            ).save()
+
+        election.freeze()
+        election.save()
+        public_key = election.get_threshold_public_key()
+        self.assertEqual(election.public_key.y, public_key._key)
+
+        stored = models.Election.objects.get(id=election.id)
+        self.assertEqual(stored.threshold_public_key, public_key.to_dict())
+        # the key no longer depends on the commitments
+        models.Trustee.objects.filter(election=election).update(commitment=None)
+        self.assertEqual(stored.get_threshold_public_key().get_fingerprint(),
+                         public_key.get_fingerprint())
+
+    def test_mixnets_proof_view(self):
+        import io
+        from helios.crypto import elgamal
+        from helios.workflows import mixnet
+
+        cryptosystem = elgamal.Cryptosystem()
+        pk = ph._default_public_key
+        cryptosystem.p, cryptosystem.q, cryptosystem.g = pk.p, pk.q, pk.g
+        keypair = cryptosystem.generate_keypair()
+        election = self._create_election(short_name=str(uuid.uuid1()))
+        election.private_p = False
+        election.public_key = keypair.pk
+        election.save()
+        election_mixnet = models.ElectionMixnet(election=election,
+                                                name='local')
+        election_mixnet.save()
+
+        # question 0 is stored in binary, question 1 as legacy JSON
+        proofs = []
+        for q in range(2):
+            answers = [mixnet.MixedAnswer(index=index, choices=[
+                           keypair.pk.encrypt(elgamal.Plaintext(m, keypair.pk))])
+                       for index, m in enumerate([2, 3, 5])]
+            mixed, proof = mixnet.Mixnet(election).mix(election, answers,
+                                                       question_num=q)
+            mixed_answers = models.MixedAnswers(mixnet=election_mixnet,
+                                                question=q)
+            mixed_answers.mixed_answers = mixed.ld_object
+            if q == 0:
+                mixed_answers.set_shuffling_proof(proof)
+            else:
+                mixed_answers.shuffling_proof = json.dumps(proof.to_dict())
+            mixed_answers.save()
+            proofs.append(proof)
+
+        url = "/helios/elections/%s/mixnets/%%s/proof" % election.uuid
+        response = self.client.get(url % 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content),
+                         [json.loads(json.dumps(proof.to_dict()))
+                          for proof in proofs])
+
+        for q, proof in enumerate(proofs):
+            response = self.client.get(url % 0, {'format': 'binary',
+                                                 'question': q})
+            self.assertEqual(response.status_code, 200)
+            data = io.BytesIO()
+            proof.to_stream(data)
+            self.assertEqual(response.content, data.getvalue())
+
+        response = self.client.get(url % 0, {'format': 'binary',
+                                             'question': 'x'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url % 0, {'format': 'binary',
+                                             'question': 2})
+        self.assertEqual(response.status_code, 404)
+        for index in ('x', '-1', '1'):
+            self.assertEqual(self.client.get(url % index).status_code, 404)
+
+    def test_mixing_claims(self):
+        from helios import tasks
+
+        election = self._create_election(short_name=str(uuid.uuid1()))
+        election.questions = [{'question': 'q', 'short_name': 'q',
+                               'answers': ['a', 'b'], 'min': 0, 'max': 1}]
+        election.save()
+        mixnet = models.ElectionMixnet(election=election, name='local')
+        mixnet.save()
+
+        mixnet.claim_question(0, 'first')
+        mixnet.claim_question(0, 'first')
+        mixnet.claim_question(1, 'second')
+        self.assertRaises(models.MixingClaimLost, mixnet.claim_question, 0,
+                          'second')
+        # a redelivered task neither mixes nor fails a claimed question
+        self.assertRaises(models.MixingClaimLost, mixnet.mix_question,
+                          election.workflow.Mixnet, 0)
+        self.assertEqual(models.ElectionMixnet.objects.get(id=mixnet.id).status,
+                         'pending')
+
+        # an expired claim is taken over, and its first task loses it
+        expired = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.HELIOS_MIXNET_CLAIM_TIMEOUT + 1)
+        mixnet.claims.filter(question=0).update(renewed_at=expired)
+        mixnet.claim_question(0, 'second')
+        self.assertRaises(models.MixingClaimLost, mixnet.claim_question, 0,
+                          'first')
+
+        # only one of concurrent deliveries of the tally task starts mixing
+        pending = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertEqual(mixnet.start_mixing(), [0])
+        self.assertRaises(Exception, pending.start_mixing)
+        mixnet = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertFalse(mixnet.claim_stalled_mixing())
+        mixnet.mix_rounds_total = 0
+        mixnet.save()
+        tasks.election_compute_tally(election_id=election.id)
+        self.assertEqual(
+            models.ElectionMixnet.objects.get(id=mixnet.id).mix_rounds_total, 0)
+
+        # once mixing made no progress for a while, a single task resumes it
+        mixnet.claims.filter().update(renewed_at=expired)
+        self.assertFalse(mixnet.claim_stalled_mixing())
+        models.ElectionMixnet.objects.filter(id=mixnet.id).update(
+            mixing_started_at=expired)
+        stalled = [models.ElectionMixnet.objects.get(id=mixnet.id)
+                   for i in range(2)]
+        self.assertTrue(stalled[0].claim_stalled_mixing())
+        self.assertFalse(stalled[1].claim_stalled_mixing())
+
+    def _create_mixing_election(self, voters=3):
+        """
+        A frozen election with two questions, a local mixnet, a helios
+        trustee and one encrypted vote per voter, ready to be mixed.
+        """
+        from helios.crypto import elgamal
+        from helios.workflows import mixnet
+
+        cryptosystem = elgamal.Cryptosystem()
+        pk = ph._default_public_key
+        cryptosystem.p, cryptosystem.q, cryptosystem.g = pk.p, pk.q, pk.g
+        keypair = cryptosystem.generate_keypair()
+
+        election = self._create_election(short_name=str(uuid.uuid1()))
+        election.questions = [{'question': 'q%d' % q, 'short_name': 'q%d' % q,
+                               'answers': ['a', 'b'], 'min': 0, 'max': 1}
+                              for q in range(2)]
+        election.public_key = keypair.pk
+        election.frozen_at = datetime.datetime.now()
+        election.tallying_started_at = datetime.datetime.now()
+        election.save()
+        election.generate_trustee(cryptosystem)
+        election.generate_helios_mixnet({'name': 'local'})
+
+        for v in range(voters):
+            vote = mixnet.EncryptedVote()
+            vote.encrypted_answers = [mixnet.EncryptedAnswer(choices=[
+                keypair.pk.encrypt(elgamal.Plaintext(2 + v + q, keypair.pk))])
+                for q in range(2)]
+            vote.election_hash = election.hash
+            vote.election_uuid = election.uuid
+            models.Voter(election=election, uuid=str(uuid.uuid1()),
+                         voter_login_id='voter%d' % v,
+                         voter_email='voter%d@example.com' % v,
+                         voter_name='Voter %d' % v, vote=vote).save()
+        return election, election.mixnets.get()
+
+    @contextlib.contextmanager
+    def _failing_question(self, failing):
+        """
+        Makes the election mixnets fail to mix the given question within
+        the block.
+        """
+        from helios.workflows import mixnet
+
+        mix = mixnet.Mixnet.__dict__['mix']
+        def failing_mix(self, election, votes, *args, **kwargs):
+            if kwargs.get('question_num') == failing:
+                raise ValueError("question %d cannot be mixed" % failing)
+            return mix(self, election, votes, *args, **kwargs)
+
+        mixnet.Mixnet.mix = failing_mix
+        try:
+            yield
+        finally:
+            mixnet.Mixnet.mix = mix
+
+    def test_mix_questions_tasks(self):
+        from django.core import mail
+        from helios import tasks
+
+        # tasks run eagerly (CELERY_ALWAYS_EAGER) under the test runner, the
+        # chord included, so each call below runs the whole tally chain
+        election, mixnet = self._create_mixing_election()
+
+        # a failing question does not stop its sibling, but the mixnet is
+        # not finished and goes back to pending, keeping the mixed question
+        outbox = len(mail.outbox)
+        with self._failing_question(1):
+            tasks.election_compute_tally.delay(election_id=election.id)
+        mixnet = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertEqual(mixnet.status, 'pending')
+        self.assertFalse(mixnet.finish_mixing())
+        self.assertEqual(
+            list(mixnet.mixed_answers.values_list('question', flat=True)), [0])
+        self.assertEqual(mixnet.claims.count(), 0)
+        self.assertEqual(mail.outbox[outbox].subject,
+                         "encrypted tally failed to compute")
+        election = self._get_election(election)
+        self.assertEqual(election.tallying_started_at, None)
+        self.assertEqual(election.encrypted_tally, None)
+
+        # mixing again only mixes the failed question, then tallies
+        mixed = mixnet.mixed_answers.get(question=0).id
+        tasks.election_compute_tally.delay(election_id=election.id)
+        mixnet = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertEqual(mixnet.status, 'finished')
+        self.assertEqual(mixnet.mix_rounds_done, mixnet.mix_rounds_total)
+        self.assertEqual(mixnet.mixed_answers.get(question=0).id, mixed)
+        self.assertEqual(mixnet.mixed_answers.count(), 2)
+        election = self._get_election(election)
+        self.assertTrue(election.mixing_finished)
+        self.assertEqual(len(election.encrypted_tally.tally), 2)
+        self.assertEqual([len(answers) for answers in
+                          election.encrypted_tally.tally], [3, 3])
+        self.assertNotEqual(election.get_helios_trustee().decryption_factors,
+                            None)
+
+    def test_mix_questions_tasks_redelivery(self):
+        from celery.exceptions import Retry
+        from helios import tasks
+
+        election, mixnet = self._create_mixing_election()
+
+        # a redelivered tally task leaves a mixnet being mixed to its chord
+        mixnet.start_mixing()
+        tasks.election_compute_tally.delay(election_id=election.id)
+        mixnet = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertEqual(mixnet.status, 'mixing')
+        self.assertEqual(mixnet.mixed_answers.count(), 0)
+
+        # a redelivered question task retries while the question is claimed,
+        # and mixes it once the claim has expired
+        mixnet.claim_question(0, 'other')
+        retries = []
+        def retry(exc=None, countdown=None):
+            retries.append((exc, countdown))
+            return Retry(exc=exc, when=countdown)
+        tasks.mixnet_mix_question.retry = retry
+        try:
+            self.assertRaises(Retry, tasks.mixnet_mix_question.apply,
+                              args=(mixnet.id, 0))
+        finally:
+            del tasks.mixnet_mix_question.retry
+        self.assertEqual(len(retries), 1)
+        self.assertTrue(isinstance(retries[0][0], models.MixingClaimLost))
+        self.assertEqual(retries[0][1], tasks.MIX_CLAIM_RETRY_DELAY)
+        self.assertEqual(mixnet.mixed_answers.count(), 0)
+
+        expired = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.HELIOS_MIXNET_CLAIM_TIMEOUT + 1)
+        mixnet.claims.filter(question=0).update(renewed_at=expired)
+        self.assertTrue(
+            tasks.mixnet_mix_question.apply(args=(mixnet.id, 0)).get())
+        self.assertTrue(
+            tasks.mixnet_mix_question.apply(args=(mixnet.id, 1)).get())
+
+        # every question was mixed, but the chord callback was lost: once
+        # mixing stalled, the tally task has no question left to mix and
+        # finishes the mixnet
+        models.ElectionMixnet.objects.filter(id=mixnet.id).update(
+            mixing_started_at=expired)
+        mixed = sorted(mixnet.mixed_answers.values_list('id', flat=True))
+        self.assertEqual(models.ElectionMixnet.objects.get(
+            id=mixnet.id).start_mixing(), [])
+        models.ElectionMixnet.objects.filter(id=mixnet.id).update(
+            mixing_started_at=expired)
+        tasks.election_compute_tally.delay(election_id=election.id)
+        mixnet = models.ElectionMixnet.objects.get(id=mixnet.id)
+        self.assertEqual(mixnet.status, 'finished')
+        self.assertEqual(
+            sorted(mixnet.mixed_answers.values_list('id', flat=True)), mixed)
+        self.assertEqual(len(self._get_election(election).encrypted_tally.tally),
+                         2)
+
+    def test_mixing_checkpoints_retention(self):
+        election, mixnet = self._create_mixing_election()
+
+        def checkpoint(q):
+            models.MixingCheckpoint.objects.create(
+                mixnet=mixnet, question=q, original_hash='hash',
+                mapping_data='secret mapping')
+        def checkpointed():
+            return list(mixnet.checkpoints.values_list('question', flat=True))
+
+        # a failed mix keeps the checkpoints of the questions left to mix
+        checkpoint(0)
+        checkpoint(1)
+        models.MixedAnswers(mixnet=mixnet, question=0).save()
+        mixnet.status = 'error'
+        mixnet.save()
+        mixnet.reset_mixing(keep_progress=True)
+        self.assertEqual(checkpointed(), [1])
+
+        # until they expire, unless the mixnet is mixing
+        expired = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.HELIOS_MIXNET_CHECKPOINT_TIMEOUT + 1)
+        mixnet.checkpoints.update(created_at=expired)
+        models.ElectionMixnet.objects.filter(id=mixnet.id).update(
+            status='mixing')
+        models.MixingCheckpoint.delete_expired()
+        self.assertEqual(checkpointed(), [1])
+        models.ElectionMixnet.objects.filter(id=mixnet.id).update(
+            status='pending')
+        self.assertEqual(mixnet.start_mixing(), [1])
+        self.assertEqual(checkpointed(), [])
+
+        # a finished mixnet keeps none
+        checkpoint(1)
+        models.MixedAnswers(mixnet=mixnet, question=1).save()
+        self.assertTrue(mixnet.finish_mixing())
+        self.assertEqual(checkpointed(), [])
+
+    def _random_cipher_collection(self, nr_ballots):
+        pk = ph._default_public_key
+        e = ph.Election(public_key=pk, candidates=self.CANDIDATES)
+        ballots = []
+        for i in range(nr_ballots):
+            eb = ph.Ballot.mk_random(e).encrypted_ballot
+            ballots.append(ph.Ballot(e, encrypted_ballot=[eb]))
+        e.cast_votes(ballots)
+        return e.ballots_as_cipher_collection()
+
+    @contextlib.contextmanager
+    def _worker_processes(self, count):
+        """
+        Runs the mixnet WorkerPool with count processes (0 to work in the
+        current process) within the block.
+        """
+        from phoebus.mixnet import params
+        from phoebus.mixnet.WorkerPool import WorkerPool
+
+        processes = params.MIXNET_WORKER_PROCESSES
+        params.MIXNET_WORKER_PROCESSES = count
+        WorkerPool.shutdown()
+        try:
+            yield WorkerPool.get()
+        finally:
+            params.MIXNET_WORKER_PROCESSES = processes
+            WorkerPool.shutdown()
+
+    def test_mapping_batch_verify(self):
+        from phoebus.mixnet.CiphertextCollectionMapping import \
+            CiphertextCollectionMapping
+
+        collection = self._random_cipher_collection(3)
+        mapping = CiphertextCollectionMapping.new(collection)
+        shuffled = mapping.apply(collection)
+        self.assertTrue(mapping.verify(collection, shuffled))
+        self.assertTrue(mapping.verify(collection, shuffled, batch=False))
+        self.assertEqual(mapping.locate_failure(collection, shuffled), None)
+
+        shuffled[mapping._reordering[1]].delta[0] += 1
+        self.assertFalse(mapping.verify(collection, shuffled))
+        self.assertFalse(mapping.verify(collection, shuffled, batch=False))
+        self.assertEqual(mapping.locate_failure(collection, shuffled), 1)
+
+        from phoebus.mixnet.PVCExceptions import \
+            IncompatibleCiphertextCollectionError
+        self.assertRaises(IncompatibleCiphertextCollectionError,
+                          mapping.locate_failure, collection,
+                          self._random_cipher_collection(2))
+
+    def test_mapping_verify_rejects_non_permutation(self):
+        from phoebus.mixnet.CiphertextCollectionMapping import \
+            CiphertextCollectionMapping
+
+        # two equal ciphertexts with equal re-encryptions have equal images
+        collection = self._random_cipher_collection(3)
+        collection._ciphertexts[1] = collection[0]
+        mapping = CiphertextCollectionMapping.new(collection)
+        mapping._reencryptions[1] = mapping._reencryptions[0]
+        shuffled = mapping.apply(collection)
+        self.assertTrue(mapping.verify(collection, shuffled))
+
+        # so both can be sent to the same index, leaving another unchecked
+        orphan = mapping._reordering[1]
+        mapping._reordering[1] = mapping._reordering[0]
+        shuffled[orphan].gamma[0] += 1
+        self.assertFalse(mapping.is_permutation())
+        self.assertFalse(mapping.verify(collection, shuffled))
+        self.assertFalse(mapping.verify(collection, shuffled, batch=False))
+
+    def test_shuffling_proof_verify(self):
+        collection = self._random_cipher_collection(3)
+        shuffled, proof = collection.shuffle_with_proof()
+
+        # in the worker processes, and in this process, where the
+        # (g^r, y^r) pairs computed from stored exponents stay cached
+        for processes in (1, 0):
+            with self._worker_processes(processes):
+                self.assertTrue(proof.verify(collection, shuffled))
+                self.assertFalse(proof.verify(shuffled, collection))
+
+        reencryption = proof._mappings[0]._reencryptions[1]
+        if reencryption.stores_exponents():
+            reencryption._exponents[0] += 1
+        else:
+            gr, yr = reencryption._blocks[0]
+            reencryption._blocks[0] = (gr, yr * 2)
+        for processes in (1, 0):
+            with self._worker_processes(processes):
+                self.assertFalse(proof.verify(collection, shuffled))
+
+        # a round whose mapping is not a permutation fails the proof
+        collection = self._random_cipher_collection(3)
+        shuffled, proof = collection.shuffle_with_proof()
+        reordering = proof._mappings[0]._reordering
+        reordering[1] = reordering[0]
+        for processes in (1, 0):
+            with self._worker_processes(processes):
+                self.assertFalse(proof.verify(collection, shuffled))
+
+    def test_worker_pool_sharing(self):
+        import os
+        import subprocess
+        import tempfile
+        from phoebus.mixnet import params
+        from phoebus.mixnet.PVCExceptions import SecretSharingError
+        from phoebus.mixnet.CiphertextCollectionMapping import \
+            CiphertextCollectionMapping
+
+        # files left by a killed process are removed by the next pool
+        child = subprocess.Popen(['true'])
+        child.wait()
+        fd, stale = tempfile.mkstemp(prefix='mixnet-%d-' % child.pid)
+        os.close(fd)
+        with self._worker_processes(1) as pool:
+            self.assertFalse(os.path.exists(stale))
+
+            # secret objects are never written to the shared file
+            def files():
+                return [name for name in os.listdir(tempfile.gettempdir())
+                        if name.startswith('mixnet-%d-' % os.getpid())]
+            before = files()
+            self.assertRaises(SecretSharingError, pool.map, len,
+                              [ph._default_secret_key], range(2))
+            self.assertEqual(files(), before)
+
+            # mappings of (g^r, y^r) pairs are rebased in the workers,
+            # without sharing them
+            collection = self._random_cipher_collection(3)
+            store_exponents = params.REENCRYPTION_STORE_EXPONENTS
+            params.REENCRYPTION_STORE_EXPONENTS = False
+            try:
+                mapping = CiphertextCollectionMapping.new(collection)
+                other = CiphertextCollectionMapping.new(collection)
+            finally:
+                params.REENCRYPTION_STORE_EXPONENTS = store_exponents
+            rebased = mapping.rebase(other)
+            self.assertTrue(rebased.verify(other.apply(collection),
+                                           mapping.apply(collection)))
+
+            # a shared file that vanishes fails the operation, instead of
+            # returning fewer results
+            self.assertRaises(IOError, pool.map, _remove_parent_shared_files,
+                              None, range(8))
+            results = pool.imap(_remove_parent_shared_files, None, range(8))
+            self.assertRaises(IOError, list, results)
+
+    def test_mixnet_mix(self):
+        from helios.crypto import elgamal
+        from helios.workflows import mixnet
+
+        cryptosystem = elgamal.Cryptosystem()
+        pk = ph._default_public_key
+        cryptosystem.p, cryptosystem.q, cryptosystem.g = pk.p, pk.q, pk.g
+        keypair = cryptosystem.generate_keypair()
+        election = models.Election(public_key=keypair.pk)
+
+        plaintexts = [(2, 3), (5, 7), (2, 3), (11, 13)]
+        answers = [mixnet.MixedAnswer(index=index, choices=[
+                       keypair.pk.encrypt(elgamal.Plaintext(m, keypair.pk))
+                       for m in choices])
+                   for index, choices in enumerate(plaintexts)]
+
+        mixed, proof = mixnet.Mixnet(election).mix(election, answers,
+                                                   question_num=1)
+        self.assertEqual(mixed.question_num, 1)
+        self.assertEqual([answer.index for answer in mixed.answers],
+                         range(len(answers)))
+        self.assertTrue(proof.verify(
+            mixnet.answers_to_collection(election.public_key, answers),
+            mixnet.answers_to_collection(election.public_key, mixed.answers)))
+
+        decrypted = [tuple(keypair.sk.decrypt(choice).m
+                           for choice in answer.choices)
+                     for answer in mixed.answers]
+        self.assertEqual(sorted(decrypted), sorted(plaintexts))
+
+    def test_tally_decrypt_from_factors(self):
+        from helios.crypto import elgamal
+        from helios.workflows import mixnet
+
+        cryptosystem = elgamal.Cryptosystem()
+        pk = ph._default_public_key
+        cryptosystem.p, cryptosystem.q, cryptosystem.g = pk.p, pk.q, pk.g
+        trustees = [cryptosystem.generate_keypair() for i in range(3)]
+        public_key = trustees[0].pk
+        for trustee in trustees[1:]:
+            public_key.y = (public_key.y * trustee.pk.y) % pk.p
+
+        # ballots of different lengths, in two questions
+        plaintexts = [[[2], [3, 5, 7], [11, 13]], [[17, 19, 23, 29]]]
+        tally = mixnet.Tally()
+        tally.tally = [[[public_key.encrypt(elgamal.Plaintext(m, public_key))
+                         for m in ballot] for ballot in q] for q in plaintexts]
+        factors = [[[[trustee.sk.decryption_factor(block) for block in ballot]
+                     for ballot in q] for q in tally.tally]
+                   for trustee in trustees]
+
+        def expected(q_num, a_num, b_num):
+            value = tally.tally[q_num][a_num][b_num].decrypt(
+                [df[q_num][a_num][b_num] for df in factors], public_key)
+            if value > pk.q:
+                value = -value % pk.p
+            return value
+
+        chunk_size = mixnet.DECRYPTION_CHUNK_SIZE
+        mixnet.DECRYPTION_CHUNK_SIZE = 3
+        try:
+            for processes in (1, 0):
+                with self._worker_processes(processes):
+                    result = tally.decrypt_from_factors(factors, public_key)
+                self.assertEqual(result, plaintexts)
+                self.assertEqual(result, [[[expected(q, a, b)
+                                            for b in range(len(ballot))]
+                                           for a, ballot in enumerate(qs)]
+                                          for q, qs in enumerate(plaintexts)])
+
+            factors[1][1][0][2] = 0
+            for processes in (1, 0):
+                with self._worker_processes(processes):
+                    self.assertRaises(ValueError, tally.decrypt_from_factors,
+                                      factors, public_key)
+        finally:
+            mixnet.DECRYPTION_CHUNK_SIZE = chunk_size
+
+    def test_decryption_factors_and_proofs(self):
+        from helios.crypto import elgamal
+
+        cryptosystem = elgamal.Cryptosystem()
+        pk = ph._default_public_key
+        cryptosystem.p, cryptosystem.q, cryptosystem.g = pk.p, pk.q, pk.g
+        keypair = cryptosystem.generate_keypair()
+        ciphertexts = [keypair.pk.encrypt(elgamal.Plaintext(m, keypair.pk))
+                       for m in (2, 3, 5, 7)]
+
+        # through the worker processes, which get no secret in the shared file
+        with self._worker_processes(1):
+            factors, proofs = \
+                keypair.sk.decryption_factors_and_proofs(ciphertexts)
+
+        for ciphertext, factor, proof in zip(ciphertexts, factors, proofs):
+            expected, expected_proof = \
+                keypair.sk.decryption_factor_and_proof(ciphertext)
+            self.assertEqual(factor, expected)
+            self.assertTrue(ciphertext.verify_decryption_factor(
+                factor, proof, keypair.pk))
+            self.assertTrue(ciphertext.verify_decryption_factor(
+                expected, expected_proof, keypair.pk))
+        self.assertEqual([c.decrypt([f], keypair.pk)
+                          for c, f in zip(ciphertexts, factors)], [2, 3, 5, 7])
+
+    def test_shuffle_with_proof_resume(self):
+        import io
+        from phoebus.mixnet.CiphertextCollection import CiphertextCollection
+        from phoebus.mixnet.CiphertextCollectionMapping import \
+            CiphertextCollectionMapping
+
+        collection = self._random_cipher_collection(3)
+        pk = collection.public_key
+        nbits = pk.cryptosystem.get_nbits()
+        saved = {'rounds': []}
+
+        class Interrupted(Exception):
+            pass
+
+        def save_shuffle(mapping):
+            data = io.BytesIO()
+            mapping.to_stream(data)
+            saved['mapping'] = data.getvalue()
+
+        def save_round(index, round_collection, round_mapping):
+            if index == 2:
+                raise Interrupted()
+            data = io.BytesIO()
+            round_collection.to_stream(data)
+            mapping_data = io.BytesIO()
+            round_mapping.to_stream(mapping_data)
+            saved['rounds'].append((data.getvalue(), mapping_data.getvalue()))
+
+        self.assertRaises(Interrupted, collection.shuffle_with_proof,
+                          on_shuffle=save_shuffle, on_round=save_round)
+        self.assertEqual(len(saved['rounds']), 2)
+
+        mapping = CiphertextCollectionMapping.from_stream(
+            io.BytesIO(saved['mapping']), pk, nbits)
+        rounds = [(CiphertextCollection.from_stream(io.BytesIO(c), pk, nbits),
+                   CiphertextCollectionMapping.from_stream(io.BytesIO(m), pk,
+                                                           nbits))
+                  for (c, m) in saved['rounds']]
+        shuffled, proof = collection.shuffle_with_proof(mapping, rounds)
+        self.assertEqual(shuffled, mapping.apply(collection))
+        self.assertEqual(proof._collections[:2], [c for (c, m) in rounds])
+        self.assertTrue(proof.verify(collection, shuffled))
+
+    def test_shuffle_with_factor_pool(self):
+        import io
+        from phoebus.mixnet.ReencryptionFactorPool import \
+            ReencryptionFactorPool
+        from phoebus.mixnet import params
+
+        collection = self._random_cipher_collection(3)
+        pool = ReencryptionFactorPool(collection.public_key)
+        pool.generate(3 * (params.SHUFFLING_PROOF_SECURITY_PARAMETER + 1) + 1)
+
+        data = io.BytesIO()
+        pool.to_stream(data)
+        stored = ReencryptionFactorPool.from_stream(io.BytesIO(data.getvalue()),
+                                                    collection.public_key)
+        self.assertEqual(stored._factors, pool._factors)
+
+        shuffled, proof = collection.shuffle_with_proof(factor_pool=pool)
+        self.assertEqual(len(pool), 1)
+        self.assertTrue(proof.verify(collection, shuffled))
+
+    def test_shuffle_argument(self):
+        import io
+        from phoebus.mixnet.ProofBackends import proof_from_dict, \
+            proof_from_stream
+
+        collection = self._random_cipher_collection(3)
+        pk = collection.public_key
+        nbits = pk.cryptosystem.get_nbits()
+        shuffled, proof = collection.shuffle_with_proof(
+            proof_backend='shuffle_argument')
+        self.assertTrue(proof.verify(collection, shuffled))
+        self.assertFalse(proof.verify(shuffled, collection))
+
+        data = io.BytesIO()
+        proof.to_stream(data)
+        stored = proof_from_stream(io.BytesIO(data.getvalue()), pk, nbits)
+        self.assertTrue(stored.verify(collection, shuffled))
+        stored = proof_from_dict(proof.to_dict(), pk, nbits)
+        self.assertTrue(stored.verify(collection, shuffled))
+
+        stored._s_prime[0] = (stored._s_prime[0] + 1) % \
+            ((pk.cryptosystem.get_prime() - 1) / 2)
+        self.assertFalse(stored.verify(collection, shuffled))
+
+    def test_legacy_challenge(self):
+        import hashlib
+        import struct
+        from phoebus.mixnet import params
+        from phoebus.mixnet.CiphertextCollection import CiphertextCollection
+        from phoebus.mixnet.ShufflingProof import ShufflingProof
+        from phoebus.mixnet.ChallengeHasher import ChallengeHasher, \
+            CHALLENGE_VERSION_LEGACY, CHALLENGE_VERSION_FIXED_WIDTH
+
+        # a 2 round proof, stored before challenge_version was recorded
+        stored = json.load(open('helios/fixtures/legacy-shuffling-proof.json'))
+        self.assertFalse('challenge_version' in stored['proof'])
+        pk, nbits = ph.mixnet_pk(ph._default_public_key)
+        original = CiphertextCollection.from_dict(stored['original'], pk, nbits)
+        shuffled = CiphertextCollection.from_dict(stored['shuffled'], pk, nbits)
+
+        security_parameter = params.SHUFFLING_PROOF_SECURITY_PARAMETER
+        params.SHUFFLING_PROOF_SECURITY_PARAMETER = 2
+        try:
+            proof = ShufflingProof.from_dict(stored['proof'], pk, nbits)
+            self.assertEqual(proof._challenge_version, CHALLENGE_VERSION_LEGACY)
+            self.assertTrue(proof.verify(original, shuffled))
+            proof._challenge_version = CHALLENGE_VERSION_FIXED_WIDTH
+            self.assertFalse(proof.verify(original, shuffled))
+        finally:
+            params.SHUFFLING_PROOF_SECURITY_PARAMETER = security_parameter
+
+        hasher = ChallengeHasher(nbits, CHALLENGE_VERSION_LEGACY)
+        for collection in [original] + proof._collections + [shuffled]:
+            hasher.update_collection(collection)
+        self.assertEqual(hasher.hexdigest(pk), stored['proof']['challenge'])
+        self.assertEqual(stored['proof']['challenge'],
+            'b7d37af58f136f16265c66892103326927eb9607b82be048da2c63859f673860')
+
+        # v2 hashes the lengths and each value in nbits / 8 big-endian bytes
+        expected = hashlib.sha256()
+        expected.update(struct.pack('>I', original.get_length()))
+        for ciphertext in original:
+            expected.update(struct.pack('>I', ciphertext.get_length()))
+            for gamma, delta in ciphertext:
+                for value in (gamma, delta):
+                    expected.update(('%0*x' % (nbits / 4, value)).decode('hex'))
+        expected.update(pk.get_fingerprint())
+        hasher = ChallengeHasher(nbits, CHALLENGE_VERSION_FIXED_WIDTH)
+        hasher.update_collection(original)
+        self.assertEqual(hasher.hexdigest(pk), expected.hexdigest())
+        self.assertEqual(expected.hexdigest(),
+            '3b17373bb91cbc5dc59fbe134033c601bd61c7abea5106a095250911544421f4')
+
+    def test_fixed_base_table(self):
+        from phoebus.mixnet import params
+        from phoebus.mixnet.FixedBaseTable import FixedBaseTable
+
+        pk = ph._default_public_key
+        g, p = pk.g, pk.p
+        bits = p.bit_length()
+        rand = random.Random(11)
+        exponents = [0, 1, 2, 3, 31, 32, 33, 2**64 - 1, rand.getrandbits(160),
+                     rand.getrandbits(bits), p - 1, 2**bits - 1]
+        for window in (None, 1, 4, 7):
+            table = FixedBaseTable(g, p, bits, window)
+            for exponent in exponents:
+                self.assertEqual(table.pow(exponent), pow(g, exponent, p))
+        # out of the table's range: falls back to powmod
+        table = FixedBaseTable(g, p, 64)
+        self.assertEqual(table.pow(2**64 + 5), pow(g, 2**64 + 5, p))
+        self.assertEqual(table.pow(-5), pow(pow(g, p - 2, p), 5, p))
+
+        cache = dict(FixedBaseTable._cache)
+        cache_size = params.FIXED_BASE_TABLE_CACHE_SIZE
+        params.FIXED_BASE_TABLE_CACHE_SIZE = 2
+        FixedBaseTable._cache.clear()
+        try:
+            mix_pk, nbits = ph.mixnet_pk(pk)
+            g_table, y_table = mix_pk.get_fixed_base_tables()
+            self.assertEqual((g_table.base, y_table.base), (g, pk.y))
+            self.assertEqual(y_table.pow(12345), pow(pk.y, 12345, p))
+            tables = mix_pk.get_fixed_base_tables()
+            self.assertTrue(tables[0] is g_table and tables[1] is y_table)
+
+            # the cache is full: it is emptied before adding a new table
+            other = FixedBaseTable.get(g * g % p, p)
+            self.assertEqual(FixedBaseTable._cache.values(), [other])
+            self.assertFalse(mix_pk.get_fixed_base_tables()[0] is g_table)
+        finally:
+            params.FIXED_BASE_TABLE_CACHE_SIZE = cache_size
+            FixedBaseTable._cache.clear()
+            FixedBaseTable._cache.update(cache)
+
+    def test_dlog_table(self):
+        from phoebus.mixnet.DLogTable import DLogTable
+
+        pk = ph._default_public_key
+        g, p = pk.g, pk.p
+        table = DLogTable(g, p)
+        table.precompute(1000)
+        for x in (0, 1, 31, 32, 999, 1000):
+            self.assertEqual(table.lookup(pow(g, x, p)), x)
+        self.assertEqual(table.lookup(pow(g, 1001, p)), None)
+        # beyond the table, the kangaroo method is used
+        self.assertEqual(table.lookup(pow(g, 123456, p), 200000), 123456)
+        self.assertTrue(DLogTable.get(g, p) is DLogTable.get(g, p))
+
+        # growing the table leaves the steps a concurrent lookup holds intact
+        baby_steps, last_baby_step, giant_step = table._steps
+        size = len(baby_steps)
+        table.precompute(200000)
+        self.assertEqual(len(baby_steps), size)
+        self.assertTrue(len(table._steps[0]) > size)
+        self.assertEqual(table.lookup(pow(g, 123456, p)), 123456)
+
+    def test_encryption_batch_verify(self):
+        pk = ph._default_public_key
+        e = ph.Election(public_key=pk, candidates=range(4))
+        encryptions = []
+        for i in range(5):
+            eb, r = ph.Ballot.mk_random(e).encrypt()
+            encryptions.append((eb['a'], eb['b'], eb['proof']))
+        self.assertTrue(ph.verify_encryptions(pk.p, pk.g, encryptions))
+
+        a, b, proof = encryptions[2]
+        encryptions[2] = (a, b, proof + 1)
+        self.assertFalse(ph.verify_encryptions(pk.p, pk.g, encryptions))
+
+    def test_arithmetic_fallback(self):
+        from phoebus.mixnet import arithmetic
+
+        p = ph._default_public_key.p
+        rand = random.Random(17)
+        inverse = lambda x, prime: pow(x, prime - 2, prime)
+        # exponents of every window width, including zero and one
+        exponents = [0, 1, 2, 3, 2**32 - 1, 2**32 + 1, rand.getrandbits(100),
+                     2**256 - 1, rand.getrandbits(p.bit_length()), p - 2]
+
+        have_gmpy2 = arithmetic.HAVE_GMPY2
+        arithmetic.HAVE_GMPY2 = False
+        try:
+            for prime in (p, 1000003):
+                bases = [rand.randrange(2, prime) for e in exponents]
+                expected = 1
+                for base, exponent in zip(bases, exponents):
+                    self.assertEqual(arithmetic.powmod(base, exponent, prime),
+                                     pow(base, exponent, prime))
+                    expected = (expected * pow(base, exponent, prime)) % prime
+                self.assertEqual(
+                    arithmetic.multi_powmod(bases, exponents, prime), expected)
+
+                signed = [(-1) ** i * e for i, e in enumerate(exponents)]
+                expected = 1
+                for base, exponent in zip(bases, signed):
+                    if exponent < 0:
+                        base, exponent = inverse(base, prime), -exponent
+                    expected = (expected * pow(base, exponent, prime)) % prime
+                self.assertEqual(
+                    arithmetic.multi_powmod(bases, signed, prime), expected)
+                self.assertEqual(arithmetic.powmod(bases[3], -5, prime),
+                                 pow(inverse(bases[3], prime), 5, prime))
+
+                for x in bases + [1, prime - 1, prime + 2]:
+                    self.assertEqual(arithmetic._invert(x, prime),
+                                     inverse(x % prime, prime))
+                    self.assertEqual(arithmetic.invert(x, prime),
+                                     inverse(x % prime, prime))
+                    euler = pow(x, (prime - 1) / 2, prime)
+                    self.assertEqual(arithmetic.jacobi(x, prime),
+                                     -1 if euler == prime - 1 else euler)
+                self.assertEqual(arithmetic.jacobi(prime * 3, prime), 0)
+
+            # composite moduli: the Jacobi symbol is multiplicative in n
+            for a in range(-20, 20):
+                self.assertEqual(arithmetic.jacobi(a, 3 * 5 * 7),
+                                 arithmetic.jacobi(a, 3) *
+                                 arithmetic.jacobi(a, 5) *
+                                 arithmetic.jacobi(a, 7))
+            self.assertRaises(ValueError, arithmetic._invert, 6, 15)
+            self.assertRaises(ValueError, arithmetic.multi_powmod,
+                              [2, 6], [1, -1], 15)
+        finally:
+            arithmetic.HAVE_GMPY2 = have_gmpy2
+
+    def _threshold_setup(self, cryptosystem=None):
+        """
+        Sets up a 2 out of 3 threshold key, over the default parameters unless
+        a cryptosystem is given.
+
+        Returns the cryptosystem, the threshold public key and the threshold
+        private keys of the trustees.
+        """
+        from phoebus.mixnet.EGCryptoSystem import EGCryptoSystem
+        from phoebus.mixnet.threshold.ThresholdEncryptionSetUp import \
+            ThresholdEncryptionSetUp
+
+        if cryptosystem is None:
+            pk = ph._default_public_key
+            cryptosystem = EGCryptoSystem.load(pk.p.bit_length(), pk.p, pk.g)
+        key_pairs = [cryptosystem.new_key_pair() for i in range(3)]
+        setup = ThresholdEncryptionSetUp(cryptosystem, 3, 2)
+        for i in range(3):
+            setup.add_trustee_public_key(i, key_pairs[i].public_key)
+        commitments = [setup.generate_commitment() for i in range(3)]
+        for i in range(3):
+            setup.add_trustee_commitment(i, commitments[i])
+        threshold_keys = [setup.generate_private_key(i, key_pairs[i].private_key)
+                          for i in range(3)]
+        return cryptosystem, setup.generate_public_key(), threshold_keys
+
+    def _invalid_partial_decryption(self, threshold_key, ciphertext):
+        partial_decryption = threshold_key.generate_partial_decryption(
+            ciphertext)
+        partial_decryption[0].value = partial_decryption[0].value * 4 % \
+            threshold_key.cryptosystem.get_prime()
+        return partial_decryption
+
+    def test_threshold_public_key_from_dict(self):
+        from phoebus.mixnet.threshold.ThresholdPublicKey import \
+            ThresholdPublicKey
+
+        cryptosystem, public_key, threshold_keys = self._threshold_setup()
+        stored = ThresholdPublicKey.from_dict(
+            json.loads(json.dumps(public_key.to_dict())), cryptosystem)
+        self.assertEqual(stored.get_fingerprint(), public_key.get_fingerprint())
+        for i in range(3):
+            self.assertEqual(stored.get_partial_public_key(i),
+                             public_key.get_partial_public_key(i))
+
+    def test_threshold_partial_decryption(self):
+        from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import \
+            ThresholdDecryptionCombinator, InvalidPartialDecryptionProofError
+
+        cryptosystem, public_key, threshold_keys = self._threshold_setup()
+        ciphertext = public_key.encrypt_text("threshold")
+        combinator = ThresholdDecryptionCombinator(public_key, ciphertext, 3, 2)
+        for i in (0, 2):
+            combinator.add_partial_decryption(
+                i, threshold_keys[i].generate_partial_decryption(ciphertext))
+        self.assertEqual(combinator.decrypt_to_text(), "threshold")
+        self.assertRaises(InvalidPartialDecryptionProofError,
+                          combinator.add_partial_decryption, 1,
+                          self._invalid_partial_decryption(threshold_keys[1],
+                                                           ciphertext))
+
+        # a partial public key that is not invertible rejects any proof
+        public_key._partial_public_keys[1] = 0
+        self.assertRaises(InvalidPartialDecryptionProofError,
+                          combinator.add_partial_decryption, 1,
+                          threshold_keys[1].generate_partial_decryption(
+                              ciphertext))
+
+    def test_partial_decryption_batch_verify(self):
+        from phoebus.mixnet.threshold.PartialDecryptionBatchVerifier import \
+            PartialDecryptionBatchVerifier
+
+        cryptosystem, public_key, threshold_keys = self._threshold_setup()
+        ciphertexts = [public_key.encrypt_text("threshold"),
+                       public_key.encrypt_text("batch")]
+        verifier = PartialDecryptionBatchVerifier(public_key, 2)
+        for c in ciphertexts:
+            verifier.add_partial_decryption(
+                c, threshold_keys[2].generate_partial_decryption(c))
+        self.assertTrue(verifier.verify())
+
+        # the proofs of another trustee do not verify for this one
+        verifier = PartialDecryptionBatchVerifier(public_key, 2)
+        verifier.add_partial_decryption(
+            ciphertexts[0],
+            threshold_keys[1].generate_partial_decryption(ciphertexts[0]))
+        self.assertFalse(verifier.verify())
+
+        verifier = PartialDecryptionBatchVerifier(public_key, 2)
+        for c in ciphertexts:
+            verifier.add_partial_decryption(
+                c, threshold_keys[2].generate_partial_decryption(c))
+        verifier.add_partial_decryption(
+            ciphertexts[0],
+            self._invalid_partial_decryption(threshold_keys[2], ciphertexts[0]))
+        self.assertFalse(verifier.verify())
+
+    def test_threshold_bulk_decryption(self):
+        from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import \
+            InvalidPartialDecryptionProofError
+        from phoebus.mixnet.threshold.ThresholdBulkDecryptionCombinator \
+            import ThresholdBulkDecryptionCombinator
+
+        cryptosystem, public_key, threshold_keys = self._threshold_setup()
+        ciphertexts = [public_key.encrypt_text("threshold"),
+                       public_key.encrypt_text("batch")]
+        bulk = ThresholdBulkDecryptionCombinator(public_key, ciphertexts, 3, 2)
+        self.assertRaises(InvalidPartialDecryptionProofError,
+                          bulk.add_partial_decryptions, 1,
+                          [self._invalid_partial_decryption(threshold_keys[1],
+                                                            ciphertexts[0]),
+                           threshold_keys[1].generate_partial_decryption(
+                               ciphertexts[1])])
+        for i in (0, 2):
+            bulk.add_partial_decryptions(
+                i, [threshold_keys[i].generate_partial_decryption(c)
+                    for c in ciphertexts])
+        texts = []
+        for bitstream in bulk.decrypt_to_bitstreams(parallel=True):
+            bitstream.seek(0)
+            texts.append(bitstream.get_string(bitstream.get_num(64)))
+        self.assertEqual(texts, ["threshold", "batch"])
+
+    def test_threshold_decryption_early_stop(self):
+        from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import \
+            ThresholdDecryptionCombinator, InvalidPartialDecryptionProofError
+        from phoebus.mixnet.threshold.ThresholdBulkDecryptionCombinator \
+            import ThresholdBulkDecryptionCombinator
+
+        cryptosystem, public_key, threshold_keys = self._threshold_setup()
+        ciphertext = public_key.encrypt_text("early")
+
+        # a rejected share does not count towards the threshold
+        combinator = ThresholdDecryptionCombinator(public_key, ciphertext, 3, 2)
+        self.assertRaises(InvalidPartialDecryptionProofError,
+                          combinator.add_partial_decryption, 0,
+                          self._invalid_partial_decryption(threshold_keys[0],
+                                                           ciphertext))
+        self.assertTrue(combinator.needs_partial_decryptions())
+        combinator.add_partial_decryption(
+            1, threshold_keys[1].generate_partial_decryption(ciphertext))
+        self.assertTrue(combinator.needs_partial_decryptions())
+        combinator.add_partial_decryption(
+            2, threshold_keys[2].generate_partial_decryption(ciphertext))
+        self.assertFalse(combinator.needs_partial_decryptions())
+        self.assertEqual(combinator.decrypt_to_text(), "early")
+
+        # once threshold trustees are in, the others need not be checked
+        bulk = ThresholdBulkDecryptionCombinator(public_key, [ciphertext], 3, 2)
+        for i in (2, 0):
+            self.assertTrue(bulk.needs_partial_decryptions())
+            bulk.add_partial_decryptions(
+                i, [threshold_keys[i].generate_partial_decryption(ciphertext)])
+        self.assertFalse(bulk.needs_partial_decryptions())
+        bitstream = list(bulk.decrypt_to_bitstreams())[0]
+        bitstream.seek(0)
+        self.assertEqual(bitstream.get_string(bitstream.get_num(64)), "early")
@@ -9,6 +9,7 @@ import traceback
 import signals
 import copy
 
+from celery import chord
 from celery.decorators import task
 
 from helios.models import *
@@ -17,6 +18,9 @@ from helios.view_utils import render_template_raw
 
 from django.conf import settings
 
+# seconds before a question claimed by another task is checked again
+MIX_CLAIM_RETRY_DELAY = 60
+
 @task()
 def cast_vote_verify_and_store(cast_vote_id, status_update_message=None, **kwargs):
     cast_vote = CastVote.objects.get(id = cast_vote_id)
@@ -86,25 +90,52 @@ def single_voter_notify(voter_uuid, notification_template, extra_vars={}):
 
     voter.user.send_notification(notification)
 
-@task()
-def election_compute_tally(election_id):
-    election = Election.objects.get(id = election_id)
-    election.compute_tally()
-    if election.error_mixnet:
-        election_notify_admin.delay(election_id = election_id,
+def _mixing_failed(election):
+    election_notify_admin.delay(election_id = election.id,
                                 subject = "encrypted tally failed to compute",
                                 body = """
-Error occured while mixing. Mixnet data where cleared.
+Error occured while mixing. Questions already mixed were kept, and mixing
+will resume from its last checkpoint.
 
 Mixnet: %s
 
 error: %s
 """ % (election.error_mixnet.name, election.error_mixnet.mix_error))
-        election.error_mixnet.reset_mixing()
-        election.tallying_started_at = None
-        election.save()
+    election.error_mixnet.reset_mixing(keep_progress=True)
+    election.tallying_started_at = None
+    election.save()
+
+# acknowledged late, so that a task lost with its worker is run again and
+# resumes an interrupted mix from its checkpoints
+@task(acks_late=True)
+def election_compute_tally(election_id):
+    election = Election.objects.get(id = election_id)
+
+    # local mixnets mix each question in a task of its own, and
+    # mixnet_finish_mixing continues the tally once they are all mixed
+    mixnet = None
+    if election.workflow_type == 'mixnet' and not election.mixing_finished:
+        mixnet = election.get_next_mixnet()
+    if mixnet and mixnet.mixnet_type == 'local':
+        if mixnet.status == 'mixing' and not mixnet.claim_stalled_mixing():
+            # redelivered while the questions of the first delivery are
+            # still being mixed, and their chord will continue the tally
+            return
+        questions = mixnet.start_mixing()
+        if questions:
+            chord(mixnet_mix_question.si(mixnet.id, q) for q in questions)(
+                mixnet_finish_mixing.s(mixnet.id))
+            return
+
+    election.compute_tally()
+    if election.error_mixnet:
+        _mixing_failed(election)
         return
 
+    if election.mixing_finished:
+        # precomputed factors left over are secret and no longer needed
+        election.get_mix_factor_pool().clear()
+
     if election.mixing_finished and election.has_helios_trustee():
         election_notify_admin.delay(election_id = election_id,
                                 subject = "encrypted tally computed",
@@ -118,6 +149,45 @@ Helios
     else:
         election_compute_tally.delay(election_id=election_id)
 
+@task(acks_late=True, max_retries=None)
+def mixnet_mix_question(mixnet_id, question):
+    mixnet = ElectionMixnet.objects.get(id = mixnet_id)
+    try:
+        return mixnet.mix_question(mixnet.election.workflow.Mixnet, question)
+    except MixingClaimLost, e:
+        # another delivery of this task is mixing the question: check again
+        # later whether it is done, or its claim has expired
+        raise mixnet_mix_question.retry(exc=e, countdown=MIX_CLAIM_RETRY_DELAY)
+
+@task()
+def mixnet_finish_mixing(results, mixnet_id):
+    mixnet = ElectionMixnet.objects.get(id = mixnet_id)
+    election = mixnet.election
+    if not mixnet.finish_mixing():
+        if election.error_mixnet:
+            _mixing_failed(election)
+        return
+
+    election_compute_tally.delay(election_id=election.id)
+
+@task()
+def election_precompute_mix_factors(election_id):
+    """
+    fill the pool of re-encryption factors of the election one chunk at a
+    time, until it holds the factors needed to mix or tallying starts
+    """
+    election = Election.objects.get(id = election_id)
+    if not election.frozen_at or election.tallying_started_at:
+        return
+
+    pool = election.get_mix_factor_pool()
+    missing = election.mix_factors_needed() - len(pool)
+    if missing <= 0:
+        return
+
+    pool.generate(min(missing, settings.HELIOS_MIXNET_FACTORS_PER_TASK))
+    election_precompute_mix_factors.delay(election_id = election_id)
+
 @task()
 def tally_helios_decrypt(election_id):
     election = Election.objects.get(id = election_id)
@@ -132,6 +202,30 @@ for election %s.
 Helios
 """ % election.name)
 
+@task()
+def election_audit_decryptions(election_id, trustee_ids):
+    """
+    verify the partial decryptions left unused when combining the tally,
+    and let the admin know about the invalid ones
+    """
+    election = Election.objects.get(id = election_id)
+    trustees = Trustee.objects.filter(election = election, id__in = trustee_ids)
+    invalid_trustees = [t for t in trustees if not t.verify_decryption_proofs()]
+    if not invalid_trustees:
+        return
+
+    election_notify_admin.delay(election_id = election_id,
+                                subject = 'invalid partial decryptions',
+                                body = """
+The partial decryptions of the following trustees for election %s
+are invalid, and were not used to compute its result:
+
+%s
+
+--
+Helios
+""" % (election.name, "\n".join("%s (%s)" % (t.name, t.email) for t in invalid_trustees)))
+
 @task()
 def voter_file_process(voter_file_id):
     voter_file = VoterFile.objects.get(id = voter_file_id)
@@ -278,6 +278,25 @@ class CastVoteModelTests(TestCase):
     def test_cast_vote(self):
         pass
 
+    def test_verify_and_store_batch(self):
+        def cast(vote_hash, election_hash, **kwargs):
+            vote = utils.to_json({'answers': [], 'election_hash': election_hash, 'election_uuid': self.election.uuid})
+            cast_vote = models.CastVote(voter = self.voter, vote = vote, vote_hash = vote_hash, **kwargs)
+            cast_vote.save()
+            return cast_vote
+
+        valid = cast('valid', self.election.hash)
+        invalid = cast('invalid', 'not the election hash')
+        quarantined = cast('quarantined', self.election.hash, quarantined_p = True)
+
+        self.assertEquals(models.CastVote.verify_and_store_batch(10), 2)
+        self.assertEquals(models.CastVote.verify_and_store_batch(10), 0)
+
+        self.assertFalse(models.CastVote.objects.get(id = valid.id).verified_at == None)
+        self.assertFalse(models.CastVote.objects.get(id = invalid.id).invalidated_at == None)
+        self.assertEquals(models.CastVote.objects.get(id = quarantined.id).verified_at, None)
+        self.assertEquals(models.Voter.objects.get(id = self.voter.id).vote_hash, 'valid')
+
 class DatatypeTests(TestCase):
     fixtures = ['users.json', 'election.json']
 
@@ -304,6 +323,18 @@ class DatatypeTests(TestCase):
 
         self.assertEquals(original_dict, ld_obj.toDict())
 
+    def test_ldobject_field_lazy(self):
+        election = models.Election.objects.get(id = self.election.id)
+        raw_questions = election.__dict__['questions']
+        self.assertTrue(isinstance(raw_questions, basestring))
+
+        # saved back verbatim if never read
+        election.save()
+        self.assertEquals(models.Election.objects.get(id = election.id).__dict__['questions'], raw_questions)
+
+        self.assertEquals(election.questions, self.election.questions)
+        self.assertFalse(isinstance(election.__dict__['questions'], basestring))
+
 
 
 
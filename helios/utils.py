@@ -192,3 +192,23 @@ def lock_row(model, pk):
     pass
 
   return row
+
+def lock_ids_skip_locked(queryset, limit):
+  """
+  lock up to limit rows of the queryset and return their ids, skipping the
+  rows already locked by another transaction, so that concurrent workers
+  get disjoint rows. Use it inside a transaction.
+
+  Django has no SKIP LOCKED support yet, so it is added to the raw SQL on
+  postgres. Other databases only get a plain select for update.
+  """
+  from django.db import connection
+
+  ids = queryset.values_list('id', flat=True)[:limit]
+  if connection.vendor != 'postgresql':
+    return list(ids.select_for_update())
+
+  sql, params = ids.query.sql_with_params()
+  cursor = connection.cursor()
+  cursor.execute(sql + " for update skip locked", params)
+  return [row[0] for row in cursor.fetchall()]
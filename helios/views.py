@@ -264,7 +264,8 @@ def one_election_edit(request, election):
   error = None
   RELEVANT_FIELDS = ['short_name', 'name', 'description', 'use_voter_aliases',
       'election_type', 'private_p', 'help_email', 'randomize_answer_order',
-      'workflow_type', 'voting_starts_at', 'voting_ends_at']
+      'workflow_type', 'mix_proof_backend', 'voting_starts_at',
+      'voting_ends_at']
   # RELEVANT_FIELDS += ['use_advanced_audit_features']
 
   if settings.ALLOW_ELECTION_INFO_URL:
@@ -1042,6 +1043,10 @@ def one_election_freeze(request, election):
 
     election.freeze()
 
+    if election.workflow_type == "mixnet" and \
+        settings.HELIOS_MIXNET_PRECOMPUTE_FACTORS:
+      tasks.election_precompute_mix_factors.delay(election_id = election.id)
+
     if get_user(request):
       return HttpResponseRedirect(settings.SECURE_URL_HOST + reverse(one_election_view, args=[election.uuid]))
     else:
@@ -1170,18 +1175,30 @@ def combine_decryptions(request, election):
   combine trustee decryptions
   """
 
+  from phoebus.mixnet.threshold.ThresholdDecryptionCombinator import InsuficientPartialDecryptionsError
+
   election_url = get_election_url(election)
+  error = None
 
   if request.method == "POST":
     check_csrf(request)
 
-    election.combine_decryptions()
-    election.save()
+    try:
+      unused_trustees = election.combine_decryptions()
+    except InsuficientPartialDecryptionsError, e:
+      unused_trustees = e.unused_trustees
+      error = "Not enough valid partial decryptions to compute the tally. The partial decryptions of the following trustees were rejected: %s" % ", ".join("%s (%s)" % (t.name, t.email) for t in unused_trustees)
+    else:
+      election.save()
 
-    return HttpResponseRedirect("%s" % (settings.SECURE_URL_HOST + reverse(one_election_view, args=[election.uuid])))
+    if unused_trustees and settings.HELIOS_AUDIT_UNUSED_DECRYPTIONS:
+      tasks.election_audit_decryptions.delay(election_id = election.id, trustee_ids = [t.id for t in unused_trustees])
+
+    if not error:
+      return HttpResponseRedirect("%s" % (settings.SECURE_URL_HOST + reverse(one_election_view, args=[election.uuid])))
 
   # if just viewing the form or the form is not valid
-  return render_template(request, 'combine_decryptions', {'election': election})
+  return render_template(request, 'combine_decryptions', {'election': election, 'error': error})
 
 @election_admin(frozen=True)
 def one_election_set_result_and_proof(request, election):
@@ -1674,12 +1691,13 @@ def mixnet_upload_shuffle(request, election, mixnet_index):
   
   from phoebus.mixnet.Ciphertext import Ciphertext
   from phoebus.mixnet.CiphertextCollection import CiphertextCollection
-  from phoebus.mixnet.ShufflingProof import ShufflingProof
+  from phoebus.mixnet.ProofBackends import proof_from_dict
   
   for question in xrange(0, len(election.questions)):
-    # Read the uploaded shuffle and proof
+    # Read the uploaded shuffle and proof, of any proof backend (remote
+    # verificatum mixnets upload shuffle arguments)
     shuf = CiphertextCollection.from_dict(shuf_dict[question], pk, nbits)
-    proof = ShufflingProof.from_dict(proof_dict[question], pk, nbits)
+    proof = proof_from_dict(proof_dict[question], pk, nbits)
     
     # Convert the ballots to ciphertexts
     orig = CiphertextCollection(pk)
@@ -1704,7 +1722,7 @@ def mixnet_upload_shuffle(request, election, mixnet_index):
     
     mixed_votes = helios.models.MixedAnswers(mixnet=mixnet, question=question)
     mixed_votes.mixed_answers = new_answers.ld_object
-    mixed_votes.shuffling_proof = json_module.dumps(proof.to_dict())
+    mixed_votes.set_shuffling_proof(proof)
     mixed_votes.save()
     
     mixnet.mixing_finished_at = datetime.datetime.now()
@@ -1730,13 +1748,38 @@ def mixnets_answers(request, election, mixnet_index):
   return answers
 
 @election_view()
-@return_json
 def mixnets_proof(request, election, mixnet_index):
-  mixnet = election.mixnets.filter()[int(mixnet_index)]
+  """
+  JSON list of the shuffling proofs of the mixnet, one per question, or with
+  ?format=binary&question=<n>, the binary proof of a single question
+  (see phoebus/mixnet/BinaryFormat.py)
+  """
+  if not mixnet_index.isdigit():
+    raise Http404
+  try:
+    mixnet = election.mixnets.filter()[int(mixnet_index)]
+  except IndexError:
+    raise Http404
+
+  if request.GET.get('format', None) == 'binary':
+    try:
+      question = int(request.GET.get('question', 0))
+    except ValueError:
+      return HttpResponseBadRequest("invalid question number")
+    try:
+      mixed_answer = mixnet.mixed_answers.get(question=question)
+    except MixedAnswers.DoesNotExist:
+      raise Http404
+    response = HttpResponse(mixed_answer.get_shuffling_proof_data(),
+                            content_type="application/octet-stream")
+    response['Content-Disposition'] = \
+      'attachment; filename="proof-%s-%d.bin"' % (mixnet_index, question)
+    return response
+
   proofs = []
   for mixed_answer in mixnet.mixed_answers.filter():
-    proofs.append(json.loads(mixed_answer.shuffling_proof))
-  return proofs
+    proofs.append(mixed_answer.get_shuffling_proof_dict())
+  return render_json(helios_utils.to_json(proofs))
 
 
 def debugger(request):
@@ -6,12 +6,91 @@ from helios.crypto import algs
 from helios.workflows.homomorphic import *
 
 from phoebus import phoebus
+from phoebus.mixnet.WorkerPool import WorkerPool
+from phoebus.mixnet.arithmetic import mpz, invert
 
 import random
 import copy
+import io
+import itertools
 
 TYPE = 'mixnet'
 
+# number of blocks of mixed ballots decrypted by each task of
+# Tally.decrypt_from_factors
+DECRYPTION_CHUNK_SIZE = 1000
+
+def _decrypt_chunk(shared, chunk):
+  """
+  decrypt and q-decode a chunk of blocks of a tally, given as
+  (number of its first block, [(beta, decryption factors), ...]), to be used
+  with WorkerPool. only (p, q) are shared, so that each worker only loads
+  the chunks it decrypts.
+
+  raises ValueError, naming the block, if the decryption factors of a block
+  are not invertible (that is, one of them is 0 mod p)
+  """
+  p, q = shared
+  start, blocks = chunk
+  p = mpz(p)
+
+  # each block is beta / prod(factors), and the products of all the blocks
+  # are inverted at once (Montgomery's trick), with a single modular inversion
+  products = []
+  prefixes = []
+  running = mpz(1)
+  for i, (beta, factors) in enumerate(blocks):
+    product = mpz(1)
+    for factor in factors:
+      product = (product * factor) % p
+    if product == 0:
+      raise ValueError("invalid decryption factors for block %d of the tally: "
+                       "they are not invertible" % (start + i))
+    products.append(product)
+    running = (running * product) % p
+    prefixes.append(running)
+  inverse = mpz(invert(running, p))
+
+  values = [None] * len(blocks)
+  for i in xrange(len(blocks) - 1, -1, -1):
+    # inverse is the inverse of products[0] * ... * products[i]
+    if i > 0:
+      product_inverse = (inverse * prefixes[i - 1]) % p
+    else:
+      product_inverse = inverse
+    inverse = (inverse * products[i]) % p
+
+    value = (blocks[i][0] * product_inverse) % p
+
+    # q_decode
+    if value > q:
+      value = -value % p
+    values[i] = long(value)
+
+  return values
+
+def answers_to_collection(public_key, answers):
+  """
+  load the choices of mixed answers (or of any answers made of ElGamal
+  ciphertexts) into a phoebus mixnet ciphertext collection, passing them
+  as raw integers
+  """
+  pk, nbits = phoebus.mixnet_pk(public_key)
+  values = ([value for choice in answer.choices
+             for value in (choice.alpha, choice.beta)] for answer in answers)
+  return phoebus.MixCiphertextCollection.from_values(pk, nbits, values)
+
+def collection_to_answers(collection, question_num=0):
+  """
+  the MixedAnswers of the ciphertexts of a phoebus mixnet collection
+  """
+  answers = []
+  for index, ciphertext in enumerate(collection):
+    choices = [Ciphertext(alpha=alpha, beta=beta)
+               for alpha, beta in itertools.izip(ciphertext.gamma, ciphertext.delta)]
+    answers.append(MixedAnswer(choices=choices, index=index))
+  return MixedAnswers(answers, question_num=question_num)
+
 class ShuffleProof(WorkflowObject):
   @property
   def datatype(self):
@@ -23,28 +102,174 @@ class Mixnet(WorkflowObject):
     self.election = election
     super(Mixnet, self).__init__(*args, **kwargs)
 
-  def mix(self, election, votes, verify=True, question_num=0):
-    encrypted_ballots = []
-    for index, vote in enumerate(votes):
-      encrypted_ballots.append(vote.to_phoebus_ballot(election, question_num))
-
-    ph_election = phoebus.Election.from_helios_election_model(self.election,
-          encrypted_ballots=encrypted_ballots)
+  def mix(self, election, votes, verify=True, question_num=0, checkpoint=None,
+          factor_pool=None, proof_backend=None):
+    # the votes were verified when cast, or are the output of a previous
+    # (verified) mix: they are loaded straight into a ciphertext collection,
+    # without verifying and signing them again as phoebus ballots
+    collection = answers_to_collection(election.public_key, votes)
 
-    new_ballots, mix_proof = ph_election.mix_ballots()
-    new_votes = []
+    shuffled, mix_proof = phoebus.shuffle_collection(collection,
+                                                     checkpoint=checkpoint,
+                                                     factor_pool=factor_pool,
+                                                     proof_backend=proof_backend)
 
-    new_answers = MixedAnswers([], question_num=question_num)
-    for index, ballot in enumerate(new_ballots):
-      ciphers = []
-      for bit in ballot.encrypted_ballot:
-        cipher = Ciphertext(alpha=bit['a'], beta=bit['b'])
-        ciphers.append(cipher)
-      new_answers.answers.append(MixedAnswer(choices=ciphers, index=index))
+    new_answers = collection_to_answers(shuffled, question_num=question_num)
 
     return new_answers, mix_proof
 
 
+class MixCheckpoint(object):
+  """
+  Saves the shuffle of a question being mixed by an ElectionMixnet, round by
+  round, as MixingCheckpoint rows, and gives it back to resume an interrupted
+  mix (see phoebus.shuffle_collection).
+
+  Checkpoints hold the secret shuffle mapping of the mixnet, and are deleted
+  as soon as the question is mixed. Saving one renews the claim of the
+  question by the task identified by token (see ElectionMixnet.claim_question).
+  """
+
+  def __init__(self, mixnet, question, token):
+    self.mixnet = mixnet
+    self.question = question
+    self.token = token
+
+  def _rows(self):
+    return self.mixnet.checkpoints.filter(question=self.question)
+
+  def _hash(self, collection):
+    from phoebus.mixnet.ChallengeHasher import ChallengeHasher
+    hasher = ChallengeHasher(collection.public_key.cryptosystem.get_nbits())
+    hasher.update_collection(collection)
+    return hasher.hexdigest(collection.public_key)
+
+  def _add_rounds_done(self, count):
+    # atomic increment, as questions of a mixnet may be mixed in parallel
+    from django.db.models import F
+    from helios.models import ElectionMixnet
+    ElectionMixnet.objects.filter(id=self.mixnet.id).update(
+      mix_rounds_done=F('mix_rounds_done') + count)
+
+  def load(self, collection):
+    """
+    the (mapping, rounds) saved for collection, or (None, []) if there is no
+    checkpoint of a shuffle of that same collection
+    """
+    from phoebus.mixnet.CiphertextCollection import CiphertextCollection
+    from phoebus.mixnet.CiphertextCollectionMapping import CiphertextCollectionMapping
+    from helios.models import MixingCheckpoint
+
+    self.original_hash = self._hash(collection)
+    try:
+      shuffle = self._rows().get(round=MixingCheckpoint.SHUFFLE_ROUND)
+    except MixingCheckpoint.DoesNotExist:
+      return None, []
+
+    if shuffle.original_hash != self.original_hash:
+      # the checkpoint is not for these ballots
+      self._rows().delete()
+      return None, []
+
+    pk = collection.public_key
+    nbits = pk.cryptosystem.get_nbits()
+    mapping = CiphertextCollectionMapping.from_stream(
+      io.BytesIO(str(shuffle.mapping_data)), pk, nbits)
+
+    rounds = []
+    for row in self._rows().filter(round__gte=0):
+      if row.round != len(rounds):
+        break
+      rounds.append((
+        CiphertextCollection.from_stream(io.BytesIO(str(row.collection_data)),
+                                         pk, nbits),
+        CiphertextCollectionMapping.from_stream(io.BytesIO(str(row.mapping_data)),
+                                                pk, nbits)))
+    self._add_rounds_done(len(rounds))
+    return mapping, rounds
+
+  def save_shuffle(self, mapping):
+    from helios.models import MixingCheckpoint
+    self.mixnet.claim_question(self.question, self.token)
+    data = io.BytesIO()
+    mapping.to_stream(data)
+    self._rows().delete()
+    MixingCheckpoint.objects.create(mixnet=self.mixnet, question=self.question,
+                                    round=MixingCheckpoint.SHUFFLE_ROUND,
+                                    original_hash=self.original_hash,
+                                    mapping_data=data.getvalue())
+
+  def save_round(self, index, collection, mapping):
+    from helios.models import MixingCheckpoint
+    self.mixnet.claim_question(self.question, self.token)
+    collection_data = io.BytesIO()
+    collection.to_stream(collection_data)
+    mapping_data = io.BytesIO()
+    mapping.to_stream(mapping_data)
+    MixingCheckpoint.objects.create(mixnet=self.mixnet, question=self.question,
+                                    round=index,
+                                    collection_data=collection_data.getvalue(),
+                                    mapping_data=mapping_data.getvalue())
+    self._add_rounds_done(1)
+
+
+class ElectionFactorPool(phoebus.MixReencryptionFactorPool):
+  """
+  The re-encryption factors precomputed for an election, stored as
+  ReencryptionFactors chunks. Factors are deleted as they are taken, so
+  that each is used only once, even by mixes running in parallel.
+  """
+
+  def __init__(self, election):
+    pk, nbits = phoebus.mixnet_pk(election.public_key)
+    phoebus.MixReencryptionFactorPool.__init__(self, pk)
+    self.election = election
+
+  def __len__(self):
+    from django.db.models import Sum
+    count = self.election.reencryption_factors.aggregate(Sum('count'))
+    return count['count__sum'] or 0
+
+  def add(self, factors):
+    from helios.models import ReencryptionFactors
+    chunk = phoebus.MixReencryptionFactorPool(self.public_key)
+    chunk.add(factors)
+    data = io.BytesIO()
+    chunk.to_stream(data)
+    ReencryptionFactors.objects.create(election=self.election,
+                                       count=len(factors),
+                                       data=data.getvalue())
+
+  def take(self, count):
+    from django.db import transaction
+    factors = []
+    rows = self.election.reencryption_factors
+    for row_id in rows.order_by('id').values_list('id', flat=True):
+      if len(factors) >= count:
+        break
+      with transaction.atomic():
+        try:
+          row = rows.select_for_update().get(id=row_id)
+        except rows.model.DoesNotExist:
+          # taken meanwhile by another mix
+          continue
+        chunk = phoebus.MixReencryptionFactorPool.from_stream(
+          io.BytesIO(str(row.data)), self.public_key)
+        factors.extend(chunk.take(count - len(factors)))
+        if len(chunk):
+          data = io.BytesIO()
+          chunk.to_stream(data)
+          row.data = data.getvalue()
+          row.count = len(chunk)
+          row.save()
+        else:
+          row.delete()
+    return factors
+
+  def clear(self):
+    self.election.reencryption_factors.all().delete()
+
+
 class MixedAnswers(WorkflowObject):
 
     @property
@@ -69,22 +294,6 @@ class MixedAnswer(WorkflowObject):
     def fromEncryptedAnswer(cls, answer, index):
         return cls(choices=answer.choices, index=index)
 
-    def to_phoebus_ballot(self, election, question_num):
-      phoebus_enc = []
-      for choice in self.choices:
-        phoebus_enc.append({'a': choice.alpha, 'b': choice.beta})
-      question = election.questions[question_num]
-      nr_candidates = len(question['answers'])
-      max_choices = nr_candidates
-
-      ballot = phoebus.Ballot.from_dict(
-            {'encrypted_ballot': phoebus_enc,
-              'nr_candidates': nr_candidates,
-              'max_choices': max_choices,
-              'public_key': election.public_key
-            })
-      return ballot
-
 class Tally(HomomorphicTally):
 
   @property
@@ -99,26 +308,14 @@ class Tally(HomomorphicTally):
     returns an array of decryption factors and a corresponding array of decryption proofs.
     makes the decryption factors into strings, for general Helios / JS compatibility.
     """
-    # for all choices of all questions (double list comprehension)
-    decryption_factors = []
-    decryption_proof = []
-
-    for q in xrange(0, len(self.tally)):
-      decryption_factors_q = []
-      decryption_proof_q = []
-      
-      for vote in self.tally[q]:
-        decryption_factors_b = []
-        decryption_proof_b = []
-        
-        for block in vote:
-          dec_factor, proof = sk.decryption_factor_and_proof(block)
-          decryption_factors_b.append(dec_factor)
-          decryption_proof_b.append(proof)
-        decryption_factors_q.append(decryption_factors_b)
-        decryption_proof_q.append(decryption_proof_b)
-      decryption_factors.append(decryption_factors_q)
-      decryption_proof.append(decryption_proof_q)
+    # all the blocks of all the ballots are decrypted at once
+    blocks = [block for q in self.tally for vote in q for block in vote]
+    factors, proofs = sk.decryption_factors_and_proofs(blocks)
+    factors = iter(factors)
+    proofs = iter(proofs)
+
+    decryption_factors = [[[factors.next() for block in vote] for vote in q] for q in self.tally]
+    decryption_proof = [[[proofs.next() for block in vote] for vote in q] for q in self.tally]
 
     return decryption_factors, decryption_proof
 
@@ -130,40 +327,27 @@ class Tally(HomomorphicTally):
     Each decryption factor set is a list of lists of decryption factors (questions/answers).
     """
 
-    from phoebus import phoebus as ph
-    # pre-compute a dlog table
-    dlog_table = DLogTable(base = public_key.g, modulus = public_key.p)
-
     if not self.num_tallied:
       self.num_tallied = 0
       for tally in self.tally:
         self.num_tallied += len(tally)
 
-    dlog_table.precompute(self.num_tallied)
-
-    result = []
-
-    # go through each one
+    # the blocks of all the ballots of all the questions, decrypted in chunks
+    # by the mixnet worker processes
+    blocks = []
     for q_num, q in enumerate(self.tally):
-      q_result = []
-
       for a_num, a in enumerate(q):
-        a_result = []
         for b_num, b in enumerate(a):
           # coalesce the decryption factors into one list
           dec_factor_list = [df[q_num][a_num][b_num] for df in decryption_factors]
-          raw_value = self.tally[q_num][a_num][b_num].decrypt(dec_factor_list, public_key)
+          blocks.append((b.beta, dec_factor_list))
 
-          # q_decode
-          if raw_value > public_key.q:
-              raw_value = -raw_value % public_key.p
-          # raw_value = raw_value - 1 # what. why?
-          a_result.append(raw_value)
-        q_result.append(a_result)
+    chunks = [(i, blocks[i:i + DECRYPTION_CHUNK_SIZE]) for i in xrange(0, len(blocks), DECRYPTION_CHUNK_SIZE)]
 
-      result.append(q_result)
+    # the results are streamed back in order, chunk by chunk
+    values = itertools.chain.from_iterable(WorkerPool.get().imap(_decrypt_chunk, (public_key.p, public_key.q), chunks))
 
-    return result
+    return [[[values.next() for b in a] for a in q] for q in self.tally]
 
 class EncryptedVote(EncryptedVote):
 
@@ -246,6 +430,23 @@ class EncryptedVote(EncryptedVote):
 
     return True
 
+  @classmethod
+  def verify_all(cls, votes, election):
+    """
+    verify many votes for the same election, checking the encryption proofs
+    of all of them in a single batch
+    """
+    results = [vote.election_hash == election.hash and
+               vote.election_uuid == election.uuid for vote in votes]
+    answers = [answer for vote, result in zip(votes, results) if result
+               for answer in vote.encrypted_answers]
+    if EncryptedAnswer.verify_all(answers, election.public_key):
+      return results
+
+    # some proof is invalid, find out which
+    return [result and vote.verify(election)
+            for vote, result in zip(votes, results)]
+
 
 class EncryptedAnswer(EncryptedAnswer):
 
@@ -287,6 +488,19 @@ class EncryptedAnswer(EncryptedAnswer):
             self.choice.beta, self.encryption_proof)
     return verified
 
+  @classmethod
+  def verify_all(cls, answers, pk):
+    """
+    verify the encryption proofs of many answers in a single batch,
+    returns False if any of them is invalid
+    """
+    if not answers:
+      return True
+
+    return phoebus.verify_encryptions(pk.p, pk.g,
+            [(answer.choice.alpha, answer.choice.beta, answer.encryption_proof)
+             for answer in answers])
+
 
 """
 Mixnet API
@@ -9,6 +9,7 @@ ben@adida.net
 
 import math, hashlib, logging
 import randpool, number
+from mixnet.arithmetic import powmod, multi_powmod, invert, is_prime
 
 # some utilities
 class Utils:
@@ -40,7 +41,7 @@ class Utils:
     
     @classmethod
     def is_prime(cls, mpz):
-        return number.isPrime(mpz)
+        return is_prime(mpz)
 
     @classmethod
     def xgcd(cls, a, b):
@@ -58,7 +59,7 @@ class Utils:
     @classmethod
     def inverse(cls, mpz, mod):
         # return cls.xgcd(mpz,mod)[0]
-        return number.inverse(mpz, mod)
+        return invert(mpz, mod)
   
     @classmethod
     def random_safe_prime(cls, n_bits):
@@ -112,7 +113,7 @@ class ElGamal:
       # find g that generates the q-order subgroup
       while True:
         EG.g = Utils.random_mpz_lt(EG.p)
-        if pow(EG.g, EG.q, EG.p) == 1:
+        if powmod(EG.g, EG.q, EG.p) == 1:
           break
 
       return EG
@@ -152,7 +153,7 @@ class EGKeyPair:
       self.pk.q = q
       
       self.sk.x = Utils.random_mpz_lt(p)
-      self.pk.y = pow(g, self.sk.x, p)
+      self.pk.y = powmod(g, self.sk.x, p)
       
       self.sk.pk = self.pk
 
@@ -173,15 +174,15 @@ class EGPublicKey:
         # make sure m is in the right subgroup
         if encode_message:
           y = plaintext.m + 1
-          if pow(y, self.q, self.p) == 1:
+          if powmod(y, self.q, self.p) == 1:
             m = y
           else:
             m = -y % self.p
         else:
           m = plaintext.m
         
-        ciphertext.alpha = pow(self.g, r, self.p)
-        ciphertext.beta = (m * pow(self.y, r, self.p)) % self.p
+        ciphertext.alpha = powmod(self.g, r, self.p)
+        ciphertext.beta = (m * powmod(self.y, r, self.p)) % self.p
         
         return ciphertext
 
@@ -233,8 +234,8 @@ class EGPublicKey:
       verify the proof of knowledge of the secret key
       g^response = commitment * y^challenge
       """
-      left_side = pow(self.g, dlog_proof.response, self.p)
-      right_side = (dlog_proof.commitment * pow(self.y, dlog_proof.challenge, self.p)) % self.p
+      left_side = powmod(self.g, dlog_proof.response, self.p)
+      right_side = (dlog_proof.commitment * powmod(self.y, dlog_proof.challenge, self.p)) % self.p
       
       expected_challenge = challenge_generator(dlog_proof.commitment) % self.q
       
@@ -263,7 +264,7 @@ class EGSecretKey:
         """
         provide the decryption factor, not yet inverted because of needed proof
         """
-        return pow(ciphertext.alpha, self.x, self.pk.p)
+        return powmod(ciphertext.alpha, self.x, self.pk.p)
 
     def decryption_factor_and_proof(self, ciphertext, challenge_generator=None):
         """
@@ -312,13 +313,13 @@ class EGSecretKey:
         and alpha^t = b * beta/m ^ c
         """
         
-        m = (Utils.inverse(pow(ciphertext.alpha, self.x, self.pk.p), self.pk.p) * ciphertext.beta) % self.pk.p
+        m = (Utils.inverse(powmod(ciphertext.alpha, self.x, self.pk.p), self.pk.p) * ciphertext.beta) % self.pk.p
         beta_over_m = (ciphertext.beta * Utils.inverse(m, self.pk.p)) % self.pk.p
 
         # pick a random w
         w = Utils.random_mpz_lt(self.pk.q)
-        a = pow(self.pk.g, w, self.pk.p)
-        b = pow(ciphertext.alpha, w, self.pk.p)
+        a = powmod(self.pk.g, w, self.pk.p)
+        b = powmod(ciphertext.alpha, w, self.pk.p)
 
         c = int(hashlib.sha1(str(a) + "," + str(b)).hexdigest(),16)
 
@@ -343,7 +344,7 @@ class EGSecretKey:
       Prover computes response = w + x*challenge mod q, where x is the secret key.
       """
       w = Utils.random_mpz_lt(self.pk.q)
-      commitment = pow(self.pk.g, w, self.pk.p)
+      commitment = powmod(self.pk.g, w, self.pk.p)
       challenge = challenge_generator(commitment) % self.pk.q
       response = (w + (self.x * challenge)) % self.pk.q
       
@@ -412,8 +413,8 @@ class EGCiphertext:
         that's no good when we do plaintext encoding of 1.
         """
         new_c = EGCiphertext()
-        new_c.alpha = (self.alpha * pow(self.pk.g, r, self.pk.p)) % self.pk.p
-        new_c.beta = (self.beta * pow(self.pk.y, r, self.pk.p)) % self.pk.p
+        new_c.alpha = (self.alpha * powmod(self.pk.g, r, self.pk.p)) % self.pk.p
+        new_c.beta = (self.beta * powmod(self.pk.y, r, self.pk.p)) % self.pk.p
         new_c.pk = self.pk
 
         return new_c
@@ -452,8 +453,8 @@ class EGCiphertext:
       proof = EGZKProof()
 
       # compute A=g^w, B=y^w
-      proof.commitment['A'] = pow(self.pk.g, w, self.pk.p)
-      proof.commitment['B'] = pow(self.pk.y, w, self.pk.p)
+      proof.commitment['A'] = powmod(self.pk.g, w, self.pk.p)
+      proof.commitment['B'] = powmod(self.pk.y, w, self.pk.p)
 
       # generate challenge
       proof.challenge = challenge_generator(proof.commitment);
@@ -478,8 +479,8 @@ class EGCiphertext:
       proof.response = Utils.random_mpz_lt(self.pk.q);
 
       # now we compute A and B
-      proof.commitment['A'] = (Utils.inverse(pow(self.alpha, proof.challenge, self.pk.p), self.pk.p) * pow(self.pk.g, proof.response, self.pk.p)) % self.pk.p
-      proof.commitment['B'] = (Utils.inverse(pow(beta_over_plaintext, proof.challenge, self.pk.p), self.pk.p) * pow(self.pk.y, proof.response, self.pk.p)) % self.pk.p
+      proof.commitment['A'] = (Utils.inverse(powmod(self.alpha, proof.challenge, self.pk.p), self.pk.p) * powmod(self.pk.g, proof.response, self.pk.p)) % self.pk.p
+      proof.commitment['B'] = (Utils.inverse(powmod(beta_over_plaintext, proof.challenge, self.pk.p), self.pk.p) * powmod(self.pk.y, proof.response, self.pk.p)) % self.pk.p
 
       return proof
     
@@ -529,11 +530,11 @@ class EGCiphertext:
       """
       
       # check that g^response = A * alpha^challenge
-      first_check = (pow(self.pk.g, proof.response, self.pk.p) == ((pow(self.alpha, proof.challenge, self.pk.p) * proof.commitment['A']) % self.pk.p))
+      first_check = (powmod(self.pk.g, proof.response, self.pk.p) == ((powmod(self.alpha, proof.challenge, self.pk.p) * proof.commitment['A']) % self.pk.p))
       
       # check that y^response = B * (beta/m)^challenge
       beta_over_m = (self.beta * Utils.inverse(plaintext.m, self.pk.p)) % self.pk.p
-      second_check = (pow(self.pk.y, proof.response, self.pk.p) == ((pow(beta_over_m, proof.challenge, self.pk.p) * proof.commitment['B']) % self.pk.p))
+      second_check = (powmod(self.pk.y, proof.response, self.pk.p) == ((powmod(beta_over_m, proof.challenge, self.pk.p) * proof.commitment['B']) % self.pk.p))
       
       # print "1,2: %s %s " % (first_check, second_check)
       return (first_check and second_check)
@@ -555,18 +556,19 @@ class EGCiphertext:
       # check the overall challenge
       return (challenge_generator([p.commitment for p in proof.proofs]) == (sum([p.challenge for p in proof.proofs]) % self.pk.q))
       
-    def verify_decryption_proof(self, plaintext, proof):
+    def verify_decryption_proof(self, plaintext, proof, challenge_generator=None):
       """
       Checks for the DDH tuple g, alpha, y, beta/plaintext
       (PoK of secret key x.)
       """
-      return False
+      beta_over_m = (self.beta * Utils.inverse(plaintext.m, self.pk.p)) % self.pk.p
+      return proof.verify(self.pk.g, self.alpha, self.pk.y, beta_over_m, self.pk.p, self.pk.q, challenge_generator)
       
     def verify_decryption_factor(self, dec_factor, dec_proof, public_key):
       """
       when a ciphertext is decrypted by a dec factor, the proof needs to be checked
       """
-      pass
+      return dec_proof.verify(public_key.g, self.alpha, public_key.y, dec_factor, public_key.p, public_key.q)
       
     def decrypt(self, decryption_factors, public_key):
       """
@@ -625,8 +627,8 @@ class EGZKProof(object):
       proof = cls()
 
       # compute A = little_g^w, B=little_h^w
-      proof.commitment['A'] = pow(little_g, w, p)
-      proof.commitment['B'] = pow(little_h, w, p)
+      proof.commitment['A'] = powmod(little_g, w, p)
+      proof.commitment['B'] = powmod(little_h, w, p)
 
       # get challenge
       proof.challenge = challenge_generator(proof.commitment)
@@ -658,11 +660,15 @@ class EGZKProof(object):
     """
     Verify a DH tuple proof
     """
-    # check that little_g^response = A * big_g^challenge
-    first_check = (pow(little_g, self.response, p) == ((pow(big_g, self.challenge, p) * self.commitment['A']) % p))
-    
-    # check that little_h^response = B * big_h^challenge
-    second_check = (pow(little_h, self.response, p) == ((pow(big_h, self.challenge, p) * self.commitment['B']) % p))
+    # check that little_g^response = A * big_g^challenge, and that
+    # little_h^response = B * big_h^challenge, each as a single simultaneous
+    # exponentiation: little_g^response * big_g^-challenge = A
+    try:
+      first_check = (multi_powmod([little_g, big_g], [self.response, -self.challenge], p) == self.commitment['A'] % p)
+      second_check = (multi_powmod([little_h, big_h], [self.response, -self.challenge], p) == self.commitment['B'] % p)
+    except ValueError:
+      # big_g or big_h is not invertible, so it is not a group element
+      return False
 
     # check the challenge?
     third_check = True
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  BinaryFormat.py :
+#
+#  This file provides BinaryWriter and BinaryReader, used to store and load
+#  large mixnet objects (CiphertextCollection, CiphertextCollectionMapping,
+#  ShufflingProof and ShuffleArgument) in a compact binary format, instead of
+#  the JSON representation given by their to_dict() and from_dict(...)
+#  methods.
+#
+#  A binary stream starts with a header, made of a 4-byte magic string
+#  identifying the type of object stored, one byte with the format version
+#  and one byte of flags. The rest of the stream (the body) is optionally
+#  compressed with zlib. Bodies are made of:
+#
+#   * unsigned integers, as 4-byte big-endian values
+#   * strings, as an unsigned integer length followed by the bytes
+#   * big integers (group elements and exponents), as fixed-width big-endian
+#     byte strings whose width is given once, before the values
+#
+#  Both classes work incrementally over file-like objects, so that objects
+#  can be written and read piece by piece without holding the whole encoded
+#  stream in memory.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+import struct
+import zlib
+from binascii import hexlify, unhexlify
+
+# Use configuration parameters from params.py
+import params
+
+# Exceptions:
+from PVCExceptions import InvalidBinaryFormatError
+
+
+# Version of the binary format written by BinaryWriter, and versions that
+# BinaryReader can read. Version 2 adds the kind of each re-encryption of a
+# mapping (pairs or exponents, see CiphertextReencryptionInfo).
+FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+
+# Header flags
+FLAG_COMPRESSED = 0x01
+
+# Magic strings identifying the type of object stored in a stream
+MAGIC_CIPHERTEXT_COLLECTION = 'PVCC'
+MAGIC_SHUFFLING_PROOF = 'PVSP'
+MAGIC_SHUFFLE_ARGUMENT = 'PVSA'
+MAGIC_COLLECTION_MAPPING = 'PVCM'
+MAGIC_REENCRYPTION_FACTORS = 'PVRF'
+
+# Size of the chunks read from the underlying stream
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def value_width(nbits):
+    """
+    Returns the width in bytes used to store values of a cryptosystem of
+    nbits bits.
+    """
+    return (nbits + 7) / 8
+
+
+class BinaryWriter:
+    """
+    Writes the binary representation of an object to a file-like object.
+
+    Create a writer over an open stream with the magic string of the object
+    type, write the object's body with the write_* methods and call close()
+    to flush the (possibly compressed) data. close() does not close the
+    underlying stream.
+    """
+
+    def __init__(self, stream, magic, compress=None):
+        """
+        Creates a new BinaryWriter and writes the stream header.
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            magic::string   -- The 4-byte magic string of the object type.
+            compress::bool  -- Whether to compress the body of the stream.
+                               If None, params.BINARY_FORMAT_COMPRESSION is
+                               used.
+        """
+        if(compress is None):
+            compress = params.BINARY_FORMAT_COMPRESSION
+        assert len(magic) == 4
+
+        self._stream = stream
+        flags = 0
+        if(compress):
+            flags |= FLAG_COMPRESSED
+            self._compressor = zlib.compressobj()
+        else:
+            self._compressor = None
+        stream.write(magic + struct.pack('>BB', FORMAT_VERSION, flags))
+
+    def write(self, data):
+        """
+        Writes raw bytes to the body of the stream.
+        """
+        if(self._compressor is not None):
+            data = self._compressor.compress(data)
+        if(data):
+            self._stream.write(data)
+
+    def write_uint(self, value):
+        """
+        Writes an unsigned 4-byte integer.
+        """
+        self.write(struct.pack('>I', value))
+
+    def write_string(self, value):
+        """
+        Writes a length-prefixed byte string.
+        """
+        self.write_uint(len(value))
+        self.write(value)
+
+    def write_values(self, values, width):
+        """
+        Writes a sequence of non-negative big integers, each as a fixed-width
+        big-endian string of width bytes.
+
+        Throws:
+            ValueError  -- If a value does not fit in width bytes.
+        """
+        hex_width = width * 2
+        limit = 1 << (width * 8)
+        encoded = []
+        for value in values:
+            if(not (0 <= value < limit)):
+                raise ValueError("Value does not fit in %d bytes." % width)
+            encoded.append('%0*x' % (hex_width, value))
+        self.write(unhexlify(''.join(encoded)))
+
+    def close(self):
+        """
+        Flushes the body of the stream.
+        """
+        if(self._compressor is not None):
+            self._stream.write(self._compressor.flush())
+            self._compressor = None
+
+
+class BinaryReader:
+    """
+    Reads the binary representation of an object from a file-like object.
+
+    Create a reader over an open stream with the expected magic string, which
+    checks the header, and read the object's body with the read_* methods.
+
+    Attributes:
+        version::int    -- The format version of the stream being read.
+    """
+
+    def __init__(self, stream, magic):
+        """
+        Creates a new BinaryReader and reads the stream header.
+
+        Arguments:
+            stream::file    -- A file-like object open for reading.
+            magic::string   -- The expected 4-byte magic string.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the header does not match the
+                                           expected object type or format.
+        """
+        self._stream = stream
+        self._buffer = ''
+        self._position = 0
+        self._decompressor = None
+
+        header = stream.read(6)
+        if(len(header) != 6 or header[:4] != magic):
+            raise InvalidBinaryFormatError("The given data is not a binary " \
+                "stream of the expected type (expected magic string %r)." \
+                % magic)
+
+        version, flags = struct.unpack('>BB', header[4:])
+        if(version not in SUPPORTED_FORMAT_VERSIONS):
+            raise InvalidBinaryFormatError("Unsupported binary format " \
+                "version %d (supported versions are %s)." \
+                % (version, SUPPORTED_FORMAT_VERSIONS))
+        self.version = version
+
+        if(flags & FLAG_COMPRESSED):
+            self._decompressor = zlib.decompressobj()
+
+    def _fill(self, size):
+        """
+        Reads from the stream until at least size bytes are buffered, or the
+        stream ends.
+        """
+        chunks = [self._buffer[self._position:]]
+        available = len(chunks[0])
+        while(available < size):
+            chunk = self._stream.read(_READ_CHUNK_SIZE)
+            if(not chunk):
+                break
+            if(self._decompressor is not None):
+                try:
+                    chunk = self._decompressor.decompress(chunk)
+                except zlib.error, e:
+                    raise InvalidBinaryFormatError("Corrupt compressed " \
+                        "binary stream: %s" % str(e))
+            chunks.append(chunk)
+            available += len(chunk)
+        self._buffer = ''.join(chunks)
+        self._position = 0
+
+    def read(self, size):
+        """
+        Reads exactly size raw bytes from the body of the stream.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the stream ends prematurely.
+        """
+        if(len(self._buffer) - self._position < size):
+            self._fill(size)
+            if(len(self._buffer) < size):
+                raise InvalidBinaryFormatError("Unexpected end of binary " \
+                                               "stream.")
+        data = self._buffer[self._position:self._position + size]
+        self._position += size
+        return data
+
+    def read_uint(self):
+        """
+        Reads an unsigned 4-byte integer.
+        """
+        return struct.unpack('>I', self.read(4))[0]
+
+    def read_string(self):
+        """
+        Reads a length-prefixed byte string.
+        """
+        return self.read(self.read_uint())
+
+    def read_values(self, count, width):
+        """
+        Reads count big integers stored as fixed-width strings of width
+        bytes each.
+
+        Returns:
+            values::list    -- The list of values, as longs.
+        """
+        data = hexlify(self.read(count * width))
+        hex_width = width * 2
+        return [long(data[i:i + hex_width], 16)
+                for i in xrange(0, count * hex_width, hex_width)]
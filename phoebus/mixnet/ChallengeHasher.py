@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  ChallengeHasher.py :
+#
+#  This file provides ChallengeHasher, an incremental SHA-256 hash of
+#  ciphertext collections used to compute the Fiat-Shamir challenge of a
+#  ShufflingProof.
+#
+#  Collections can be fed to the hasher one at a time, as soon as they are
+#  produced, so that hashing overlaps with the generation of the proof.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+from hashlib import sha256
+from binascii import unhexlify
+import struct
+
+
+# Challenge hash versions:
+#
+#   1) Legacy: each gamma and delta value is hashed as the string returned by
+#      python's hex(...) (eg. "0x1fL"). Used by proofs stored before the
+#      challenge version was recorded.
+#
+#   2) Each collection is hashed as its length and, for each ciphertext, its
+#      number of blocks (as 4-byte big-endian integers) followed by each
+#      gamma and delta value as a fixed-width big-endian byte string of the
+#      size of the prime.
+CHALLENGE_VERSION_LEGACY = 1
+CHALLENGE_VERSION_FIXED_WIDTH = 2
+
+CHALLENGE_VERSIONS = (CHALLENGE_VERSION_LEGACY, CHALLENGE_VERSION_FIXED_WIDTH)
+
+
+class ChallengeHasher:
+    """
+    An incremental hash of ciphertext collections for ShufflingProof.
+
+    Create a hasher, feed it every collection in order using
+    update_collection(...) and obtain the challenge with
+    hexdigest(public_key). Both the original and the fixed-width encoding
+    are supported (see the CHALLENGE_VERSION_* constants).
+
+    Attributes:
+        version::int    -- The challenge version used to encode values.
+    """
+
+    def __init__(self, nbits, version=CHALLENGE_VERSION_FIXED_WIDTH):
+        """
+        Creates a new (empty) challenge hasher.
+
+        Arguments:
+            nbits::int      -- Size in bits of the cryptosystem of the
+                               collections to be hashed.
+            version::int    -- One of CHALLENGE_VERSIONS.
+
+        Throws:
+            ValueError  -- If version is not a known challenge version.
+        """
+        if(version not in CHALLENGE_VERSIONS):
+            raise ValueError("Unknown shuffling proof challenge version %s. " \
+                             "Known versions are: %s." % \
+                             (version, CHALLENGE_VERSIONS))
+        self.version = version
+        self._hash = sha256()
+        # Number of hexadecimal digits of a value of nbits bits, rounded up
+        # to whole bytes.
+        self._hex_width = ((nbits + 7) / 8) * 2
+
+    def update_collection(self, collection):
+        """
+        Adds a collection to the hash, ciphertext by ciphertext, in order, and
+        each ciphertext block by block, in order.
+
+        Arguments:
+            collection::CiphertextCollection    -- The collection to hash.
+
+        Throws:
+            ValueError  -- If a value of the collection does not fit in the
+                           fixed-width encoding (fixed-width version only).
+        """
+        update = self._hash.update
+
+        if(self.version == CHALLENGE_VERSION_LEGACY):
+            for ciphertext in collection:
+                for (gamma, delta) in ciphertext:
+                    update(hex(gamma))
+                    update(hex(delta))
+            return
+
+        width = self._hex_width
+        limit = 1 << (width * 4)
+        update(struct.pack('>I', collection.get_length()))
+        for ciphertext in collection:
+            update(struct.pack('>I', ciphertext.get_length()))
+            for (gamma, delta) in ciphertext:
+                if(not (0 <= gamma < limit and 0 <= delta < limit)):
+                    raise ValueError("Ciphertext value out of range for the " \
+                                     "cryptosystem's bit size.")
+                update(unhexlify('%0*x%0*x' % (width, gamma, width, delta)))
+
+    def hexdigest(self, public_key):
+        """
+        Adds the fingerprint of the public key to the hash and returns it.
+
+        Arguments:
+            public_key::PublicKey   -- The public key of the collections.
+
+        Returns:
+            challenge::string - A 256-bit challenge, as a hexadecimal number
+                encoded as a string.
+        """
+        c = self._hash.copy()
+        c.update(public_key.get_fingerprint())
+        return c.hexdigest()
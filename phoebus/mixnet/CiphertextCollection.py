@@ -38,9 +38,15 @@
 # THE SOFTWARE.
 # ============================================================================
 
+# Use configuration parameters from params.py
+import params
+
+from BinaryFormat import (BinaryWriter, BinaryReader, value_width,
+                          MAGIC_CIPHERTEXT_COLLECTION)
 from PVCExceptions import (InvalidCiphertextCollectionMappingError,
                            IncompatibleCiphertextCollectionError,
-                           IncompatibleCiphertextError)
+                           IncompatibleCiphertextError,
+                           InvalidBinaryFormatError)
 
 class CiphertextCollection:
     """
@@ -74,6 +80,37 @@ class CiphertextCollection:
 
         return coll
 
+    @classmethod
+    def from_values(cls, pk, nbits, values):
+        """
+        Builds a collection from the raw integers of its ciphertexts.
+
+        This is the cheapest way to load a collection from ciphertexts held
+        in another representation: no intermediate objects are built and the
+        public key fingerprint of the ciphertexts is not checked one by one.
+
+        Arguments:
+            pk::PublicKey   -- The public key of the collection.
+            nbits::int      -- Size in bits of the cryptosystem.
+            values::iterable    -- For each ciphertext, the list of the
+                                   gamma and delta values of its blocks, in
+                                   the order gamma0, delta0, gamma1, delta1...
+
+        Returns:
+            collection::CiphertextCollection    -- The new collection.
+        """
+        from .Ciphertext import Ciphertext
+        collection = cls(pk)
+        pk_fingerprint = collection._pk_fingerprint
+        append = collection._ciphertexts.append
+        for ciphertext_values in values:
+            ciphertext = Ciphertext(nbits, pk_fingerprint)
+            ciphertext.gamma = ciphertext_values[0::2]
+            ciphertext.delta = ciphertext_values[1::2]
+            append(ciphertext)
+
+        return collection
+
     def to_dict(self):
         data = {'ciphertexts': []}
         for cipher in self._ciphertexts:
@@ -81,6 +118,82 @@ class CiphertextCollection:
 
         return data
 
+    def to_stream(self, stream, compress=None):
+        """
+        Writes this collection to a file-like object in binary format.
+
+        (see BinaryFormat.py)
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            compress::bool  -- Whether to compress the data. If None,
+                               params.BINARY_FORMAT_COMPRESSION is used.
+        """
+        writer = BinaryWriter(stream, MAGIC_CIPHERTEXT_COLLECTION, compress)
+        width = value_width(self.public_key.cryptosystem.get_nbits())
+        writer.write_uint(width)
+        self._write_binary(writer, width)
+        writer.close()
+
+    @classmethod
+    def from_stream(cls, stream, pk, nbits):
+        """
+        Reads a collection written by to_stream(...) from a file-like object.
+
+        Arguments:
+            stream::file    -- A file-like object open for reading.
+            pk::PublicKey   -- The public key of the collection.
+            nbits::int      -- Size in bits of the cryptosystem.
+
+        Returns:
+            collection::CiphertextCollection    -- The collection read.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the data is not a valid binary
+                                           ciphertext collection.
+        """
+        reader = BinaryReader(stream, MAGIC_CIPHERTEXT_COLLECTION)
+        width = reader.read_uint()
+        if(width != value_width(nbits)):
+            raise InvalidBinaryFormatError("The binary collection was " \
+                "written for a different cryptosystem bit size.")
+        return cls._read_binary(reader, pk, nbits, width)
+
+    def _write_binary(self, writer, width):
+        """
+        Writes the body of this collection with the given BinaryWriter.
+
+        The collection is stored as its number of ciphertexts, followed by,
+        for each ciphertext, its number of blocks and the gamma and delta
+        values of each block, as values of width bytes.
+        """
+        writer.write_uint(len(self._ciphertexts))
+        for ciphertext in self._ciphertexts:
+            length = ciphertext.get_length()
+            values = [0] * (2 * length)
+            values[0::2] = ciphertext.gamma
+            values[1::2] = ciphertext.delta
+            writer.write_uint(length)
+            writer.write_values(values, width)
+
+    @classmethod
+    def _read_binary(cls, reader, pk, nbits, width):
+        """
+        Reads the body of a collection written by _write_binary(...).
+        """
+        from .Ciphertext import Ciphertext
+        collection = cls(pk)
+        pk_fingerprint = collection._pk_fingerprint
+        for i in xrange(0, reader.read_uint()):
+            length = reader.read_uint()
+            values = reader.read_values(2 * length, width)
+            ciphertext = Ciphertext(nbits, pk_fingerprint)
+            ciphertext.gamma = values[0::2]
+            ciphertext.delta = values[1::2]
+            collection._ciphertexts.append(ciphertext)
+
+        return collection
+
     def get_length(self):
         """
         Returns the number of ciphertexts in the collection.
@@ -180,7 +293,9 @@ class CiphertextCollection:
         self._ciphertexts.append(ciphertext)
 
 
-    def shuffle_with_proof(self):
+    def shuffle_with_proof(self, mapping=None, rounds=None, on_shuffle=None,
+                           on_round=None, factor_pool=None,
+                           proof_backend=None):
         """
         Produce a verifiable shuffle of this ciphertext collection.
 
@@ -201,9 +316,36 @@ class CiphertextCollection:
         http://www.usenix.org/event/evt06/tech/full_papers/benaloh/benaloh.pdf
         for more information.)
 
+        A long shuffle can be checkpointed and resumed: on_shuffle and
+        on_round are called with the secret data generated so far, and a
+        later call given that same data (as mapping and rounds) continues
+        where the previous one stopped.
+
+        Arguments:
+            mapping::CiphertextCollectionMapping --
+                The mapping to shuffle with, as given to on_shuffle by an
+                interrupted call. If None, a new random mapping is used.
+            rounds::list    -- The rounds of the proof generated by an
+                               interrupted call (see ShufflingProof.new).
+            on_shuffle::function --
+                If given, on_shuffle(mapping) is called with the (secret)
+                mapping of a new shuffle before its proof is generated.
+            on_round::function --
+                If given, it is called as each round of the proof is generated
+                (see ShufflingProof.new).
+            factor_pool::ReencryptionFactorPool --
+                If given, the shuffle and its proof use precomputed
+                re-encryption factors from this pool, as long as it has
+                enough of them.
+            proof_backend::string   --
+                The kind of proof to generate (see ProofBackends.py). If None,
+                params.SHUFFLING_PROOF_BACKEND is used. rounds, on_round and
+                the factor pool (for the proof) are only used by the 'benaloh'
+                backend, whose proof is made of rounds.
+
         Returns:
             (shuffled_collection, proof)::
-                (CiphertextCollection, ShufflingProof)
+                (CiphertextCollection, ShufflingProof or ShuffleArgument)
                 --
 
                     shuffled_collection is a shuffled version of the current
@@ -219,7 +361,12 @@ class CiphertextCollection:
         Throws:
             ValueError --
                 If params.SHUFFLING_PROOF_SECURITY_PARAMETER is within an
-                invalid range.
+                invalid range, or proof_backend is not a known backend.
+            IncompatibleCiphertextCollectionError --
+                If the given mapping is not a mapping of this collection.
+            InvalidCiphertextCollectionMappingError --
+                If the backend cannot prove a shuffle of this collection
+                with this mapping (see ShuffleArgument).
         """
         # Import CiphertextCollectionMapping and ShufflingProof
 
@@ -238,21 +385,40 @@ class CiphertextCollection:
         ##
         from CiphertextCollectionMapping import CiphertextCollectionMapping
         from ShufflingProof import ShufflingProof
+        from ProofBackends import get_proof_class
+
+        # Get the proof class of the backend
+        if(proof_backend is None):
+            proof_backend = params.SHUFFLING_PROOF_BACKEND
+        proof_class = get_proof_class(proof_backend)
 
         # Create a mapping from the current collection into a random shuffling
-        mapping = CiphertextCollectionMapping.new(self)
+        resumed = mapping is not None
+        if(not resumed):
+            mapping = CiphertextCollectionMapping.new(self, factor_pool)
+            if(on_shuffle is not None):
+                on_shuffle(mapping)
 
         # Apply the mapping to obtain the resulting shuffled collection
         try:
             shuffled_collection = mapping.apply(self)
         except IncompatibleCiphertextCollectionError:
+            if(resumed):
+                # The given mapping is not a mapping of this collection
+                raise
             assert False, "IncompatibleCiphertextCollectionError may not be " \
                         "raised when applying a mapping M created using " \
                         "CiphertextCollectionMapping.new(C) to the same C."
 
         # Generate the zero-knowledge proof of shuffling
+        if(proof_class is not ShufflingProof):
+            # InvalidCiphertextCollectionMappingError is raised if the
+            # collection or mapping are not supported by the backend.
+            proof = proof_class.new(self, shuffled_collection, mapping)
+            return (shuffled_collection, proof)
         try:
-            proof = ShufflingProof.new(self, shuffled_collection, mapping)
+            proof = ShufflingProof.new(self, shuffled_collection, mapping,
+                                       rounds, on_round, factor_pool)
         except InvalidCiphertextCollectionMappingError:
             assert False, "InvalidCiphertextCollectionMappingError may not be " \
                         "raised when shuffled_collection was created from the " \
@@ -49,35 +49,47 @@ from Crypto.Random.random import StrongRandom
 
 # Use configuration parameters from params.py
 import params
-import billiard
 
+import struct
+
+from WorkerPool import WorkerPool
+from BinaryFormat import (BinaryWriter, BinaryReader, value_width,
+                          MAGIC_COLLECTION_MAPPING)
 from CiphertextCollection import CiphertextCollection
 from .CiphertextReencryptionInfo import CiphertextReencryptionInfo
 # Exceptions:
 from PVCExceptions import IncompatibleCiphertextCollectionError
 from PVCExceptions import IncompatibleReencryptionInfoError
 from PVCExceptions import IncompatibleCiphertextCollectionMappingError
+from PVCExceptions import InvalidBinaryFormatError
+
 
+# Kinds of re-encryption information in the binary format of a mapping
+_REENCRYPTION_PAIRS = 0
+_REENCRYPTION_EXPONENTS = 1
 
-def new_collection_mapping(original_collection):
+
+def count_blocks(collection):
     """
-    CiphertextCollectionMapping.new wrapper, to be used with multiprocessing
-    module.
+    Returns the total number of blocks of the ciphertexts of collection, that
+    is, the number of re-encryption factors needed to shuffle it.
     """
-    from Crypto.Random import atfork; atfork()
-    return CiphertextCollectionMapping.new(original_collection)
-
+    return sum(ciphertext.get_length() for ciphertext in collection)
 
-def calculate_subtraction(params):
-    mapping, result, other_mapping, i = params
-    indB = mapping._reordering[i]  # indB is the index of the element in B
-    indC = other_mapping._reordering[i] # index in C
 
-    # Now, we get the re-encryption from a \in A to b \in B
-    atob_reencryption = mapping._reencryptions[i]
+def calculate_subtraction(shared, element):
+    """
+    Computes an element of a rebase, to be used with WorkerPool.map.
+    (see CiphertextCollectionMapping.rebase)
 
-    # and the corresponding one from a to c \in C
-    atoc_reencryption = other_mapping._reencryptions[i]
+    The element is given as (i, indB, atob_reencryption, indC,
+    atoc_reencryption), for the ith element of the origin collection. These
+    are secret, so they are passed as the indexes of WorkerPool.map, through
+    the pipes of the pool, and shared is unused.
+    """
+    # indB is the index of the element in B, indC its index in C, and the
+    # re-encryptions go from a \in A to b \in B and to c \in C
+    i, indB, atob_reencryption, indC, atoc_reencryption = element
 
     # Generate the c-to-b re-encryption by subtracting a-to-c from
     # a-to-b.
@@ -196,8 +208,112 @@ class CiphertextCollectionMapping:
 
         return data
 
+    def to_stream(self, stream, compress=None):
+        """
+        Writes this mapping to a file-like object in binary format.
+
+        A mapping is secret information for whoever shuffles a collection.
+        This is used to checkpoint a shuffle in progress (see
+        ShufflingProof.new(...)), and must never be published.
+        (see BinaryFormat.py)
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            compress::bool  -- Whether to compress the data. If None,
+                               params.BINARY_FORMAT_COMPRESSION is used.
+        """
+        writer = BinaryWriter(stream, MAGIC_COLLECTION_MAPPING, compress)
+        # (an empty mapping has no values, nor a public key to size them)
+        width = 0
+        if(len(self._reencryptions) > 0):
+            public_key = self._reencryptions[0].public_key
+            width = value_width(public_key.cryptosystem.get_nbits())
+        writer.write_uint(width)
+        self._write_binary(writer, width)
+        writer.close()
+
     @classmethod
-    def new(cls, collection):
+    def from_stream(cls, stream, pk, nbits):
+        """
+        Reads a mapping written by to_stream(...) from a file-like object.
+
+        Arguments:
+            stream::file    -- A file-like object open for reading.
+            pk::PublicKey   -- The public key of the mapped collections.
+            nbits::int      -- Size in bits of the cryptosystem.
+
+        Returns:
+            mapping::CiphertextCollectionMapping    -- The mapping read.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the data is not a valid binary
+                                           collection mapping.
+        """
+        reader = BinaryReader(stream, MAGIC_COLLECTION_MAPPING)
+        width = reader.read_uint()
+        if(width != value_width(nbits)):
+            if(width == 0 and reader.read_uint() == 0):
+                return cls()
+            raise InvalidBinaryFormatError("The binary mapping was written " \
+                "for a different cryptosystem bit size.")
+        return cls._read_binary(reader, pk, nbits, width)
+
+    def _write_binary(self, writer, width):
+        """
+        Writes this mapping with the given BinaryWriter (see BinaryFormat.py).
+
+        The mapping is stored as its length, the re-ordering indexes and, for
+        each re-encryption, its kind (_REENCRYPTION_PAIRS or
+        _REENCRYPTION_EXPONENTS), its number of blocks and either its
+        (g^r, y^r) values or its r values, as values of width bytes.
+        """
+        length = len(self._reordering)
+        writer.write_uint(length)
+        writer.write(struct.pack('>%dI' % length, *self._reordering))
+        for reencryption in self._reencryptions:
+            if(reencryption.stores_exponents()):
+                writer.write_uint(_REENCRYPTION_EXPONENTS)
+                values = reencryption._exponents
+            else:
+                writer.write_uint(_REENCRYPTION_PAIRS)
+                values = []
+                for (gr, yr) in reencryption:
+                    values.append(gr)
+                    values.append(yr)
+            writer.write_uint(reencryption.get_length())
+            writer.write_values(values, width)
+
+    @classmethod
+    def _read_binary(cls, reader, pk, nbits, width):
+        """
+        Reads a mapping written by _write_binary(...).
+        """
+        mapping = cls()
+        length = reader.read_uint()
+        mapping._reordering = \
+            list(struct.unpack('>%dI' % length, reader.read(4 * length)))
+        for i in xrange(0, length):
+            # (version 1 streams only contain pairs)
+            kind = _REENCRYPTION_PAIRS
+            if(reader.version >= 2):
+                kind = reader.read_uint()
+
+            reencryption = CiphertextReencryptionInfo(pk)
+            if(kind == _REENCRYPTION_EXPONENTS):
+                reencryption._exponents = \
+                    reader.read_values(reader.read_uint(), width)
+            elif(kind == _REENCRYPTION_PAIRS):
+                values = reader.read_values(2 * reader.read_uint(), width)
+                reencryption._blocks = zip(values[0::2], values[1::2])
+            else:
+                raise InvalidBinaryFormatError("Unknown re-encryption kind " \
+                                               "%d in binary mapping." % kind)
+            mapping._reencryptions.append(reencryption)
+
+        return mapping
+
+    @classmethod
+    def new(cls, collection, factor_pool=None):
         """
         Generate a new mapping compatible with the given collection.
 
@@ -216,6 +332,9 @@ class CiphertextCollectionMapping:
         Arguments:
             collection::CiphertextCollection -- The collection for which we
                                                 wish to generate a new mapping.
+            factor_pool::ReencryptionFactorPool --
+                If given, the re-encryptions use precomputed factors drawn
+                from this pool, as long as it has enough of them.
 
         Returns:
             mapping::CiphertextCollectionMapping --
@@ -237,11 +356,23 @@ class CiphertextCollectionMapping:
         ### random.shuffle(self._reordering) is broken upstream, workaround:
         _random_shuffle_in_place(random, mapping._reordering)
 
+        # Draw precomputed re-encryption factors, if any
+        factors = []
+        if(factor_pool is not None):
+            factors = factor_pool.take(count_blocks(collection))
+        position = 0
+
         # Generate a random re-encryption for each ciphertext in the collection
         for ciphertext in collection:
             ciphertext_len = ciphertext.get_length()
+            ciphertext_factors = None
+            if(position + ciphertext_len <= len(factors)):
+                ciphertext_factors = \
+                    factors[position:position + ciphertext_len]
+                position += ciphertext_len
             reencryption = \
-                CiphertextReencryptionInfo.new(public_key, ciphertext_len)
+                CiphertextReencryptionInfo.new(public_key, ciphertext_len,
+                                               ciphertext_factors)
             mapping._reencryptions.append(reencryption)
 
         # Return the generated mapping
@@ -328,7 +459,7 @@ class CiphertextCollectionMapping:
 
         return shuffled_collection
 
-    def verify(self, original_collection, shuffled_collection):
+    def verify(self, original_collection, shuffled_collection, batch=True):
         """
         Verify that the given collections are mapped by the current mapping.
 
@@ -348,12 +479,21 @@ class CiphertextCollectionMapping:
         Zero-Knowledge. ShufflingProof must be used instead to provide a
         Zero-Knowledge proof of equivalence between two ciphertext collections.
 
+        By default, all the re-encryption relations of the mapping are checked
+        at once by a randomized linear combination (see _batch_verify). Batch
+        verification may accept an invalid mapping with probability at most
+        2^{-params.BATCH_VERIFICATION_SECURITY_PARAMETER}, but never rejects a
+        valid one. If batch is False, each relation is checked individually.
+        Use locate_failure(...) to find which ciphertext does not match when
+        verification fails.
+
         Arguments:
             original_collection::CiphertextCollection   --
                 The original collection of ciphertexts.
             shuffled_collection::CiphertextCollection   --
                 Another collection for which we wish to know if said collection
                 was obtained by applying this mapping to original_collection.
+            batch::bool -- Whether to use batch verification (default True).
 
         Returns:
             result::bool    -- True if shuffled_collection can be obtained from
@@ -361,12 +501,250 @@ class CiphertextCollectionMapping:
                                mapping.
                                False otherwise.
         """
-        try:
-            original_shuffled = self.apply(original_collection)
-        except IncompatibleCiphertextCollectionError:
+        # The chunks only check the images of their own ciphertexts, so a
+        # reordering sending two ciphertexts to the same index must be
+        # rejected for the whole mapping first.
+        if(not self.is_permutation()):
+            return False
+
+        return self.verify_chunk(original_collection, shuffled_collection,
+                                 0, len(self._reencryptions), batch)
+
+    def is_permutation(self):
+        """
+        Checks that the reordering of this mapping is a permutation.
+
+        verify_chunk(...) only checks the ciphertexts a chunk maps to, so it
+        cannot detect two ciphertexts being mapped to the same index, which
+        would leave some other index of the shuffled collection unchecked.
+        Any verification of a whole mapping must check this first.
+
+        Returns:
+            result::bool    -- True if the reordering maps the indexes
+                               [0, length) to themselves one-to-one.
+                               False otherwise.
+        """
+        return sorted(self._reordering) == range(len(self._reencryptions))
+
+    def verify_chunk(self, original_collection, shuffled_collection,
+                     start, end, batch=True):
+        """
+        Verify the mapping for a contiguous chunk of the original collection.
+
+        This performs the same verification as verify(...), but only for the
+        ciphertexts of original_collection with index in [start, end) and
+        their images in shuffled_collection. A mapping is valid if and only if
+        its reordering is a permutation (see is_permutation()) and all the
+        chunks of a partition of [0, length) are valid, which allows
+        verifying a large mapping in parallel.
+
+        Arguments:
+            original_collection::CiphertextCollection   --
+                The original collection of ciphertexts.
+            shuffled_collection::CiphertextCollection   --
+                The purported shuffle of original_collection.
+            start::int  -- Index of the first ciphertext of the chunk.
+            end::int    -- Index after the last ciphertext of the chunk.
+            batch::bool -- Whether to use batch verification (default True).
+
+        Returns:
+            result::bool    -- True if the mapping holds for the given chunk.
+                               False otherwise.
+        """
+        if(not self._is_compatible(original_collection, shuffled_collection,
+                                   start, end)):
             return False
 
-        return (original_shuffled == shuffled_collection)
+        if(batch):
+            return self._batch_verify(original_collection, shuffled_collection,
+                                      start, end)
+
+        for i in range(start, end):
+            original = original_collection[i]
+            shuffled = shuffled_collection[self._reordering[i]]
+            if(not self._reencryptions[i].verify(original, shuffled)):
+                return False
+
+        return True
+
+    def _is_compatible(self, original_collection, shuffled_collection,
+                       start, end):
+        """
+        Checks that both collections have the shape expected by this mapping.
+
+        This checks that the collections have the same length as the mapping,
+        that each ciphertext has the same number of blocks as its
+        re-encryption information, that all ciphertexts were encrypted with
+        the mapping's public key and that all values of the shuffled
+        collection are reduced modulo p. Only the ciphertexts of
+        original_collection with index in [start, end) and their images are
+        checked.
+
+        Arguments:
+            original_collection::CiphertextCollection   --
+                The original collection of ciphertexts.
+            shuffled_collection::CiphertextCollection   --
+                The purported shuffle of original_collection.
+            start::int  -- Index of the first ciphertext to check.
+            end::int    -- Index after the last ciphertext to check.
+
+        Returns:
+            result::bool    -- True if verify(...) can compare the collections
+                               relation by relation, False otherwise.
+        """
+        length = len(self._reencryptions)
+        assert length == len(self._reordering)
+
+        if(original_collection.get_length() != length or
+           shuffled_collection.get_length() != length):
+            return False
+
+        if(not (0 <= start <= end <= length)):
+            return False
+
+        if(start == end):
+            return True
+
+        # Compute the fingerprint only once for the whole collection
+        public_key = self._reencryptions[start].public_key
+        pk_fingerprint = public_key.get_fingerprint()
+        prime = public_key.cryptosystem.get_prime()
+
+        for i in range(start, end):
+            reencryption = self._reencryptions[i]
+            original = original_collection[i]
+            shuffled = shuffled_collection[self._reordering[i]]
+
+            if(original.pk_fingerprint != pk_fingerprint or
+               shuffled.pk_fingerprint != pk_fingerprint or
+               original.nbits != shuffled.nbits):
+                return False
+
+            block_count = reencryption.get_length()
+            if(original.get_length() != block_count or
+               shuffled.get_length() != block_count):
+                return False
+
+            if(reencryption.stores_exponents()):
+                for r in reencryption._exponents:
+                    if(not (0 <= r < prime - 1)):
+                        return False
+
+            for j in range(0, block_count):
+                if(not (0 <= shuffled.gamma[j] < prime and
+                        0 <= shuffled.delta[j] < prime)):
+                    return False
+
+        return True
+
+    def _batch_verify(self, original_collection, shuffled_collection,
+                      start, end):
+        """
+        Checks the re-encryption relations of a chunk of this mapping at once.
+
+        For each block of each ciphertext, the mapping claims that
+        B = R * A (mod p), for A the original block, R the re-encryption
+        information and B the shuffled block (and likewise for the delta
+        components). Each difference D = R * A - B is computed over the
+        integers and combined into a single sum S = sum(s * D) using small
+        random coefficients s. If all relations hold, S is 0 (mod p).
+        Otherwise, since p is a prime larger than the coefficients, S is 0
+        (mod p) with probability at most 2^{-bits} for bits the size of the
+        random coefficients. This replaces one modular reduction per value
+        with a single one for the whole collection.
+
+        Only the ciphertexts of original_collection with index in
+        [start, end) and their images are checked. Both collections must have
+        been checked with _is_compatible(...) first.
+
+        (see Bellare, Garay and Rabin, "Fast Batch Verification for Modular
+        Exponentiation and Digital Signatures", EUROCRYPT 1998)
+
+        Arguments:
+            original_collection::CiphertextCollection   --
+                The original collection of ciphertexts.
+            shuffled_collection::CiphertextCollection   --
+                The purported shuffle of original_collection.
+            start::int  -- Index of the first ciphertext to check.
+            end::int    -- Index after the last ciphertext to check.
+
+        Returns:
+            result::bool    -- False if any relation does not hold, True
+                               otherwise (up to the error probability above).
+        """
+        if(start == end):
+            return True
+
+        prime = self._reencryptions[start].public_key.cryptosystem.get_prime()
+        bits = params.BATCH_VERIFICATION_SECURITY_PARAMETER
+        random = StrongRandom()
+
+        gamma_sum = 0
+        delta_sum = 0
+        for i in range(start, end):
+            original = original_collection[i]
+            shuffled = shuffled_collection[self._reordering[i]]
+            reencryption = self._reencryptions[i]
+
+            for j in range(0, reencryption.get_length()):
+                gr, yr = reencryption[j]
+                s = random.getrandbits(bits)
+                gamma_sum += s * (gr * original.gamma[j] - shuffled.gamma[j])
+                delta_sum += s * (yr * original.delta[j] - shuffled.delta[j])
+
+        return (gamma_sum % prime == 0 and delta_sum % prime == 0)
+
+    def locate_failure(self, original_collection, shuffled_collection):
+        """
+        Finds the first ciphertext for which this mapping does not hold.
+
+        Each re-encryption relation is checked individually, so this is slower
+        than batch verification. It is meant to be used to locate the failure
+        once verify(...) returns False.
+
+        Arguments:
+            original_collection::CiphertextCollection   --
+                The original collection of ciphertexts.
+            shuffled_collection::CiphertextCollection   --
+                The purported shuffle of original_collection.
+
+        Returns:
+            index::int  -- The index in original_collection of the first
+                           ciphertext that is not correctly re-encrypted into
+                           shuffled_collection, or None if all ciphertexts
+                           are.
+
+        Throws:
+            IncompatibleCiphertextCollectionError --
+                If the collections are not compatible with this mapping.
+        """
+        length = len(self._reencryptions)
+        if(not self.is_permutation() or
+           not self._is_compatible(original_collection, shuffled_collection,
+                                   0, length)):
+            raise IncompatibleCiphertextCollectionError( \
+                    "The given collections are incompatible with this " \
+                    "mapping. Both collections must contain %d ciphertexts " \
+                    "encrypted with the public key and block layout of the " \
+                    "mapping's re-encryptions." % length)
+
+        for i in range(0, length):
+            original = original_collection[i]
+            shuffled = shuffled_collection[self._reordering[i]]
+            if(not self._reencryptions[i].verify(original, shuffled)):
+                return i
+
+        return None
+
+    def _stores_exponents(self):
+        """
+        Returns True if all the re-encryptions of this mapping store
+        exponents (see CiphertextReencryptionInfo.stores_exponents()).
+        """
+        for reencryption in self._reencryptions:
+            if(not reencryption.stores_exponents()):
+                return False
+        return True
 
     def rebase(self, other_mapping):
         """
@@ -453,14 +831,23 @@ class CiphertextCollectionMapping:
 
         # Calculate C->B element by element, in the order of the element's
         # index in A.
-        pool = billiard.Pool()
-        async_params = [(self, result, other_mapping, index) for index in range(0, length)]
-        results = pool.map_async(calculate_subtraction, async_params)
-        for reencryption, cindex, bindex in results.get(99999999):
+        elements = [(i, self._reordering[i], self._reencryptions[i],
+                     other_mapping._reordering[i],
+                     other_mapping._reencryptions[i])
+                    for i in range(0, length)]
+        if(self._stores_exponents() and other_mapping._stores_exponents()):
+            # Subtracting exponents is cheaper than sending the mappings to
+            # the workers.
+            subtractions = [calculate_subtraction(None, element)
+                            for element in elements]
+        else:
+            # (The mappings are secret: they are never written to the shared
+            # file of the workers, their elements are sent with the tasks)
+            subtractions = WorkerPool.get().map(calculate_subtraction, None,
+                                                elements)
+        for reencryption, cindex, bindex in subtractions:
             result._reencryptions[cindex] = reencryption
             result._reordering[cindex] = bindex
-        pool.close()
-        pool.join()
 
         # Do some resource intensive checks to ensure that result has the right
         # structure (only in debug mode)
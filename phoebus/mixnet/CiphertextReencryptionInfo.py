@@ -42,7 +42,11 @@
 # secure version of python's random:
 from Crypto.Random.random import StrongRandom
 
+# Use configuration parameters from params.py
+import params
+
 from Ciphertext import Ciphertext
+from arithmetic import invert
 
 from PVCExceptions import (IncompatibleCiphertextError,
                            IncompatibleReencryptionInfoError)
@@ -61,6 +65,13 @@ class CiphertextReencryptionInfo:
     and iterable, and behave as a list of pairs (g^{r'}, y^{r'}) when accessed
     so.
 
+    Alternatively, only the exponent r' of each block may be stored (see
+    stores_exponents()), in which case the pairs (g^{r'}, y^{r'}) are
+    computed when first needed, using the fixed-base tables of the public
+    key. Exponents take half the space of the pairs, and subtracting two
+    re-encryptions is then a subtraction of exponents instead of a modular
+    inversion.
+
     Given the two ciphertexts and the corresponding CiphertextReencryptionInfo
     object, the fact that they both are different encryptions of the same
     plaintext can be verified without decryption. If the origin ciphertext is
@@ -80,30 +91,76 @@ class CiphertextReencryptionInfo:
                                    encrypt the original ciphertext.
     """
 
-    # NOTE: Would just storing r' per block instead of (g^{r'}, y^{r'})
-    # be secure?
-    # The answer seems to be yes, consider refactoring
+    # NOTE: Storing r' per block instead of (g^{r'}, y^{r'}) is secure: the
+    # mapping revealed by the shuffling proof is between the original (or
+    # shuffled) collection and an independent random shuffle, so r' (like
+    # (g^{r'}, y^{r'})) is uniformly random and unrelated to the secret
+    # mapping.
 
     @classmethod
     def from_dict(cls, d, pk, nbits):
         reenc = cls(pk)
-        for block in d['blocks']:
-            reenc._blocks.append(block)
+        if 'exponents' in d:
+            reenc._exponents = []
+            for exponent in d['exponents']:
+                reenc._exponents.append(exponent)
+        else:
+            for block in d['blocks']:
+                reenc._blocks.append(block)
 
         return reenc
 
     def to_dict(self):
+        if(self._exponents is not None):
+            return {'exponents': list(self._exponents)}
+
         data = {'blocks': []}
         for block in self._blocks:
             data['blocks'].append(block)
         return data
 
+    def __getstate__(self):
+        """
+        Pickle support: the (g^{r'}, y^{r'}) pairs computed from stored
+        exponents are not pickled, as they can be recomputed.
+        """
+        state = self.__dict__.copy()
+        if(self._exponents is not None):
+            state['_blocks'] = []
+            state['_blocks_exponents'] = None
+        return state
+
+    def stores_exponents(self):
+        """
+        Returns True if this object stores the exponents r' of each block,
+        False if it stores the pairs (g^{r'}, y^{r'}).
+        """
+        return (self._exponents is not None)
+
     def get_length(self):
         """
         Returns the length in blocks of the re-encryption information.
         """
+        if(self._exponents is not None):
+            return len(self._exponents)
         return len(self._blocks)
 
+    def _get_blocks(self):
+        """
+        Returns the list of (g^{r'}, y^{r'}) pairs, computing them from the
+        stored exponents if needed.
+
+        The computed pairs are cached along with a copy of the exponents they
+        were computed from, and computed again whenever the exponents change.
+        """
+        if(self._exponents is not None and
+           self._blocks_exponents != self._exponents):
+            g_table, y_table = self.public_key.get_fixed_base_tables()
+            self._blocks = [(g_table.pow(r), y_table.pow(r))
+                            for r in self._exponents]
+            self._blocks_exponents = list(self._exponents)
+        return self._blocks
+
     def __getitem__(self, i):
         """
         Makes this object indexable.
@@ -112,18 +169,18 @@ class CiphertextReencryptionInfo:
             (g^{r'}, y^{r'})::(long, long)  -- Returns the ith block of
                                                re-encryption information.
         """
-        length = len(self._blocks)
+        length = self.get_length()
         if(not (0 <= i < length)):
             return ValueError("Index out of range: Got %d, expected index " \
                               "between 0 and %d." % (i, length-1))
 
-        return self._blocks[i]
+        return self._get_blocks()[i]
 
     def __iter__(self):
         """
         Return an iterator for the current CiphertextReencryptionInfo.
         """
-        return self._blocks.__iter__()
+        return self._get_blocks().__iter__()
 
     def __init__(self, public_key):
         """
@@ -134,6 +191,10 @@ class CiphertextReencryptionInfo:
         """
         self.public_key = public_key
         self._blocks = []
+        # List of exponents r', if this object stores exponents
+        self._exponents = None
+        # The exponents from which _blocks was computed, if it was
+        self._blocks_exponents = None
 
     def add_block(self, gr, yr):
         """
@@ -144,10 +205,28 @@ class CiphertextReencryptionInfo:
             yr::long   -- The y^{r'} component of the re-encryption information.
                           (Where y is the public key value)
         """
+        assert self._exponents is None, "Cannot add a (g^{r'}, y^{r'}) " \
+            "block to re-encryption information that stores exponents."
         self._blocks.append((gr, yr))
 
+    def add_exponent(self, r):
+        """
+        Adds a new block of re-encryption information, given as its exponent.
+
+        Can only be used on an empty object or one that already stores
+        exponents.
+
+        Arguments:
+            r::long     -- The exponent r' of the re-encryption information.
+        """
+        if(self._exponents is None):
+            assert len(self._blocks) == 0, "Cannot add an exponent to " \
+                "re-encryption information that stores (g^{r'}, y^{r'}) pairs."
+            self._exponents = []
+        self._exponents.append(r)
+
     @classmethod
-    def new(cls, public_key, length):
+    def new(cls, public_key, length, factors=None):
         """
         Generate a new re-encryption information object with the given length.
 
@@ -155,22 +234,43 @@ class CiphertextReencryptionInfo:
         information, which can be applied to a given ciphertext in order to
         produce a re-encrypted ciphertext.
 
+        If params.REENCRYPTION_STORE_EXPONENTS is set, the new object stores
+        the exponents of each block (see stores_exponents()).
+
         Arguments:
             public_key::PublicKey-- The public key to be used for re-encryption.
                                    This must be the same public key that was
                                    used to encrypt the original ciphertext.
             length::int -- Number of blocks of re-encryption information.
+            factors::list   -- Precomputed (r, g^r, y^r) factors to use for
+                               the blocks, instead of new random ones (see
+                               ReencryptionFactorPool). Must contain length
+                               factors, never used before.
 
         Returns:
             reencryption_info::CiphertextReencryptionInfo   --
                 A new CiphertextReencryptionInfo object containing length
                 random blocks or re-encryption information.
         """
+        store_exponents = params.REENCRYPTION_STORE_EXPONENTS
+
+        if(factors is not None):
+            assert len(factors) == length
+            reencryption_info = CiphertextReencryptionInfo(public_key)
+            for (r, gr, yr) in factors:
+                if(store_exponents):
+                    reencryption_info.add_exponent(r)
+                reencryption_info._blocks.append((gr, yr))
+            if(store_exponents):
+                reencryption_info._blocks_exponents = \
+                    list(reencryption_info._exponents)
+            return reencryption_info
+
         random = StrongRandom()
 
-        # Get p and g
+        # Get p and the fixed-base tables for g and y
         prime = public_key.cryptosystem.get_prime()
-        generator = public_key.cryptosystem.get_generator()
+        g_table, y_table = public_key.get_fixed_base_tables()
 
         # Create a new empty CiphertextReencryptionInfo object
         reencryption_info = CiphertextReencryptionInfo(public_key)
@@ -181,10 +281,14 @@ class CiphertextReencryptionInfo:
             # Select a random integer r, 1 <= r <= p − 2
             r = random.randint(1, prime - 2)
 
-            # store block (g^{r}, y^{r})
-            gr = pow(generator, r, prime)
-            yr = pow(public_key._key, r, prime)
-            reencryption_info.add_block(gr, yr)
+            if(store_exponents):
+                # store r, (g^{r}, y^{r}) is computed when needed
+                reencryption_info.add_exponent(r)
+            else:
+                # store block (g^{r}, y^{r})
+                gr = g_table.pow(r)
+                yr = y_table.pow(r)
+                reencryption_info.add_block(gr, yr)
 
         assert (reencryption_info.get_length() == length)
 
@@ -276,7 +380,9 @@ class CiphertextReencryptionInfo:
         Subtraction of re-encryptions works block by block: if the ith block of
         the current re-encryption is (g^{r_1}, y^{r_1}), and the ith block of
         the other re-encryption given is (g^{r_2}, y^{r_2}), then the ith block
-        of the subtraction is (g^{r_1 - r_2}, y^{r_1 - r_2}).
+        of the subtraction is (g^{r_1 - r_2}, y^{r_1 - r_2}). If both
+        re-encryptions store exponents, so does the result, and its exponents
+        are r_1 - r_2 modulo p - 1 (the order of Z_{p}^{*}).
 
         Note that if we are given c1, a re-encryption of ciphertext c with
         re-encryption information R1, and c2 a re-encryption of c with
@@ -332,15 +438,24 @@ class CiphertextReencryptionInfo:
         # Create a new empty re-encryption to hold the subtraction
         result = CiphertextReencryptionInfo(self.public_key)
 
+        # If we have both exponents, subtract them
+        if(self._exponents is not None and
+           other_reencryption._exponents is not None):
+            order = prime - 1
+            for i in range(0, self.get_length()):
+                r1 = self._exponents[i]
+                r2 = other_reencryption._exponents[i]
+                result.add_exponent((r1 - r2) % order)
+            return result
+
         # Perform the subtraction of self - other_reencryption block by block
         # and store it on result.
         for i in range(0, self.get_length()):
              gr1, yr1 = self[i]                     # g^{r_1} and y^{r_1}
              gr2, yr2 = other_reencryption[i]       # g^{r_2} and y^{r_2}
 
-             # Remember that we can invert in Z_p by elevating to p - 2.
-             inv_gr2 = pow(gr2, prime - 2, prime)   # (g^{r_2})^{-1} = g^{-r_2}
-             inv_yr2 = pow(yr2, prime - 2, prime)   # (y^{r_2})^{-1} = y^{-r_2}
+             inv_gr2 = invert(gr2, prime)   # (g^{r_2})^{-1} = g^{-r_2}
+             inv_yr2 = invert(yr2, prime)   # (y^{r_2})^{-1} = y^{-r_2}
 
              gr = (gr1*inv_gr2) % prime             # g^{r_1 - r_2}
              yr = (yr1*inv_yr2) % prime             # y^{r_1 - r_2}
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  DLogTable.py :
+#
+#  This file provides DLogTable, used to compute small discrete logarithms
+#  modulo a prime, such as the number of votes for each answer of a
+#  homomorphic tally once it has been decrypted to g^votes.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+# Use configuration parameters from params.py
+import params
+from arithmetic import mpz, powmod, invert
+
+
+# Number of times _kangaroo(...) tries a new jump function before giving up
+_KANGAROO_ATTEMPTS = 8
+
+
+def _isqrt(n):
+    """
+    Returns the integer square root of the non-negative integer n.
+    """
+    if(n < 2):
+        return n
+    x = 1 << ((n.bit_length() + 1) / 2)
+    while(True):
+        y = (x + n / x) / 2
+        if(y >= x):
+            return x
+        x = y
+
+
+def _kangaroo(base, value, modulus, lower, upper):
+    """
+    Finds x in [lower, upper] such that base^x = value mod modulus, with
+    Pollard's kangaroo (lambda) method.
+
+    A "tame" kangaroo starts at base^upper and jumps forward, multiplying by
+    base^(2^i) for some i depending only on its current position, and leaves
+    a trap where it stops. A "wild" kangaroo does the same starting at value.
+    Once the wild kangaroo lands on any position of the tame one, they follow
+    the same path and it falls into the trap, which gives x from the
+    distances they have travelled. This takes about 6*sqrt(upper - lower)
+    multiplications and constant memory, but may fail, in which case it is
+    tried again with a different jump function.
+
+    Returns:
+        x::long -- The discrete logarithm of value, or None if it was not
+                   found (either because it is not in [lower, upper] or
+                   because every attempt failed).
+    """
+    width = upper - lower
+
+    # Choose k so that the mean jump (2^k - 1)/k is about sqrt(width)/2
+    k = 1
+    while(((1 << k) - 1) < k * _isqrt(width) / 2):
+        k += 1
+    jumps = [(1 << i) for i in range(0, k)]
+    mean_jump = sum(jumps) / k + 1
+
+    mod = mpz(modulus)
+    factors = [mpz(powmod(base, jump, modulus)) for jump in jumps]
+    value = mpz(value) % mod
+
+    for attempt in range(0, _KANGAROO_ATTEMPTS):
+        # Tame kangaroo: set the trap at base^(upper + tame_distance)
+        trap = mpz(powmod(base, upper, modulus))
+        tame_distance = 0
+        for i in range(0, 4 * mean_jump):
+            index = (trap >> attempt) % k
+            trap = (trap * factors[index]) % mod
+            tame_distance += jumps[index]
+
+        # Wild kangaroo: base^(x + wild_distance)
+        wild = value
+        wild_distance = 0
+        while(wild_distance <= width + tame_distance):
+            if(wild == trap):
+                x = upper + tame_distance - wild_distance
+                if(powmod(base, x, modulus) == value):
+                    return x
+                break
+            index = (wild >> attempt) % k
+            wild = (wild * factors[index]) % mod
+            wild_distance += jumps[index]
+
+    return None
+
+
+class DLogTable:
+    """
+    Computes discrete logarithms in a small range [0, bound].
+
+    Using this class outside of PloneVoteCryptoLib is not recommended. Use
+    DLogTable.get(...) to obtain a (cached) table for a given base, rather
+    than constructing one directly.
+
+    Discrete logarithms are computed with the baby-step giant-step method:
+    the table stores the m "baby steps" base^j for j < m, with m about
+    sqrt(bound), and lookup(value) multiplies value by base^(-m) until it
+    finds one of them, which takes at most bound/m "giant steps". Both the
+    memory and the time needed are thus O(sqrt(bound)), rather than O(bound)
+    for a table of every power up to bound.
+
+    The number of baby steps is limited by params.DLOG_TABLE_MAX_SIZE. For
+    larger bounds, Pollard's kangaroo method (which needs no table at all) is
+    used instead.
+
+    Attributes:
+        base::long  -- The base of the discrete logarithms.
+        modulus::long   -- The (prime) modulus.
+        bound::long -- The largest discrete logarithm looked up by default.
+    """
+
+    # Tables cached by DLogTable.get(...), indexed by (base, modulus).
+    _cache = {}
+
+    @classmethod
+    def get(cls, base, modulus):
+        """
+        Returns a DLogTable for the given base and modulus.
+
+        Tables are cached per process, so that the baby steps computed for
+        one election are reused by every later election with the same
+        generator.
+
+        Arguments:
+            base::long  -- The base of the discrete logarithms.
+            modulus::long   -- The modulus.
+
+        Returns:
+            table::DLogTable    -- A table for base and modulus.
+        """
+        key = (base, modulus)
+        table = cls._cache.get(key)
+        if(table is None):
+            # As in FixedBaseTable, forget all tables once the cache is full.
+            if(len(cls._cache) >= params.DLOG_TABLE_CACHE_SIZE):
+                cls._cache.clear()
+            table = cls(base, modulus)
+            cls._cache[key] = table
+
+        return table
+
+    def __init__(self, base, modulus):
+        """
+        Constructs a new, empty, DLogTable.
+
+        Arguments:
+            (See class attributes)
+        """
+        self.base = base
+        self.modulus = modulus
+        self.bound = 0
+
+        # (baby_steps, last_baby_step, giant_step), where
+        # baby_steps[base^j mod modulus] = j for j < m = len(baby_steps),
+        # last_baby_step = base^(m-1) mod modulus and
+        # giant_step = base^(-m) mod modulus.
+        # Tables are shared, possibly between threads: the three are always
+        # replaced together, so that lookup(...) never sees a giant step
+        # that does not match its baby steps.
+        self._steps = ({1: 0}, 1, invert(base, modulus))
+
+    def precompute(self, up_to):
+        """
+        Makes sure that the table can look up every discrete logarithm in
+        [0, up_to]. The table is never shrunk.
+
+        Arguments:
+            up_to::long -- The new bound, if larger than the current one.
+        """
+        self.bound = max(self.bound, up_to)
+
+        size = min(_isqrt(self.bound) + 1, params.DLOG_TABLE_MAX_SIZE)
+        baby_steps, step, giant_step = self._steps
+        if(size <= len(baby_steps)):
+            return
+
+        # The table is grown on the side, and replaced at once
+        modulus = self.modulus
+        baby_steps = baby_steps.copy()
+        for j in xrange(len(baby_steps), size):
+            step = (step * self.base) % modulus
+            baby_steps[step] = j
+        giant_step = invert((step * self.base) % modulus, modulus)
+        self._steps = (baby_steps, step, giant_step)
+
+    def lookup(self, value, up_to=None):
+        """
+        Finds the discrete logarithm of value, if it is at most up_to.
+
+        Arguments:
+            value::long -- The power of base whose logarithm we want.
+            up_to::long -- The largest logarithm to look for. Defaults to
+                           the bound given to precompute(...).
+
+        Returns:
+            dlog::long  -- x in [0, up_to] such that base^x = value mod
+                           modulus, or None if there is none.
+        """
+        if(up_to is None):
+            up_to = self.bound
+
+        baby_steps, last_baby_step, giant_step = self._steps
+        m = len(baby_steps)
+        if(m <= _isqrt(up_to)):
+            # The table is too small for up_to: more than sqrt(up_to) giant
+            # steps would be needed.
+            return _kangaroo(self.base, value, self.modulus, 0, up_to)
+
+        modulus = self.modulus
+        gamma = value % modulus
+        for i in xrange(0, up_to / m + 1):
+            j = baby_steps.get(gamma)
+            if(j is not None):
+                dlog = i * m + j
+                if(dlog <= up_to):
+                    return dlog
+                return None
+            gamma = (gamma * giant_step) % modulus
+
+        return None
@@ -60,6 +60,8 @@ from Crypto.Util import number
 # secure version of python's random:
 from Crypto.Random.random import StrongRandom
 
+from arithmetic import powmod, is_prime
+
 
 # Use configuration parameters from params.py
 import params
@@ -113,9 +115,9 @@ def _is_safe_prime(p, probability=params.FALSE_PRIME_PROBABILITY):
         q = (p - 1)/2
         
         # q first to shortcut the most common False case
-        return (number.isPrime(q, false_positive_prob=probability) 
+        return (is_prime(q, false_positive_prob=probability) 
                 and
-                number.isPrime(p, false_positive_prob=probability))
+                is_prime(p, false_positive_prob=probability))
                 
 
 def _generate_safe_prime(nbits, probability=params.FALSE_PRIME_PROBABILITY, 
@@ -155,12 +157,12 @@ def _generate_safe_prime(nbits, probability=params.FALSE_PRIME_PROBABILITY,
             q = number.getPrime(nbits - 1)
             p = 2*q + 1
             
-            if(not number.isPrime(p, probability)):
+            if(not is_prime(p, probability)):
                 continue
                 
             # Are we sure about q, though? (pycrypto may allow a higher 
             # probability of q being composite than what we might like)
-            if(not number.isPrime(q, probability)):
+            if(not is_prime(q, probability)):
                 continue    # pragma: no cover (Too rare to test for)
             
             found = True
@@ -225,9 +227,9 @@ def _is_generator(p, g):
             return False
         
         q = (p - 1) / 2        # Since p = 2q + 1
-        if(pow(g, 2, p) == 1):
+        if(powmod(g, 2, p) == 1):
             return False
-        elif(pow(g, q, p) == 1):
+        elif(powmod(g, q, p) == 1):
             return False
         else:
             return True
@@ -260,7 +262,7 @@ def _get_generator(p, task_monitor=None):
             if(task_monitor != None): task_monitor.tick()
         
         if(params.DEBUG):
-            assert pow(candidate, p - 1, p) == 1, \
+            assert powmod(candidate, p - 1, p) == 1, \
                    "generator^{p-1} != 1 mod p (!) see method's " \
                    "algorithm explanation."
         
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  FixedBaseTable.py :
+#
+#  This file provides FixedBaseTable, a table of precomputed powers of a fixed
+#  base modulo a prime, used to speed up the many exponentiations of the same
+#  base (the generator g and the public key value y) performed when
+#  re-encrypting ciphertexts for shuffling.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+# Use configuration parameters from params.py
+import params
+
+from arithmetic import mpz, powmod
+
+
+def _optimal_window_size(exponent_bits):
+    """
+    Returns the window size w minimizing the cost of FixedBaseTable.pow(...).
+
+    An exponentiation with a table of window size w costs about
+    ceil(exponent_bits / w) + 2^w modular multiplications.
+    """
+    best_window = 1
+    best_cost = None
+    for window in range(1, 17):
+        cost = (exponent_bits + window - 1) / window + (1 << window)
+        if(best_cost is None or cost < best_cost):
+            best_window = window
+            best_cost = cost
+    return best_window
+
+
+class FixedBaseTable:
+    """
+    Precomputed powers of a fixed base, for fast modular exponentiation.
+
+    Using this class outside of PloneVoteCryptoLib is not recommended. Use
+    FixedBaseTable.get(...) to obtain a (cached) table for a given base, rather
+    than constructing one directly.
+
+    The table stores base^(2^(w*i)) mod modulus for every window i of w bits of
+    the exponent. Exponentiation is then performed with the fixed-base
+    windowing method (see "Handbook of Applied Cryptography" Algorithm 14.109),
+    which needs about exponent_bits/w + 2^w modular multiplications and no
+    squarings at all, against about 1.2*exponent_bits multiplications for
+    python's built-in pow.
+
+    Attributes:
+        base::long  -- The fixed base of every exponentiation.
+        modulus::long   -- The modulus of every exponentiation.
+        exponent_bits::int  -- Maximum size in bits of the exponents supported
+                               by the table. Larger exponents fall back to
+                               python's built-in pow.
+        window::int -- The window size, in bits.
+    """
+
+    # Tables cached by FixedBaseTable.get(...), indexed by
+    # (base, modulus, exponent_bits).
+    _cache = {}
+
+    @classmethod
+    def get(cls, base, modulus, exponent_bits=None):
+        """
+        Returns a FixedBaseTable for the given base and modulus.
+
+        Tables are cached per process, so that every re-encryption, mapping
+        and shuffling proof using the same public key shares the same table.
+
+        Arguments:
+            base::long  -- The fixed base.
+            modulus::long   -- The modulus.
+            exponent_bits::int  -- Maximum size in bits of the exponents.
+                                   Defaults to the size of the modulus.
+
+        Returns:
+            table::FixedBaseTable   -- A table for base and modulus.
+        """
+        if(exponent_bits is None):
+            exponent_bits = modulus.bit_length()
+
+        key = (base, modulus, exponent_bits)
+        table = cls._cache.get(key)
+        if(table is None):
+            # Forget all tables once the cache is full, we only ever expect a
+            # couple of keys to be in active use by any given process.
+            if(len(cls._cache) >= params.FIXED_BASE_TABLE_CACHE_SIZE):
+                cls._cache.clear()
+            table = cls(base, modulus, exponent_bits)
+            cls._cache[key] = table
+
+        return table
+
+    def __init__(self, base, modulus, exponent_bits, window=None):
+        """
+        Constructs a new FixedBaseTable, precomputing the powers of base.
+
+        Arguments:
+            (See class attributes)
+            window::int -- The window size in bits. If None, the window size
+                           is taken from params.FIXED_BASE_WINDOW_SIZE or,
+                           failing that, chosen to minimize the cost of each
+                           exponentiation.
+        """
+        if(window is None):
+            window = params.FIXED_BASE_WINDOW_SIZE
+        if(window is None):
+            window = _optimal_window_size(exponent_bits)
+
+        self.base = base
+        self.modulus = modulus
+        self.exponent_bits = exponent_bits
+        self.window = window
+
+        # self._powers[i] = base^(2^(window*i)) mod modulus, stored with the
+        # fastest big integer type available (see arithmetic.py)
+        self._modulus = mpz(modulus)
+        num_windows = (exponent_bits + window - 1) / window
+        power = mpz(base) % self._modulus
+        self._powers = [power]
+        for i in range(1, num_windows):
+            for j in range(0, window):
+                power = (power * power) % self._modulus
+            self._powers.append(power)
+
+    def pow(self, exponent):
+        """
+        Computes base^exponent mod modulus using the precomputed table.
+
+        Arguments:
+            exponent::long  -- A non-negative exponent.
+
+        Returns:
+            result::long    -- base^exponent mod modulus
+        """
+        if(exponent < 0 or exponent.bit_length() > self.exponent_bits):
+            return powmod(self.base, exponent, self.modulus)
+
+        modulus = self._modulus
+        powers = self._powers
+        num_digits = 1 << self.window
+        mask = num_digits - 1
+
+        # Group the precomputed powers by the value of the corresponding
+        # window (digit) of the exponent in base 2^window.
+        buckets = [[] for j in range(0, num_digits)]
+        i = 0
+        while(exponent):
+            digit = exponent & mask
+            if(digit):
+                buckets[digit].append(powers[i])
+            exponent >>= self.window
+            i += 1
+
+        # HAC Algorithm 14.109: after processing digit value j, b holds the
+        # product of all powers with digit >= j, and a accumulates b once for
+        # each j, so each power ends up raised to its own digit.
+        a = 1
+        b = 1
+        for j in range(num_digits - 1, 0, -1):
+            for power in buckets[j]:
+                b = (b * power) % modulus
+            a = (a * b) % modulus
+
+        return long(a)
@@ -389,3 +389,32 @@ class InvalidShuffilingProofError(ParameterError):
         """Create a new InvalidShuffilingProofError exception
         """
         ParameterError.__init__(self, msg)
+        
+class InvalidBinaryFormatError(ParameterError):
+    """
+    Signals that the given data is not a valid PloneVoteCryptoLib binary
+    stream of the expected type (see BinaryFormat.py).
+
+    Attributes:
+        msg::string         -- explanation of the error
+    """
+
+    def __init__(self, msg):
+        """Create a new InvalidBinaryFormatError exception
+        """
+        ParameterError.__init__(self, msg)
+
+class SecretSharingError(ParameterError):
+    """
+    Signals an attempt to share an object holding secret data with the mixnet
+    worker processes as the shared object of a WorkerPool operation, which is
+    written to disk (see WorkerPool.py).
+
+    Attributes:
+        msg::string         -- explanation of the error
+    """
+
+    def __init__(self, msg):
+        """Create a new SecretSharingError exception
+        """
+        ParameterError.__init__(self, msg)
@@ -47,6 +47,7 @@ from PVCExceptions import InvalidPloneVoteCryptoFileError, \
                           IncompatibleCiphertextError
 from BitStream import BitStream
 import serialize as serialize
+from arithmetic import powmod
 # ============================================================================
 
 PrivateKey_serialize_structure_definition = {
@@ -73,6 +74,9 @@ class PrivateKey:
                                            this key is defined.
         public_key::PublicKey    -- The associated public key.
     """
+
+    # Never shared with the worker processes (see WorkerPool.py)
+    SECRET = True
     
     def __eq__(self, other):
         """
@@ -105,7 +109,7 @@ class PrivateKey:
                                            this key is defined.
             private_key_value::long     -- The actual value of the private key.
         """        
-        public_key_value = pow(cryptosystem.get_generator(), 
+        public_key_value = powmod(cryptosystem.get_generator(), 
                                private_key_value, 
                                cryptosystem.get_prime())
         
@@ -171,7 +175,7 @@ class PrivateKey:
             assert max(gamma, delta) < 2**(block_size + 1), \
                 "The ciphertext object includes blocks larger than the " \
                 "expected block size."
-            m = (pow(gamma, prime - 1 - key, prime) * delta) % prime
+            m = (powmod(gamma, prime - 1 - key, prime) * delta) % prime
             bitstream.put_num(m, block_size)
             
             if(task_monitor != None): decrypt_task_mon.tick()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  ProofBackends.py :
+#
+#  This file lists the proofs of shuffle known to the mixnet (the proof
+#  backends) and provides functions to select a backend by name and to load
+#  a stored proof of any backend.
+#
+#  A proof backend is a class with the interface of ShufflingProof: a new(...)
+#  class method taking the original collection, the shuffled collection and
+#  their mapping, a verify(...) method, and the to_dict()/from_dict(...) and
+#  to_stream(...)/from_stream(...) serialization methods.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+from ShufflingProof import ShufflingProof
+from ShuffleArgument import ShuffleArgument
+from BinaryFormat import MAGIC_SHUFFLING_PROOF, MAGIC_SHUFFLE_ARGUMENT
+
+# Exceptions:
+from PVCExceptions import InvalidBinaryFormatError
+
+
+# Backend names
+BACKEND_BENALOH = 'benaloh'
+BACKEND_SHUFFLE_ARGUMENT = 'shuffle_argument'
+
+# Proof class of each backend
+PROOF_BACKENDS = {
+    BACKEND_BENALOH: ShufflingProof,
+    BACKEND_SHUFFLE_ARGUMENT: ShuffleArgument,
+}
+
+# Backend of each binary format magic string
+_BACKEND_MAGICS = {
+    MAGIC_SHUFFLING_PROOF: BACKEND_BENALOH,
+    MAGIC_SHUFFLE_ARGUMENT: BACKEND_SHUFFLE_ARGUMENT,
+}
+
+
+def get_proof_class(backend):
+    """
+    Returns the proof class of the given backend.
+
+    Arguments:
+        backend::string -- The name of a backend, one of PROOF_BACKENDS.
+
+    Returns:
+        proof_class::class  -- ShufflingProof or ShuffleArgument.
+
+    Throws:
+        ValueError  -- If backend is not a known proof backend.
+    """
+    try:
+        return PROOF_BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown shuffling proof backend %r. Known " \
+                         "backends are: %s." % \
+                         (backend, ', '.join(sorted(PROOF_BACKENDS))))
+
+
+def proof_from_dict(d, pk, nbits):
+    """
+    Loads a proof of any backend from its to_dict() representation.
+
+    Proofs stored without a backend are ShufflingProof objects.
+    """
+    return get_proof_class(d.get('backend', BACKEND_BENALOH)).from_dict(d, pk,
+                                                                     nbits)
+
+
+def proof_from_stream(stream, pk, nbits):
+    """
+    Reads a proof of any backend written by its to_stream(...) method.
+
+    The stream must support seek(...), as the magic string is read to find
+    the backend before reading the proof itself.
+
+    Throws:
+        InvalidBinaryFormatError    -- If the data is not a binary proof of
+                                       a known backend.
+    """
+    position = stream.tell()
+    magic = stream.read(4)
+    stream.seek(position)
+    if(magic not in _BACKEND_MAGICS):
+        raise InvalidBinaryFormatError("The given data is not a binary " \
+            "shuffling proof of a known backend.")
+    return get_proof_class(_BACKEND_MAGICS[magic]).from_stream(stream, pk,
+                                                              nbits)
@@ -50,6 +50,7 @@ from EGCryptoSystem import EGCryptoSystem, EGStub
 from PVCExceptions import InvalidPloneVoteCryptoFileError
 from Ciphertext import Ciphertext
 from BitStream import BitStream
+from FixedBaseTable import FixedBaseTable
 import serialize as serialize
 # ============================================================================
 
@@ -138,7 +139,25 @@ class PublicKey:
         """
         self.cryptosystem = cryptosystem
         self._key = public_key_value
-        
+
+    def get_fixed_base_tables(self):
+        """
+        Gets the fixed-base exponentiation tables for g and for this key.
+
+        These tables are built once per process and key (see FixedBaseTable)
+        and are used to compute the powers g^{r} and y^{r} needed for
+        re-encryption much faster than with python's built-in pow.
+
+        Returns:
+            (g_table, y_table)::(FixedBaseTable, FixedBaseTable) --
+                Tables for the generator g of the cryptosystem and for the
+                public key value y, both modulo the cryptosystem's prime.
+        """
+        prime = self.cryptosystem.get_prime()
+        generator = self.cryptosystem.get_generator()
+        return (FixedBaseTable.get(generator, prime),
+                FixedBaseTable.get(self._key, prime))
+
     def encrypt_bitstream(self, bitstream, pad_to=None, task_monitor=None):
         """
         Encrypts the given bitstream into a ciphertext object.
@@ -213,7 +232,7 @@ class PublicKey:
         
         block_size = self.cryptosystem.get_nbits() - 1
         prime = self.cryptosystem.get_prime()
-        generator = self.cryptosystem.get_generator()
+        g_table, y_table = self.get_fixed_base_tables()
         
         # We pull data from the bitstream one block at a time and encrypt it
         formated_bitstream.seek(0)
@@ -255,10 +274,10 @@ class PublicKey:
             k = random.randint(1, prime - 2)
             
             # Compute gamma and delta
-            gamma = pow(generator, k, prime)
+            gamma = g_table.pow(k)
             if(task_monitor != None): encrypt_task_mon.tick()
             
-            delta = (block * pow(self._key, k, prime)) % prime
+            delta = (block * y_table.pow(k)) % prime
             if(task_monitor != None): encrypt_task_mon.tick()
             
             # Add this encrypted data portion to the ciphertext object
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  ReencryptionFactorPool.py :
+#
+#  This file provides ReencryptionFactorPool, a pool of precomputed
+#  re-encryption factors (r, g^r, y^r) for a public key.
+#
+#  The factors only depend on the public key, so they can be generated ahead
+#  of time (for example, while an election is open) and drawn from when
+#  creating new mappings (see CiphertextCollectionMapping.new), which then
+#  need no modular exponentiation.
+#
+#  Factors are secret: whoever knows the factors used by a shuffle can link
+#  its input and output ciphertexts. Each factor must be used only once, and
+#  take(...) removes the factors it returns from the pool.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+
+# secure version of python's random:
+from Crypto.Random.random import StrongRandom
+
+from WorkerPool import WorkerPool
+from BinaryFormat import (BinaryWriter, BinaryReader, value_width,
+                          MAGIC_REENCRYPTION_FACTORS)
+
+# Exceptions:
+from PVCExceptions import InvalidBinaryFormatError
+
+
+def generate_factors(public_key, count):
+    """
+    Generates count new random re-encryption factors for public_key, to be
+    used with WorkerPool.map. (see ReencryptionFactorPool.generate)
+    """
+    random = StrongRandom()
+    prime = public_key.cryptosystem.get_prime()
+    g_table, y_table = public_key.get_fixed_base_tables()
+
+    factors = []
+    for i in xrange(0, count):
+        # Select a random integer r, 1 <= r <= p - 2
+        r = random.randint(1, prime - 2)
+        factors.append((r, g_table.pow(r), y_table.pow(r)))
+    return factors
+
+
+class ReencryptionFactorPool:
+    """
+    A pool of precomputed re-encryption factors (r, g^r, y^r).
+
+    Fill the pool with generate(...) (or add(...)) and draw factors with
+    take(...), which removes them from the pool. Subclasses may keep the
+    factors elsewhere (eg. in a database) by overriding take(...) and
+    __len__().
+
+    Attributes:
+        public_key::PublicKey   -- The public key of the factors.
+    """
+
+    # Never shared with the worker processes (see WorkerPool.py)
+    SECRET = True
+
+    def __init__(self, public_key):
+        """
+        Constructs a new (empty) pool of re-encryption factors.
+
+        Arguments:
+            (See class attributes)
+        """
+        self.public_key = public_key
+        self._factors = []
+
+    def __len__(self):
+        """
+        Returns the number of factors in the pool.
+        """
+        return len(self._factors)
+
+    def add(self, factors):
+        """
+        Adds a list of (r, g^r, y^r) factors to the pool.
+        """
+        self._factors.extend(factors)
+
+    def generate(self, count, chunk_size=None):
+        """
+        Generates count new factors and adds them to the pool.
+
+        Factors are generated in parallel by the WorkerPool, in chunks of at
+        most chunk_size factors, each of which is added to the pool with
+        add(...) as soon as it is generated.
+
+        Arguments:
+            count::int      -- The number of factors to generate.
+            chunk_size::int -- The number of factors generated by each task.
+                               If None, the factors are split evenly between
+                               the worker processes.
+        """
+        if(chunk_size is None):
+            processes = max(1, WorkerPool.get().processes)
+            chunk_size = max(1, (count + processes - 1) / processes)
+        chunks = [min(chunk_size, count - i)
+                  for i in xrange(0, count, chunk_size)]
+        for factors in WorkerPool.get().imap(generate_factors,
+                                             self.public_key, chunks):
+            self.add(factors)
+
+    def take(self, count):
+        """
+        Removes up to count factors from the pool and returns them.
+
+        Returns:
+            factors::list   -- A list of (r, g^r, y^r) tuples, shorter than
+                               count (possibly empty) if the pool runs out.
+        """
+        factors = self._factors[:count]
+        del self._factors[:count]
+        return factors
+
+    def to_stream(self, stream, compress=None):
+        """
+        Writes the factors of this pool to a file-like object in binary
+        format. (see BinaryFormat.py)
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            compress::bool  -- Whether to compress the data. If None,
+                               params.BINARY_FORMAT_COMPRESSION is used.
+        """
+        writer = BinaryWriter(stream, MAGIC_REENCRYPTION_FACTORS, compress)
+        width = value_width(self.public_key.cryptosystem.get_nbits())
+        writer.write_uint(width)
+        writer.write_uint(len(self._factors))
+        values = []
+        for factor in self._factors:
+            values.extend(factor)
+        writer.write_values(values, width)
+        writer.close()
+
+    @classmethod
+    def from_stream(cls, stream, public_key):
+        """
+        Reads a pool written by to_stream(...) from a file-like object.
+
+        Arguments:
+            stream::file            -- A file-like object open for reading.
+            public_key::PublicKey   -- The public key of the factors.
+
+        Returns:
+            pool::ReencryptionFactorPool    -- The pool read.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the data is not a valid binary
+                                           pool of re-encryption factors.
+        """
+        reader = BinaryReader(stream, MAGIC_REENCRYPTION_FACTORS)
+        width = reader.read_uint()
+        if(width != value_width(public_key.cryptosystem.get_nbits())):
+            raise InvalidBinaryFormatError("The binary factors were written " \
+                "for a different cryptosystem bit size.")
+        count = reader.read_uint()
+        values = reader.read_values(3 * count, width)
+
+        pool = cls(public_key)
+        pool.add(zip(values[0::3], values[1::3], values[2::3]))
+        return pool
@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  ShuffleArgument.py :
+#
+#  This file provides ShuffleArgument, a Zero-Knowledge proof of correct
+#  shuffling between two ciphertext collections, like ShufflingProof, but
+#  following the construction by Terelius and Wikström (the proof of a shuffle
+#  used, among others, by Verificatum). Its size and the cost of generating
+#  and verifying it grow linearly with the number of ciphertexts, instead of
+#  being multiplied by the security parameter of ShufflingProof.
+#
+#  ShuffleArgument and ShufflingProof can be used interchangeably through the
+#  functions of ProofBackends.py.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+import struct
+from hashlib import sha256
+from binascii import hexlify, unhexlify
+
+from Crypto.Random.random import StrongRandom
+
+from arithmetic import powmod, multi_powmod, jacobi
+from BinaryFormat import (BinaryWriter, BinaryReader, value_width,
+                          MAGIC_SHUFFLE_ARGUMENT)
+
+# Exceptions:
+from PVCExceptions import InvalidCiphertextCollectionMappingError
+from PVCExceptions import InvalidBinaryFormatError
+
+
+# Version of the hashes used to derive the generators and challenges of the
+# argument. Stored with each argument.
+HASH_VERSION = 1
+
+# Names of the fields of the argument holding lists of group elements (one
+# per ciphertext), single group elements, lists of exponents (one per
+# ciphertext) and single exponents, in the order in which they are stored.
+_ELEMENT_LIST_FIELDS = ('permutation_commitments', 'chain_commitments',
+                        't_hat')
+_ELEMENT_FIELDS = ('t1', 't2', 't3')
+_EXPONENT_LIST_FIELDS = ('s_hat', 's_prime')
+_EXPONENT_FIELDS = ('s1', 's2', 's3')
+
+
+def _is_group_element(x, prime):
+    """
+    Returns True if x is an element of the subgroup of quadratic residues
+    modulo the safe prime, in which all values of the cryptosystem live.
+    """
+    return (1 <= x < prime and jacobi(x, prime) == 1)
+
+
+def _product(values, prime):
+    """
+    Returns the product of values modulo prime.
+    """
+    result = 1
+    for value in values:
+        result = (result * value) % prime
+    return result
+
+
+class _Hash:
+    """
+    A SHA-256 hash of fixed-width encoded values, used to derive the
+    generators and the Fiat-Shamir challenges of a ShuffleArgument.
+    """
+
+    def __init__(self, label, width):
+        self._hash = sha256()
+        self._hex_width = width * 2
+        self._hash.update(struct.pack('>II', HASH_VERSION, len(label)))
+        self._hash.update(label)
+
+    def update_uint(self, value):
+        self._hash.update(struct.pack('>I', value))
+
+    def update_values(self, values):
+        width = self._hex_width
+        self.update_uint(len(values))
+        self._hash.update(unhexlify(''.join(['%0*x' % (width, value)
+                                             for value in values])))
+
+    def update_collection(self, collection):
+        self.update_uint(collection.get_length())
+        for ciphertext in collection:
+            values = []
+            for (gamma, delta) in ciphertext:
+                values.append(gamma)
+                values.append(delta)
+            self.update_values(values)
+
+    def digest(self):
+        return self._hash.digest()
+
+
+class ShuffleArgument:
+    """
+    Stores a linear-size Zero-Knowledge proof of shuffling between two
+    CiphertextCollection objects.
+
+    This class offers the same interface as ShufflingProof (new(...),
+    verify(...), to_dict(), from_dict(...), to_stream(...) and
+    from_stream(...)), so that either can be used to prove a shuffle. (see
+    ProofBackends.py)
+
+    Use CiphertextCollection.shuffle_with_proof(proof_backend=...) to produce
+    a shuffled collection together with a ShuffleArgument. All ciphertexts of
+    the collection must have the same length in blocks, and the mapping must
+    store the exponents of its re-encryptions (see
+    params.REENCRYPTION_STORE_EXPONENTS).
+    """
+
+    ## SOME NOTES ON THE INTERNALS OF THIS PROOF:
+    #
+    # This is the proof of a shuffle of ElGamal ciphertexts from:
+    #
+    #   Björn Terelius and Douglas Wikström, "Proofs of Restricted Shuffles",
+    #   AFRICACRYPT 2010.
+    #
+    # made non-interactive with the Fiat-Shamir heuristic, as specified in:
+    #
+    #   Rolf Haenni, Philipp Locher, Reto Koenig and Eric Dubuis,
+    #   "Pseudo-Code Algorithms for Verifiable Re-Encryption Mix-Nets",
+    #   Voting'17.
+    #
+    # All values live in the subgroup G_q of quadratic residues modulo the
+    # safe prime p = 2q + 1 and exponents are taken modulo q. In our notation
+    # a block is (gamma, delta) = (g^r, m*y^r) and re-encryption multiplies it
+    # by (g^{r'}, y^{r'}), so the "a" and "b" components of the paper are
+    # delta and gamma respectively. Blocks of a ciphertext are handled as
+    # independent components that share the permutation and the challenges.
+    #
+    # Independent generators h, h_1, ..., h_N of G_q are derived by hashing
+    # the public key fingerprint, so that nobody knows their discrete
+    # logarithms.
+    #
+    # To prove that D is a shuffle of O, with permutation psi (the ith
+    # ciphertext of D re-encrypts the psi(i)th of O with exponents r'_i):
+    #
+    #   1) A commitment to the permutation c_{psi(i)} = g^{r_{psi(i)}} h_i is
+    #      computed.
+    #
+    #   2) The challenges u_j are derived by hashing O, D and c, and permuted
+    #      as u'_i = u_{psi(i)}.
+    #
+    #   3) A commitment chain to u' is computed: chat_0 = h and
+    #      chat_i = g^{rhat_i} chat_{i-1}^{u'_i}.
+    #
+    #   4) The prover commits to the random values omega (the t values),
+    #      computes the challenge c by hashing all the above, and answers with
+    #      the s values = omega + c * (secret values).
+    #
+    # The verifier recomputes u and c and checks the equations of the t
+    # values (see verify(...)), which together show that c commits to a
+    # permutation and that D re-encrypts O under that permutation.
+    ##
+
+    def __init__(self):
+        """
+        Constructs a new empty ShuffleArgument.
+
+        This method should not be used outside of this class. Consider using
+        ShuffleArgument.new(...) or CiphertextCollection.shuffle_with_proof().
+        """
+        self._hash_version = HASH_VERSION
+        self._permutation_commitments = []
+        self._chain_commitments = []
+        self._t1 = None
+        self._t2 = None
+        self._t3 = None
+        # One (t4 for delta, t4 for gamma) pair per block of the ciphertexts
+        self._t4 = []
+        self._t_hat = []
+        self._s1 = None
+        self._s2 = None
+        self._s3 = None
+        # One exponent per block of the ciphertexts
+        self._s4 = []
+        self._s_hat = []
+        self._s_prime = []
+
+    @classmethod
+    def from_dict(cls, d, pk, nbits):
+        proof = cls()
+        proof._hash_version = d['hash_version']
+        for field in _ELEMENT_LIST_FIELDS + _EXPONENT_LIST_FIELDS:
+            setattr(proof, '_' + field, [long(x) for x in d[field]])
+        for field in _ELEMENT_FIELDS + _EXPONENT_FIELDS:
+            setattr(proof, '_' + field, long(d[field]))
+        proof._t4 = [(long(t4_delta), long(t4_gamma))
+                     for (t4_delta, t4_gamma) in d['t4']]
+        proof._s4 = [long(x) for x in d['s4']]
+        return proof
+
+    def to_dict(self):
+        if self._t1 is None:
+            raise Exception("Uninitialized shuffling")
+
+        data = {'backend': 'shuffle_argument',
+                'hash_version': self._hash_version}
+        for field in _ELEMENT_LIST_FIELDS + _EXPONENT_LIST_FIELDS:
+            data[field] = list(getattr(self, '_' + field))
+        for field in _ELEMENT_FIELDS + _EXPONENT_FIELDS:
+            data[field] = getattr(self, '_' + field)
+        data['t4'] = [list(pair) for pair in self._t4]
+        data['s4'] = list(self._s4)
+        return data
+
+    def to_stream(self, stream, compress=None):
+        """
+        Writes this proof to a file-like object in binary format.
+        (see BinaryFormat.py)
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            compress::bool  -- Whether to compress the data. If None,
+                               params.BINARY_FORMAT_COMPRESSION is used.
+        """
+        if self._t1 is None:
+            raise Exception("Uninitialized shuffling")
+
+        writer = BinaryWriter(stream, MAGIC_SHUFFLE_ARGUMENT, compress)
+        values = self._t_values(self._t1, self._t2, self._t3, self._t4,
+                                self._t_hat)
+        values += self._permutation_commitments + self._chain_commitments
+        values += [self._s1, self._s2, self._s3] + self._s4
+        values += self._s_hat + self._s_prime
+        width = value_width(max([x.bit_length() for x in values]))
+
+        writer.write_uint(self._hash_version)
+        writer.write_uint(width)
+        writer.write_uint(len(self._permutation_commitments))
+        writer.write_uint(len(self._t4))
+        for field in _ELEMENT_LIST_FIELDS + _EXPONENT_LIST_FIELDS:
+            writer.write_values(getattr(self, '_' + field), width)
+        writer.write_values([getattr(self, '_' + field)
+                             for field in _ELEMENT_FIELDS + _EXPONENT_FIELDS],
+                            width)
+        t4_values = []
+        for pair in self._t4:
+            t4_values.extend(pair)
+        writer.write_values(t4_values, width)
+        writer.write_values(self._s4, width)
+        writer.close()
+
+    @classmethod
+    def from_stream(cls, stream, pk, nbits):
+        """
+        Reads a proof written by to_stream(...) from a file-like object.
+
+        Arguments:
+            stream::file    -- A file-like object open for reading.
+            pk::PublicKey   -- The public key of the shuffled collections.
+            nbits::int      -- Size in bits of the cryptosystem.
+
+        Returns:
+            proof::ShuffleArgument  -- The proof read.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the data is not a valid binary
+                                           shuffle argument.
+        """
+        reader = BinaryReader(stream, MAGIC_SHUFFLE_ARGUMENT)
+
+        proof = cls()
+        proof._hash_version = reader.read_uint()
+        width = reader.read_uint()
+        if(width > value_width(nbits)):
+            raise InvalidBinaryFormatError("The binary proof was written " \
+                "for a different cryptosystem bit size.")
+        length = reader.read_uint()
+        blocks = reader.read_uint()
+
+        for field in _ELEMENT_LIST_FIELDS + _EXPONENT_LIST_FIELDS:
+            setattr(proof, '_' + field, reader.read_values(length, width))
+        single_fields = _ELEMENT_FIELDS + _EXPONENT_FIELDS
+        values = reader.read_values(len(single_fields), width)
+        for (field, value) in zip(single_fields, values):
+            setattr(proof, '_' + field, value)
+        t4_values = reader.read_values(2 * blocks, width)
+        proof._t4 = [(t4_values[i], t4_values[i + 1])
+                     for i in xrange(0, 2 * blocks, 2)]
+        proof._s4 = reader.read_values(blocks, width)
+        return proof
+
+
+    @classmethod
+    def _generators(cls, public_key, count):
+        """
+        Derives the independent generators h, h_1, ..., h_count of G_q.
+
+        Returns:
+            (h, hs)::(long, list)   -- h and the list [h_1, ..., h_count].
+        """
+        prime = public_key.cryptosystem.get_prime()
+        nbits = public_key.cryptosystem.get_nbits()
+        fingerprint = public_key.get_fingerprint()
+        # Hash to 128 bits more than p, so that the result modulo p is
+        # close to uniform.
+        digests = (nbits + 128 + 255) / 256
+
+        generators = []
+        for i in xrange(0, count + 1):
+            counter = 0
+            while(True):
+                data = []
+                for k in xrange(0, digests):
+                    h = _Hash('generator', 4)
+                    h._hash.update(fingerprint)
+                    h.update_values([i, counter, k])
+                    data.append(h.digest())
+                x = long(hexlify(''.join(data)), 16) % prime
+                # Squaring maps x into the subgroup of quadratic residues
+                generator = (x * x) % prime
+                if(generator > 1):
+                    break
+                counter += 1
+            generators.append(generator)
+
+        return (generators[0], generators[1:])
+
+    @classmethod
+    def _challenges(cls, public_key, original_collection,
+                    shuffled_collection, permutation_commitments):
+        """
+        Derives the seed of the proof and the challenges u_1, ..., u_N from
+        the collections and the permutation commitments.
+
+        Returns:
+            (seed, u)::(string, list)   -- The seed and the list of challenges.
+        """
+        width = value_width(public_key.cryptosystem.get_nbits())
+        h = _Hash('challenges', width)
+        h._hash.update(public_key.get_fingerprint())
+        h.update_collection(original_collection)
+        h.update_collection(shuffled_collection)
+        h.update_values(permutation_commitments)
+        seed = h.digest()
+
+        u = []
+        for i in xrange(0, len(permutation_commitments)):
+            u.append(long(sha256(seed + struct.pack('>I', i)).hexdigest(), 16))
+        return (seed, u)
+
+    @classmethod
+    def _challenge(cls, public_key, seed, chain_commitments, t_values):
+        """
+        Derives the final challenge c from the seed and the commitments of the
+        proof.
+        """
+        width = value_width(public_key.cryptosystem.get_nbits())
+        h = _Hash('challenge', width)
+        h._hash.update(seed)
+        h.update_values(chain_commitments)
+        h.update_values(t_values)
+        return long(hexlify(h.digest()), 16)
+
+    @classmethod
+    def _t_values(cls, t1, t2, t3, t4, t_hat):
+        values = [t1, t2, t3]
+        for pair in t4:
+            values.extend(pair)
+        values.extend(t_hat)
+        return values
+
+    @classmethod
+    def _block_count(cls, collection):
+        """
+        Returns the (common) number of blocks of the ciphertexts of
+        collection, or None if they have different lengths.
+        """
+        lengths = set([ciphertext.get_length() for ciphertext in collection])
+        if(len(lengths) > 1):
+            return None
+        return lengths.pop() if lengths else 0
+
+
+    @classmethod
+    def new(cls, original_collection, shuffled_collection, mapping):
+        """
+        Constructs a new proof of equivalence between original_collection and
+        shuffled_collection.
+
+        Arguments:
+            original_collection::CiphertextCollection --
+                The original collection to be shuffled.
+            shuffled_collection::CiphertextCollection --
+                The shuffled collection resulting from applying mapping to
+                original_collection.
+            mapping::CiphertextCollectionMapping --
+                The mapping between original_collection and
+                shuffled_collection, which must store the exponents of its
+                re-encryptions.
+
+        Returns:
+            proof::ShuffleArgument  --
+                Zero-knowledge proof of equivalence between
+                original_collection and shuffled_collection.
+
+        Throws:
+            InvalidCiphertextCollectionMappingError --
+                If mapping is not a valid mapping between original_collection
+                and shuffled_collection, or does not store its exponents.
+        """
+        if(not mapping.verify(original_collection, shuffled_collection)):
+            raise InvalidCiphertextCollectionMappingError("mapping is not a " \
+                "valid mapping between original_collection and " \
+                "shuffled_collection")
+        if(not mapping._stores_exponents()):
+            raise InvalidCiphertextCollectionMappingError("A shuffle " \
+                "argument can only be generated from a mapping that stores " \
+                "the exponents of its re-encryptions.")
+        blocks = cls._block_count(original_collection)
+        if(blocks is None):
+            raise InvalidCiphertextCollectionMappingError("A shuffle " \
+                "argument requires all ciphertexts of the collection to " \
+                "have the same length.")
+
+        public_key = original_collection.public_key
+        prime = public_key.cryptosystem.get_prime()
+        q = (prime - 1) / 2
+        g_table, y_table = public_key.get_fixed_base_tables()
+        random = StrongRandom()
+        length = original_collection.get_length()
+
+        # psi[i] is the index in the original collection of the ith
+        # ciphertext of the shuffled collection, which is re-encrypted with
+        # the exponents reencryption_exponents[i].
+        psi = [None] * length
+        reencryption_exponents = [None] * length
+        for j in xrange(0, length):
+            i = mapping._reordering[j]
+            psi[i] = j
+            reencryption_exponents[i] = \
+                [r % q for r in mapping._reencryptions[j]._exponents]
+
+        h, hs = cls._generators(public_key, length)
+
+        proof = cls()
+
+        # 1) Permutation commitment
+        r = [random.randint(0, q - 1) for j in xrange(0, length)]
+        proof._permutation_commitments = \
+            [(g_table.pow(r[j]) * hs[mapping._reordering[j]]) % prime
+             for j in xrange(0, length)]
+
+        # 2) Challenges
+        seed, u = cls._challenges(public_key, original_collection,
+                                  shuffled_collection,
+                                  proof._permutation_commitments)
+        u_prime = [u[psi[i]] for i in xrange(0, length)]
+
+        # 3) Commitment chain
+        r_hat = [random.randint(0, q - 1) for i in xrange(0, length)]
+        previous = h
+        for i in xrange(0, length):
+            previous = (g_table.pow(r_hat[i]) *
+                        powmod(previous, u_prime[i], prime)) % prime
+            proof._chain_commitments.append(previous)
+
+        # 4) Commitments and responses
+        r_bar = sum(r) % q
+        v = 1
+        r_hat_sum = 0
+        for i in xrange(length - 1, -1, -1):
+            r_hat_sum = (r_hat_sum + r_hat[i] * v) % q
+            v = (v * u_prime[i]) % q
+        r_tilde = sum([r[j] * u[j] for j in xrange(0, length)]) % q
+        r_prime = [sum([reencryption_exponents[i][k] * u_prime[i]
+                        for i in xrange(0, length)]) % q
+                   for k in xrange(0, blocks)]
+
+        omega1, omega2, omega3 = [random.randint(0, q - 1) for k in range(3)]
+        omega4 = [random.randint(0, q - 1) for k in xrange(0, blocks)]
+        omega_hat = [random.randint(0, q - 1) for i in xrange(0, length)]
+        omega_prime = [random.randint(0, q - 1) for i in xrange(0, length)]
+
+        proof._t1 = g_table.pow(omega1)
+        proof._t2 = g_table.pow(omega2)
+        proof._t3 = (g_table.pow(omega3) *
+                     multi_powmod(hs, omega_prime, prime)) % prime
+        for k in xrange(0, blocks):
+            gammas = [shuffled_collection[i][k][0] for i in xrange(0, length)]
+            deltas = [shuffled_collection[i][k][1] for i in xrange(0, length)]
+            proof._t4.append(
+                ((y_table.pow(q - omega4[k]) *
+                  multi_powmod(deltas, omega_prime, prime)) % prime,
+                 (g_table.pow(q - omega4[k]) *
+                  multi_powmod(gammas, omega_prime, prime)) % prime))
+        previous = h
+        for i in xrange(0, length):
+            proof._t_hat.append((g_table.pow(omega_hat[i]) *
+                                 powmod(previous, omega_prime[i], prime))
+                                % prime)
+            previous = proof._chain_commitments[i]
+
+        c = cls._challenge(public_key, seed, proof._chain_commitments,
+                           cls._t_values(proof._t1, proof._t2, proof._t3,
+                                         proof._t4, proof._t_hat))
+
+        proof._s1 = (omega1 + c * r_bar) % q
+        proof._s2 = (omega2 + c * r_hat_sum) % q
+        proof._s3 = (omega3 + c * r_tilde) % q
+        proof._s4 = [(omega4[k] + c * r_prime[k]) % q
+                     for k in xrange(0, blocks)]
+        proof._s_hat = [(omega_hat[i] + c * r_hat[i]) % q
+                        for i in xrange(0, length)]
+        proof._s_prime = [(omega_prime[i] + c * u_prime[i]) % q
+                          for i in xrange(0, length)]
+
+        return proof
+
+
+    def verify(self, original_collection, shuffled_collection):
+        """
+        Verifies that original_collection and shuffled_collection are
+        equivalent as proven by this ShuffleArgument object.
+
+        Arguments:
+            original_collection::CiphertextCollection   --
+                The original collection of ciphertexts.
+            shuffled_collection::CiphertextCollection   --
+                Another collection for which we wish to know if the current
+                ShuffleArgument object demonstrates equivalence with
+                original_collection.
+
+        Returns:
+            result::bool    -- True if this proof shows both collections to be
+                               equivalent.
+                               False otherwise.
+        """
+        if(self._hash_version != HASH_VERSION):
+            return False
+
+        public_key = original_collection.public_key
+        if(shuffled_collection.public_key != public_key):
+            return False
+        prime = public_key.cryptosystem.get_prime()
+        q = (prime - 1) / 2
+        g_table, y_table = public_key.get_fixed_base_tables()
+        length = original_collection.get_length()
+        if(length == 0):
+            # There is nothing to shuffle
+            return (shuffled_collection.get_length() == 0)
+
+        # Check the shape of the proof and collections
+        blocks = self._block_count(original_collection)
+        if(blocks is None or
+           shuffled_collection.get_length() != length or
+           self._block_count(shuffled_collection) != blocks or
+           len(self._t4) != blocks or len(self._s4) != blocks):
+            return False
+        for field in _ELEMENT_LIST_FIELDS + _EXPONENT_LIST_FIELDS:
+            if(len(getattr(self, '_' + field)) != length):
+                return False
+
+        # Check that every value is in the right group or range
+        elements = self._t_values(self._t1, self._t2, self._t3, self._t4,
+                                  self._t_hat)
+        elements += self._permutation_commitments + self._chain_commitments
+        for collection in (original_collection, shuffled_collection):
+            for ciphertext in collection:
+                for (gamma, delta) in ciphertext:
+                    elements.append(gamma)
+                    elements.append(delta)
+        for x in elements:
+            if(not _is_group_element(x, prime)):
+                return False
+        exponents = [self._s1, self._s2, self._s3] + self._s4 + \
+                    self._s_hat + self._s_prime
+        for s in exponents:
+            if(not (0 <= s < q)):
+                return False
+
+        # Recompute the challenges
+        h, hs = self._generators(public_key, length)
+        seed, u = self._challenges(public_key, original_collection,
+                                   shuffled_collection,
+                                   self._permutation_commitments)
+        c = self._challenge(public_key, seed, self._chain_commitments,
+                            elements[:3 + 2 * blocks + length])
+        minus_c = (q - c) % q
+
+        # t1 = c_bar^{-c} g^{s1}, with c_bar = prod(c_j) / prod(h_i)
+        c_bar = (_product(self._permutation_commitments, prime) *
+                 powmod(_product(hs, prime), q - 1, prime)) % prime
+        if(self._t1 != (powmod(c_bar, minus_c, prime) *
+                        g_table.pow(self._s1)) % prime):
+            return False
+
+        # t2 = c_hat^{-c} g^{s2}, with c_hat = c_hat_N / h^{prod(u)}
+        u_product = _product(u, q)
+        c_hat = (self._chain_commitments[-1] *
+                 powmod(h, (q - u_product) % q, prime)) % prime
+        if(self._t2 != (powmod(c_hat, minus_c, prime) *
+                        g_table.pow(self._s2)) % prime):
+            return False
+
+        # t3 = c_tilde^{-c} g^{s3} prod(h_i^{s'_i}), with
+        # c_tilde = prod(c_j^{u_j})
+        c_tilde = multi_powmod(self._permutation_commitments, u, prime)
+        if(self._t3 != (powmod(c_tilde, minus_c, prime) *
+                        g_table.pow(self._s3) *
+                        multi_powmod(hs, self._s_prime, prime)) % prime):
+            return False
+
+        # t4 = (delta_tilde^{-c} y^{-s4} prod(delta'_i^{s'_i}),
+        #       gamma_tilde^{-c} g^{-s4} prod(gamma'_i^{s'_i}))
+        # for each block, with (gamma_tilde, delta_tilde) = prod(e_j^{u_j})
+        for k in xrange(0, blocks):
+            gammas = [original_collection[j][k][0] for j in xrange(0, length)]
+            deltas = [original_collection[j][k][1] for j in xrange(0, length)]
+            shuffled_gammas = [shuffled_collection[i][k][0]
+                               for i in xrange(0, length)]
+            shuffled_deltas = [shuffled_collection[i][k][1]
+                               for i in xrange(0, length)]
+            minus_s4 = (q - self._s4[k]) % q
+            delta_tilde = multi_powmod(deltas, u, prime)
+            gamma_tilde = multi_powmod(gammas, u, prime)
+            t4_delta = (powmod(delta_tilde, minus_c, prime) *
+                        y_table.pow(minus_s4) *
+                        multi_powmod(shuffled_deltas, self._s_prime, prime)) \
+                       % prime
+            t4_gamma = (powmod(gamma_tilde, minus_c, prime) *
+                        g_table.pow(minus_s4) *
+                        multi_powmod(shuffled_gammas, self._s_prime, prime)) \
+                       % prime
+            if(self._t4[k] != (t4_delta, t4_gamma)):
+                return False
+
+        # t_hat_i = c_hat_i^{-c} g^{s_hat_i} c_hat_{i-1}^{s'_i}
+        previous = h
+        for i in xrange(0, length):
+            current = self._chain_commitments[i]
+            if(self._t_hat[i] != (powmod(current, minus_c, prime) *
+                                  g_table.pow(self._s_hat[i]) *
+                                  powmod(previous, self._s_prime[i], prime))
+                                 % prime):
+                return False
+            previous = current
+
+        return True
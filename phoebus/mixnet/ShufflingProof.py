@@ -42,20 +42,51 @@
 # THE SOFTWARE.
 # ============================================================================
 
-from hashlib import sha256
-
 # Use configuration parameters from params.py
 import params
-import billiard
 
 from BitStream import BitStream
+from WorkerPool import WorkerPool
+from ChallengeHasher import ChallengeHasher, CHALLENGE_VERSION_LEGACY
+from BinaryFormat import (BinaryWriter, BinaryReader, value_width,
+                          MAGIC_SHUFFLING_PROOF)
 
 from CiphertextCollection import CiphertextCollection
 from CiphertextCollectionMapping import CiphertextCollectionMapping, \
-    new_collection_mapping
+    count_blocks
 
 # Exceptions:
 from PVCExceptions import InvalidCiphertextCollectionMappingError
+from PVCExceptions import InvalidBinaryFormatError
+
+
+def new_round(original_collection, index):
+    """
+    Generates a new round of a ShufflingProof, as a (collection, mapping)
+    pair, to be used with WorkerPool.imap. (see ShufflingProof.new)
+
+    The mapping is applied in the worker, where the (g^r, y^r) pairs of its
+    re-encryptions are computed: they are not pickled back with the mapping.
+    """
+    mapping = CiphertextCollectionMapping.new(original_collection)
+    return (mapping.apply(original_collection), mapping)
+
+
+def verify_round_chunk(shared, task):
+    """
+    Verifies a chunk of one round of a ShufflingProof, to be used with
+    WorkerPool.imap_unordered. (see ShufflingProof.verify)
+    """
+    proof, original_collection, shuffled_collection, challenge_bits = shared
+    i, start, end = task
+    if(challenge_bits[i] == 0):
+        return proof._mappings[i].verify_chunk(original_collection,
+                                               proof._collections[i],
+                                               start, end)
+    else:
+        return proof._mappings[i].verify_chunk(proof._collections[i],
+                                               shuffled_collection,
+                                               start, end)
 
 
 class ShufflingProof:
@@ -164,6 +195,7 @@ class ShufflingProof:
         self._collections = []
         self._mappings = []
         self._challenge = None
+        self._challenge_version = params.SHUFFLING_PROOF_CHALLENGE_VERSION
 
 
     @classmethod
@@ -173,6 +205,10 @@ class ShufflingProof:
 
         proof = cls()
         proof._challenge = d['challenge']
+        # Proofs stored before the challenge version was recorded use the
+        # legacy challenge hash.
+        proof._challenge_version = \
+            d.get('challenge_version', CHALLENGE_VERSION_LEGACY)
 
         for mapping_data in d['mappings']:
             proof._mappings.append(CiphertextCollectionMapping.from_dict(mapping_data,
@@ -197,8 +233,77 @@ class ShufflingProof:
             data['collections'].append(collection.to_dict())
 
         data['challenge'] = self._challenge
+        data['challenge_version'] = self._challenge_version
         return data
 
+    def to_stream(self, stream, compress=None):
+        """
+        Writes this proof to a file-like object in binary format.
+
+        The proof is written collection by collection and mapping by mapping,
+        so that the encoded proof is never held in memory as a whole.
+        (see BinaryFormat.py)
+
+        Arguments:
+            stream::file    -- A file-like object open for writing.
+            compress::bool  -- Whether to compress the data. If None,
+                               params.BINARY_FORMAT_COMPRESSION is used.
+        """
+        if not self._challenge:
+            raise Exception("Uninitialized shuffling")
+
+        writer = BinaryWriter(stream, MAGIC_SHUFFLING_PROOF, compress)
+        public_key = self._collections[0].public_key
+        width = value_width(public_key.cryptosystem.get_nbits())
+
+        writer.write_uint(self._challenge_version)
+        writer.write_string(str(self._challenge))
+        writer.write_uint(width)
+        writer.write_uint(len(self._collections))
+        for collection in self._collections:
+            collection._write_binary(writer, width)
+        for mapping in self._mappings:
+            mapping._write_binary(writer, width)
+        writer.close()
+
+    @classmethod
+    def from_stream(cls, stream, pk, nbits):
+        """
+        Reads a proof written by to_stream(...) from a file-like object.
+
+        Arguments:
+            stream::file    -- A file-like object open for reading.
+            pk::PublicKey   -- The public key of the shuffled collections.
+            nbits::int      -- Size in bits of the cryptosystem.
+
+        Returns:
+            proof::ShufflingProof   -- The proof read.
+
+        Throws:
+            InvalidBinaryFormatError    -- If the data is not a valid binary
+                                           shuffling proof.
+        """
+        reader = BinaryReader(stream, MAGIC_SHUFFLING_PROOF)
+
+        proof = cls()
+        proof._challenge_version = reader.read_uint()
+        proof._challenge = reader.read_string()
+        width = reader.read_uint()
+        if(width != value_width(nbits)):
+            raise InvalidBinaryFormatError("The binary proof was written " \
+                "for a different cryptosystem bit size.")
+
+        security_parameter = reader.read_uint()
+        for i in xrange(0, security_parameter):
+            proof._collections.append(
+                CiphertextCollection._read_binary(reader, pk, nbits, width))
+        for i in xrange(0, security_parameter):
+            proof._mappings.append(
+                CiphertextCollectionMapping._read_binary(reader, pk, nbits,
+                                                         width))
+
+        return proof
+
 
     def _generate_challenge(self, original_collection, shuffled_collection):
         """
@@ -220,6 +325,10 @@ class ShufflingProof:
         Returns:
             challenge::string - A 256-bit challenge, as a hexadecimal number
                 encoded as a string.
+
+        Throws:
+            ValueError  -- If the collections cannot be encoded with the
+                           challenge version of this proof.
         """
 
         # NOTE: self._collection must already be populated with its final
@@ -237,34 +346,27 @@ class ShufflingProof:
         # Finally, the fingerprint for the public key of the original_collection
         # (which must be the same as for all ciphertexts and collections taken
         # into account) is added to the hash as well.
+        #
+        # The encoding of each ciphertext depends on self._challenge_version
+        # (see ChallengeHasher).
 
-        c = sha256()
+        public_key = original_collection.public_key
+        c = ChallengeHasher(public_key.cryptosystem.get_nbits(),
+                            self._challenge_version)
 
-        for ciphertext in original_collection:
-            for (gamma, delta) in ciphertext:
-                c.update(hex(gamma))
-                c.update(hex(delta))
+        c.update_collection(original_collection)
 
         for collection in self._collections:
-            for ciphertext in collection:
-                for (gamma, delta) in ciphertext:
-                    c.update(hex(gamma))
-                    c.update(hex(delta))
+            c.update_collection(collection)
 
-        for ciphertext in shuffled_collection:
-            for (gamma, delta) in ciphertext:
-                c.update(hex(gamma))
-                c.update(hex(delta))
+        c.update_collection(shuffled_collection)
 
-        c.update(original_collection.public_key.get_fingerprint())
-
-        hexdigest = c.hexdigest()
-
-        return hexdigest
+        return c.hexdigest(public_key)
 
 
     @classmethod
-    def new(cls, original_collection, shuffled_collection, mapping):
+    def new(cls, original_collection, shuffled_collection, mapping,
+            rounds=None, on_round=None, factor_pool=None):
         """
         Constructs a new proof of equivalence between original_collection and
         shuffled_collection.
@@ -283,6 +385,20 @@ class ShufflingProof:
                 original_collection.
             mapping::CiphertextCollectionMapping --
                 The mapping between original_collection and shuffled_collection.
+            rounds::[(CiphertextCollection, CiphertextCollectionMapping)] --
+                Rounds of a previous, interrupted, run of new(...) for the same
+                collections and mapping, as given to on_round, in order. Only
+                the remaining rounds are generated.
+            on_round::function --
+                If given, on_round(index, collection, round_mapping) is called
+                as soon as each new round of the proof is generated, with the
+                collection C_i and the (secret) mapping from
+                original_collection into C_i, so that the caller can
+                checkpoint them.
+            factor_pool::ReencryptionFactorPool --
+                If given, rounds are generated with precomputed re-encryption
+                factors drawn from this pool while it has enough of them (see
+                CiphertextCollectionMapping.new).
 
         Returns:
             proof::ShufflingProof --
@@ -335,19 +451,47 @@ class ShufflingProof:
         # (ie. every mapping in proof._mappings[i] will initially be from the
         # original collection into proof._collections[i])
 
-        # generate new mappings in parallel
-        pool = billiard.Pool()
-        async_params = [original_collection] * security_parameter
-        generate_mappings_pool = pool.map_async(new_collection_mapping, async_params)
-        for new_mapping in generate_mappings_pool.get(99999999):
+        # The challenge is hashed incrementally (see _generate_challenge), as
+        # each collection is produced.
+        public_key = original_collection.public_key
+        challenge_hasher = ChallengeHasher(public_key.cryptosystem.get_nbits(),
+                                           proof._challenge_version)
+        challenge_hasher.update_collection(original_collection)
+
+        # Resume from the rounds of a previous run, if any
+        for (new_collection, new_mapping) in (rounds or [])[:security_parameter]:
+            challenge_hasher.update_collection(new_collection)
             proof._mappings.append(new_mapping)
-            proof._collections.append(new_mapping.apply(original_collection))
-        pool.close()
-        pool.join()
+            proof._collections.append(new_collection)
+
+        def add_round(new_collection, new_mapping):
+            challenge_hasher.update_collection(new_collection)
+            if(on_round is not None):
+                on_round(len(proof._mappings), new_collection, new_mapping)
+            proof._mappings.append(new_mapping)
+            proof._collections.append(new_collection)
+
+        # generate new mappings from precomputed factors, which only takes
+        # multiplications, while there are enough of them
+        if(factor_pool is not None):
+            blocks = count_blocks(original_collection)
+            while(len(proof._mappings) < security_parameter and
+                  len(factor_pool) >= blocks):
+                new_mapping = CiphertextCollectionMapping.new(
+                    original_collection, factor_pool)
+                add_round(new_mapping.apply(original_collection), new_mapping)
+
+        # generate the remaining rounds in parallel
+        # (original_collection is sent once to the workers, tasks are indexes)
+        new_rounds = WorkerPool.get().imap(new_round, original_collection,
+                                           range(len(proof._mappings),
+                                                 security_parameter))
+        for (new_collection, new_mapping) in new_rounds:
+            add_round(new_collection, new_mapping)
 
         # Generate the challenge
-        proof._challenge = \
-            proof._generate_challenge(original_collection, shuffled_collection)
+        challenge_hasher.update_collection(shuffled_collection)
+        proof._challenge = challenge_hasher.hexdigest(public_key)
 
         # Get the challenge as a BitStream for easier manipulation
         challenge_bits = BitStream()
@@ -456,8 +600,12 @@ class ShufflingProof:
                       minimum_allowed_security_parameter))
 
         # Generate the challenge
-        challenge = \
-            self._generate_challenge(original_collection, shuffled_collection)
+        try:
+            challenge = self._generate_challenge(original_collection,
+                                                 shuffled_collection)
+        except ValueError:
+            # The collections contain values that cannot be valid ciphertexts
+            return False
 
         # Verify that the challenge corresponds to the stored one
         if(challenge != self._challenge):
@@ -468,25 +616,43 @@ class ShufflingProof:
         challenge_bits.put_hex(challenge)
         challenge_bits.seek(0)  # back to the beginning of the stream
 
-        # For each of the first P bits in the stream
-        for i in range(0, security_parameter):
-            bit = challenge_bits.get_num(1)
-            if(bit == 0):
-                # verify that self._mapping[i] maps original_collection into
-                # self._collections[i]
-                if(not self._mappings[i].verify(original_collection,
-                                               self._collections[i])):
-                    return False
+        # Read the first P bits in the stream
+        bits = [challenge_bits.get_num(1) for i in range(0, security_parameter)]
 
-            elif(bit == 1):
-                # verify that self._mapping[i] self._collections[i] into
-                # self._collections[i]
-                if(not self._mappings[i].verify(self._collections[i],
-                                               shuffled_collection)):
+        # For each bit i, if the bit is 0, we must verify that
+        # self._mappings[i] maps original_collection into self._collections[i].
+        # If it is 1, we must verify that self._mappings[i] maps
+        # self._collections[i] into shuffled_collection.
+        #
+        # Each chunk only checks the images of its own ciphertexts, so every
+        # mapping must first be checked to be a permutation as a whole.
+        for mapping in self._mappings:
+            if(not mapping.is_permutation()):
+                return False
+
+        # Rounds are verified in parallel. When there are fewer rounds than
+        # tasks we want to give the workers, each round is also split in
+        # chunks of ciphertexts.
+        pool = WorkerPool.get()
+        length = original_collection.get_length()
+        chunks_per_round = \
+            max(1, (pool.processes * 4 + security_parameter - 1) / \
+                   security_parameter)
+        chunk_size = max(1, (length + chunks_per_round - 1) / chunks_per_round)
+        tasks = [(i, start, min(start + chunk_size, length))
+                 for i in range(0, security_parameter)
+                 for start in range(0, max(length, 1), chunk_size)]
+
+        results = pool.imap_unordered(verify_round_chunk,
+                    (self, original_collection, shuffled_collection, bits),
+                    tasks)
+        try:
+            for result in results:
+                if(not result):
+                    # Abort as soon as any round fails
                     return False
-            else:
-                assert False, "We took a single bit, its value must be either "\
-                        "0 or 1."
+        finally:
+            results.close()
 
         # If we made it so far, the proof is correct
         # (each mapping is in accordance to the challenge and valid)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  WorkerPool.py :
+#
+#  This file provides WorkerPool, a long-lived pool of worker processes used
+#  to parallelize the expensive operations of the mixnet (generating the
+#  mappings of a shuffling proof and rebasing them).
+#
+#  Large objects (typically a CiphertextCollection) are shared with the
+#  workers once per operation, instead of being pickled into every task.
+#  Tasks themselves only carry indexes into the shared object, or other small
+#  values.
+#
+#  Shared objects are written to a temporary file, so they must only hold
+#  public data. Secret data (private keys, shuffle mappings, re-encryption
+#  factors...) must be passed as the indexes of the tasks, which are sent to
+#  the workers through the pipes of the pool and never written to disk.
+#
+#  Sharing through a file is a trade-off. Workers cannot inherit the shared
+#  object on fork, since they are forked once when the pool is created,
+#  before the collections they will work on exist; forking a new pool for
+#  every operation, to inherit them, is the per-call cost this pool avoids.
+#  As a consequence, each worker unpickles its own copy of the shared object
+#  and holds it in memory until the next operation, so memory use grows with
+#  the number of workers times the size of the collection. (Copy-on-write
+#  pages inherited on fork would not stay shared for long either, as reading
+#  Python objects updates their reference counts.) The file is written once
+#  per operation instead of once per task, and can be kept off disk by
+#  pointing params.MIXNET_WORKER_SHARED_DIR to a memory-backed file system
+#  such as /dev/shm.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+import os
+import re
+import sys
+import errno
+import atexit
+import binascii
+import tempfile
+import cPickle as pickle
+
+import billiard
+
+# Use configuration parameters from params.py
+import params
+
+# Exceptions:
+from PVCExceptions import SecretSharingError
+
+
+# Shared object currently loaded by this (worker) process, as a
+# ((path, token), object) pair. Only the last shared object is kept in
+# memory.
+_loaded_shared = (None, None)
+
+# Shared files are named mixnet-<pid of the process that wrote them>-...
+_SHARED_FILE_PREFIX = 'mixnet-'
+_SHARED_FILE_RE = re.compile(r'^mixnet-(\d+)-')
+
+
+def _check_public(obj):
+    """
+    persistent_id hook of the pickler of shared objects: refuses to share
+    instances of classes marked as holding secret data (with a true SECRET
+    class attribute), wherever they are within the shared object.
+    """
+    if(getattr(getattr(obj, '__class__', None), 'SECRET', False) is True):
+        raise SecretSharingError("Objects of class %s hold secret data and " \
+            "cannot be shared with the worker processes, pass them as the " \
+            "indexes of the tasks instead." % obj.__class__.__name__)
+    return None
+
+
+def _process_exists(pid):
+    """
+    Returns True if a process with the given pid is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return (e.errno == errno.EPERM)
+    return True
+
+
+def _remove_stale_shared_files():
+    """
+    Removes the shared files left behind by processes that were killed in
+    the middle of an operation (the files are otherwise removed as soon as
+    the operation is over).
+    """
+    directory = params.MIXNET_WORKER_SHARED_DIR or tempfile.gettempdir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        match = _SHARED_FILE_RE.match(name)
+        if(match is None or _process_exists(int(match.group(1)))):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def _init_worker():
+    """
+    Initializes a worker process of the pool.
+    """
+    # Re-seed the random number generator after fork
+    from Crypto.Random import atfork; atfork()
+
+
+def _load_shared(path, token):
+    """
+    Returns the object shared through the file at path, loading it only the
+    first time it is requested by this process.
+
+    The file must start with the given token, unique to each shared object,
+    so that a file reusing the path of a previous one is never mistaken for
+    it.
+
+    Throws:
+        IOError -- If the file does not exist (anymore) or was not written
+                   for this token.
+    """
+    global _loaded_shared
+    loaded_key, shared = _loaded_shared
+    if(loaded_key != (path, token)):
+        shared_file = open(path, 'rb')
+        try:
+            if(pickle.load(shared_file) != token):
+                raise IOError("%s is not the expected shared file." % path)
+            shared = pickle.load(shared_file)
+        finally:
+            shared_file.close()
+        _loaded_shared = ((path, token), shared)
+    return shared
+
+
+def _run_task(task):
+    """
+    Runs a chunk of calls to func(shared, index) inside a worker process.
+
+    Once the file of the shared object has been removed, the operation has
+    been aborted or is over, and the remaining calls are skipped.
+
+    Returns the results of the chunk together with the exception raised by
+    func, if any, so that the pool can re-raise it with its original type.
+    Failing to load the shared object is reported in the same way, so that
+    the results of a chunk are never silently truncated.
+    """
+    func, (path, token), indexes = task
+    results = []
+    for index in indexes:
+        if(not os.path.exists(path)):
+            return (results, IOError(errno.ENOENT, "The shared file was " \
+                                     "removed before the task was done.", path))
+        try:
+            shared = _load_shared(path, token)
+        except (IOError, EOFError), e:
+            return (results, e)
+        try:
+            results.append(func(shared, index))
+        except Exception:
+            error_type, error, error_traceback = sys.exc_info()
+            if(not _is_picklable(error)):
+                raise error_type, error, error_traceback
+            return (results, error)
+    return (results, None)
+
+
+def _remove_shared_file(path):
+    """
+    Removes the file of a shared object, if it is still there.
+    """
+    try:
+        os.remove(path)
+    except OSError, e:
+        if(e.errno != errno.ENOENT):
+            raise
+
+
+def _is_picklable(error):
+    """
+    Checks whether an exception survives being sent back from a worker.
+    """
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return False
+    return True
+
+
+class WorkerPool:
+    """
+    A long-lived pool of worker processes for the mixnet.
+
+    Use WorkerPool.get() to obtain the pool of the current process, which is
+    created on first use and reused by every subsequent operation. The number
+    of worker processes is given by params.MIXNET_WORKER_PROCESSES. If it is
+    0, all the work is done in the current process.
+
+    The map(...) method works like the map of a process pool, except that the
+    function is called as func(shared, index) for each index, where shared is
+    an object that is sent to the workers only once per call of map(...).
+    func must be a module level function, so that it can be pickled.
+
+    The shared object is written to a temporary file (readable only by the
+    current user, see params.MIXNET_WORKER_SHARED_DIR), which is removed when
+    the operation is over, or by the next pool created if the process was
+    killed meanwhile. It must therefore only hold public data. Instances of
+    classes with a true SECRET class attribute (private keys, pools of
+    re-encryption factors...) are refused with a SecretSharingError, but
+    secret numbers cannot be told apart from public ones: any secret data
+    must be passed in the indexes, which can be any picklable values and are
+    sent to the workers through the pipes of the pool.
+    """
+
+    # The pool of the current process and the pid of the process that
+    # created it (a forked child must not reuse its parent's pool).
+    _instance = None
+    _instance_pid = None
+
+    @classmethod
+    def get(cls):
+        """
+        Returns the worker pool of the current process.
+
+        Returns:
+            pool::WorkerPool    -- The (possibly newly created) worker pool.
+        """
+        if(cls._instance is None or cls._instance_pid != os.getpid()):
+            cls._instance = WorkerPool(params.MIXNET_WORKER_PROCESSES)
+            cls._instance_pid = os.getpid()
+        return cls._instance
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Terminates the worker pool of the current process, if any.
+
+        The next call to WorkerPool.get() will create a new pool.
+        """
+        if(cls._instance is not None and cls._instance_pid == os.getpid()):
+            cls._instance.close()
+        cls._instance = None
+        cls._instance_pid = None
+
+    def __init__(self, processes=None):
+        """
+        Creates a new worker pool.
+
+        Arguments:
+            processes::int  -- The number of worker processes. If None, one
+                               process per CPU is used. If 0, no process is
+                               created and work is done in the current process.
+        """
+        if(processes is None):
+            processes = billiard.cpu_count()
+        self.processes = processes
+
+        if(processes > 0):
+            _remove_stale_shared_files()
+            self._pool = billiard.Pool(processes, initializer=_init_worker)
+        else:
+            self._pool = None
+
+    def map(self, func, shared, indexes):
+        """
+        Computes [func(shared, index) for index in indexes] in parallel.
+
+        Arguments:
+            func::function  -- A module level function of two arguments.
+            shared::object  -- A picklable object passed to every call of
+                               func. It is pickled once for all the workers,
+                               to a file: it must not hold secret data.
+            indexes::list   -- The indexes (or any other picklable values)
+                               for which to call func.
+
+        Returns:
+            results::list   -- The results of each call, in the order of
+                               indexes.
+
+        Throws:
+            SecretSharingError  -- If shared holds an object of a class
+                                   marked as secret.
+        """
+        indexes = list(indexes)
+        if(self._pool is None or len(indexes) <= 1):
+            return [func(shared, index) for index in indexes]
+
+        path, token = self._share(shared)
+        try:
+            results = []
+            tasks = self._make_tasks(func, (path, token), indexes)
+            for chunk_results, error in self._pool.map(_run_task, tasks):
+                if(error is not None):
+                    raise error
+                results.extend(chunk_results)
+            assert len(results) == len(indexes), \
+                "The workers returned %d results for %d indexes." % \
+                (len(results), len(indexes))
+            return results
+        finally:
+            _remove_shared_file(path)
+
+    def imap(self, func, shared, indexes):
+        """
+        Iterates over func(shared, index) for each index, computed in
+        parallel.
+
+        Results are produced in the order of indexes, as soon as each of them
+        is available, so that the caller can process the first results while
+        the workers compute the next ones. (see imap_unordered(...) for
+        aborting the operation early)
+
+        Arguments:
+            (See map(...))
+
+        Returns:
+            results::iterator   -- An iterator over the results of each call.
+        """
+        return self._imap(func, shared, indexes, ordered=True)
+
+    def imap_unordered(self, func, shared, indexes):
+        """
+        Iterates over func(shared, index) for each index, computed in
+        parallel.
+
+        Results are produced in the order in which they are completed. If the
+        iterator is closed before being exhausted (for example, by breaking
+        out of a for loop over it), the calls that have not started yet are
+        skipped. This allows aborting an operation as soon as one of the
+        results is known to be a failure.
+
+        Arguments:
+            (See map(...))
+
+        Returns:
+            results::iterator   -- An iterator over the results of each call.
+        """
+        return self._imap(func, shared, indexes, ordered=False)
+
+    def _imap(self, func, shared, indexes, ordered):
+        """
+        Generator behind imap(...) and imap_unordered(...).
+        """
+        indexes = list(indexes)
+        if(self._pool is None or len(indexes) <= 1):
+            for index in indexes:
+                yield func(shared, index)
+            return
+
+        path, token = self._share(shared)
+        try:
+            tasks = self._make_tasks(func, (path, token), indexes)
+            if(ordered):
+                chunks = self._pool.imap(_run_task, tasks)
+            else:
+                chunks = self._pool.imap_unordered(_run_task, tasks)
+            count = 0
+            for chunk_results, error in chunks:
+                for result in chunk_results:
+                    yield result
+                count += len(chunk_results)
+                if(error is not None):
+                    raise error
+            assert count == len(indexes), \
+                "The workers returned %d results for %d indexes." % \
+                (count, len(indexes))
+        finally:
+            _remove_shared_file(path)
+
+    def _share(self, shared):
+        """
+        Writes shared to a new temporary file, after a random token, and
+        returns the (path, token) pair with which the workers load it.
+
+        Each worker loads the file at most once. The caller must remove the
+        file once the operation is over.
+
+        Throws:
+            SecretSharingError  -- If shared holds an object of a class
+                                   marked as secret. (no file is left)
+        """
+        token = binascii.hexlify(os.urandom(16))
+        fd, path = tempfile.mkstemp(
+            prefix='%s%d-' % (_SHARED_FILE_PREFIX, os.getpid()),
+            dir=params.MIXNET_WORKER_SHARED_DIR)
+        shared_file = os.fdopen(fd, 'wb')
+        try:
+            pickler = pickle.Pickler(shared_file, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = _check_public
+            pickler.dump(token)
+            pickler.clear_memo()
+            pickler.dump(shared)
+        except:
+            shared_file.close()
+            os.remove(path)
+            raise
+        shared_file.close()
+        return path, token
+
+    def _make_tasks(self, func, shared_file, indexes):
+        """
+        Splits indexes in a few chunks per worker, one task per chunk.
+        """
+        chunk_count = self.processes * 4
+        chunk_size = max(1, (len(indexes) + chunk_count - 1) / chunk_count)
+        return [(func, shared_file, indexes[i:i + chunk_size])
+                for i in range(0, len(indexes), chunk_size)]
+
+    def close(self):
+        """
+        Terminates the worker processes of this pool.
+        """
+        if(self._pool is not None):
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+atexit.register(WorkerPool.shutdown)
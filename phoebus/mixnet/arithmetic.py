@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  arithmetic.py :
+#
+#  This file provides the big integer arithmetic used by the cryptographic
+#  code of the mixnet, of phoebus and of helios.crypto: modular
+#  exponentiation (powmod), modular inversion (invert), products of modular
+#  exponentiations (multi_powmod), Jacobi symbols (jacobi) and primality
+#  testing (is_prime).
+#
+#  When the gmpy2 module is installed (and params.USE_GMPY2 is set) these
+#  functions are computed with GMP, which is several times faster than
+#  python's built-in long arithmetic for the key sizes we use. Otherwise they
+#  fall back to pure python implementations. Either way, they take and return
+#  python longs, so that the choice of implementation is invisible to the
+#  callers.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+import math
+
+from Crypto.Util import number
+
+# Use configuration parameters from params.py
+import params
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+# Whether the functions of this module are computed with gmpy2
+HAVE_GMPY2 = (gmpy2 is not None and params.USE_GMPY2)
+
+
+def mpz(x):
+    """
+    Converts x to the fastest big integer type available: a gmpy2 mpz if
+    HAVE_GMPY2 is set, a python long otherwise.
+
+    Use this for intermediate values of long computations, and convert the
+    results back with long(...).
+    """
+    if(HAVE_GMPY2):
+        return gmpy2.mpz(x)
+    return long(x)
+
+
+def _invert(x, modulus):
+    """
+    Pure python modular inverse, by the extended Euclidean algorithm.
+    """
+    a, b = x % modulus, modulus
+    u, v = 1, 0
+    while(b):
+        quotient = a / b
+        a, b = b, a - quotient * b
+        u, v = v, u - quotient * v
+    if(a != 1):
+        raise ValueError("%d is not invertible modulo %d." % (x, modulus))
+    return u % modulus
+
+
+def invert(x, modulus):
+    """
+    Computes the inverse of x modulo modulus.
+
+    Arguments:
+        x::long         -- The value to invert.
+        modulus::long   -- The modulus.
+
+    Returns:
+        inverse::long   -- The value y such that x*y = 1 mod modulus.
+
+    Throws:
+        ValueError  -- If x is not invertible modulo modulus.
+    """
+    if(HAVE_GMPY2):
+        try:
+            return long(gmpy2.invert(x, modulus))
+        except ZeroDivisionError:
+            raise ValueError("%d is not invertible modulo %d." % (x, modulus))
+    return _invert(x, modulus)
+
+
+def powmod(base, exponent, modulus):
+    """
+    Computes base^exponent mod modulus.
+
+    Arguments:
+        base::long      -- The base.
+        exponent::long  -- The exponent. If negative, the inverse of base is
+                           raised to -exponent.
+        modulus::long   -- The modulus.
+
+    Returns:
+        result::long    -- base^exponent mod modulus
+
+    Throws:
+        ValueError  -- If exponent is negative and base is not invertible.
+    """
+    if(HAVE_GMPY2):
+        if(exponent < 0):
+            base = invert(base, modulus)
+            exponent = -exponent
+        return long(gmpy2.powmod(base, exponent, modulus))
+    if(exponent < 0):
+        base = _invert(base, modulus)
+        exponent = -exponent
+    return pow(base, exponent, modulus)
+
+
+def _window_width(nbits):
+    """
+    Returns the window width used by multi_powmod(...) for exponents of
+    nbits bits.
+    """
+    if(nbits <= 32):
+        return 2
+    if(nbits <= 256):
+        return 4
+    return 5
+
+
+def _window_digits(exponent, width):
+    """
+    Splits exponent into sliding windows, scanning from the least
+    significant bit.
+
+    Returns:
+        digits::list    -- A list of (position, digit) pairs, where each
+                           digit is odd and smaller than 2^width, such that
+                           exponent = sum(digit * 2^position).
+    """
+    digits = []
+    mask = (1 << width) - 1
+    position = 0
+    while(exponent):
+        if(exponent & 1):
+            digit = exponent & mask
+            digits.append((position, digit))
+            exponent >>= width
+            position += width
+        else:
+            exponent >>= 1
+            position += 1
+    return digits
+
+
+def multi_powmod(bases, exponents, modulus):
+    """
+    Computes prod(bases[i]^exponents[i]) mod modulus.
+
+    The pure python implementation uses simultaneous (interleaved window)
+    exponentiation: the powers of all bases share a single chain of
+    squarings, each base only adding one multiplication per window of its
+    exponent. For two exponents of the same size, this is about as costly as
+    a single modular exponentiation. With gmpy2, each power is computed by
+    GMP instead, which is faster than any squaring chain driven from python.
+
+    Arguments:
+        bases::list     -- The bases.
+        exponents::list -- The exponents, one for each base. Negative
+                           exponents are allowed, as in powmod(...).
+        modulus::long   -- The modulus.
+
+    Returns:
+        result::long    -- The product of the powers, mod modulus.
+
+    Throws:
+        ValueError  -- If a negative exponent's base is not invertible.
+    """
+    if(HAVE_GMPY2):
+        modulus = gmpy2.mpz(modulus)
+        result = gmpy2.mpz(1)
+        for (base, exponent) in zip(bases, exponents):
+            if(exponent < 0):
+                base = invert(base, modulus)
+                exponent = -exponent
+            result = (result * gmpy2.powmod(base, exponent, modulus)) % modulus
+        return long(result)
+
+    # multiplications[position] lists the table entries by which the result
+    # is multiplied once it has been squared up to that bit position.
+    top = 0
+    multiplications = {}
+    for (base, exponent) in zip(bases, exponents):
+        if(exponent < 0):
+            base = _invert(base, modulus)
+            exponent = -exponent
+        if(exponent == 0):
+            continue
+        nbits = exponent.bit_length()
+        width = _window_width(nbits)
+
+        # Odd powers of the base: table[i] = base^(2i+1)
+        base = base % modulus
+        square = (base * base) % modulus
+        table = [base]
+        for i in xrange(1, 1 << (width - 1)):
+            table.append((table[-1] * square) % modulus)
+
+        for (position, digit) in _window_digits(exponent, width):
+            multiplications.setdefault(position, []).append(table[digit >> 1])
+        top = max(top, nbits)
+
+    result = 1
+    for position in xrange(top - 1, -1, -1):
+        if(result != 1):
+            result = (result * result) % modulus
+        for factor in multiplications.get(position, ()):
+            result = (result * factor) % modulus
+    return result % modulus
+
+
+def jacobi(a, n):
+    """
+    Computes the Jacobi symbol (a/n), for an odd positive n.
+
+    For a prime n, this is the Legendre symbol: 1 if a is a non-zero
+    quadratic residue modulo n, -1 if it is a non-residue and 0 if n divides
+    a. It is much cheaper than the equivalent a^((n-1)/2) mod n.
+
+    Arguments:
+        a::long     -- The value.
+        n::long     -- An odd positive modulus.
+
+    Returns:
+        result::int -- The Jacobi symbol (a/n): -1, 0 or 1.
+    """
+    if(HAVE_GMPY2):
+        return int(gmpy2.jacobi(a, n))
+
+    a = a % n
+    result = 1
+    while(a != 0):
+        while(a % 2 == 0):
+            a /= 2
+            if(n % 8 in (3, 5)):
+                result = -result
+        a, n = n, a
+        if(a % 4 == 3 and n % 4 == 3):
+            result = -result
+        a = a % n
+    if(n == 1):
+        return result
+    return 0
+
+
+def is_prime(n, false_positive_prob=1e-6):
+    """
+    Tests whether n is prime.
+
+    Arguments:
+        n::long     -- The number to test.
+        false_positive_prob::float  --
+            The maximum probability that a composite n is reported as prime.
+
+    Returns:
+        result::bool    -- True if n is (probably) prime, False otherwise.
+    """
+    if(HAVE_GMPY2):
+        # Each Miller-Rabin round lets a composite pass with probability at
+        # most 1/4.
+        rounds = max(1, int(math.ceil(-math.log(false_positive_prob, 4))))
+        return bool(gmpy2.is_prime(n, rounds))
+    return bool(number.isPrime(n, false_positive_prob))
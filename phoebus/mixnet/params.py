@@ -90,6 +90,72 @@ CUSTOM_FALSE_PRIME_PROBABILITY = None
 # If None, the security parameter will be selected based on SECURITY_LEVEL
 CUSTOM_SHUFFLING_PROOF_SECURITY_PARAMETER = 80 # Based on Adida - Helios: Web-based Open-Audit Voting (2008)
 
+# The version of the hash used to compute the challenge of new shuffling
+# proofs (see ChallengeHasher.py). Version 2 hashes fixed-width binary
+# encodings of the ciphertexts, version 1 is the original hash of hex(...)
+# strings. Stored proofs are always verified with the version they declare.
+SHUFFLING_PROOF_CHALLENGE_VERSION = 2
+
+# The proof of shuffle generated by CiphertextCollection.shuffle_with_proof()
+# when no backend is given (see ProofBackends.py). 'benaloh' is the
+# ShufflingProof cut-and-choose proof, 'shuffle_argument' the linear-size
+# ShuffleArgument.
+SHUFFLING_PROOF_BACKEND = 'benaloh'
+
+# The size in bits of the random coefficients used to verify all the
+# re-encryptions of a CiphertextCollectionMapping at once (see
+# CiphertextCollectionMapping.verify). An invalid mapping passes batch
+# verification with probability at most 2^{-BATCH_VERIFICATION_SECURITY_PARAMETER}.
+BATCH_VERIFICATION_SECURITY_PARAMETER = 64
+
+# Whether new re-encryptions (and thus the mappings of new shuffling proofs)
+# store the exponent r of each block instead of the pair (g^r, y^r).
+# Exponents take half the space and are faster to rebase. Set to False to
+# produce proofs readable by versions that only know the pair format.
+REENCRYPTION_STORE_EXPONENTS = True
+
+# Window size (in bits) of the fixed-base exponentiation tables used for
+# re-encryption (see FixedBaseTable.py).
+# If None, the window size will be chosen to minimize exponentiation cost for
+# the key size in use.
+FIXED_BASE_WINDOW_SIZE = None
+
+# Maximum number of fixed-base exponentiation tables kept in memory by each
+# process. Each public key uses two tables (one for g and one for y).
+FIXED_BASE_TABLE_CACHE_SIZE = 16
+
+# Maximum number of baby steps stored by each discrete logarithm table (see
+# DLogTable.py). A table of n baby steps solves discrete logarithms up to n^2
+# with the baby-step giant-step method, larger ones use the kangaroo method.
+DLOG_TABLE_MAX_SIZE = 2**16
+
+# Maximum number of discrete logarithm tables kept in memory by each process,
+# one for each generator in use.
+DLOG_TABLE_CACHE_SIZE = 4
+
+# Whether to compress (with zlib) the binary representation of ciphertext
+# collections and shuffling proofs (see BinaryFormat.py). Ciphertexts are
+# close to random data and barely compress, so this is off by default.
+BINARY_FORMAT_COMPRESSION = False
+
+# Whether to compute big integer arithmetic with gmpy2, when it is installed
+# (see arithmetic.py). If False, or if gmpy2 is not available, the pure
+# python implementation is used.
+USE_GMPY2 = True
+
+# Number of worker processes used by the mixnet to generate and rebase the
+# mappings of shuffling proofs (see WorkerPool.py). The pool is created on
+# first use and kept for the lifetime of the process.
+# If None, one worker per CPU is used. If 0, all work is done in the calling
+# process.
+MIXNET_WORKER_PROCESSES = None
+
+# Directory in which large objects are written once to be shared with the
+# mixnet worker processes. If None, the system's temporary directory is used.
+# Only public data is ever written there (see WorkerPool.py), in files
+# readable only by the current user. A memory-backed directory (such as
+# /dev/shm) keeps the shared objects off disk.
+MIXNET_WORKER_SHARED_DIR = None
 
 # ============================================================================
 # Generated parameters
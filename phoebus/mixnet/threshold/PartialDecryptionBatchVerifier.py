@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  PartialDecryptionBatchVerifier.py :
+#  An auxiliary class used for verifying many partial decryptions of the same
+#  trustee at once.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+# ============================================================================
+# Imports and constant definitions:
+# ============================================================================
+
+from hashlib import sha256
+
+# secure version of python's random:
+from Crypto.Random.random import StrongRandom
+
+# Use configuration parameters from params.py
+from .. import params
+
+from ..arithmetic import powmod, multi_powmod, jacobi
+from ThresholdDecryptionCombinator import InvalidPartialDecryptionError
+
+__all__ = ["PartialDecryptionBatchVerifier"]
+
+# ============================================================================
+
+# ============================================================================
+# Helper functions:
+# ============================================================================
+
+def _block_challenge(a, b, partial_public_key, value):
+	"""
+	Returns the challenge c = SHA256(a, b, g^{2P(j)}, block) of a proof of
+	partial decryption, as generated by ThresholdPrivateKey.
+	"""
+	fingerprint = sha256()
+	fingerprint.update(hex(a))
+	fingerprint.update(hex(b))
+	fingerprint.update(hex(partial_public_key))
+	fingerprint.update(hex(value))
+	return int(fingerprint.hexdigest(),16)
+
+def _is_group_element(x, prime):
+	"""
+	Returns True if x is a quadratic residue modulo the safe prime, that is,
+	an element of its subgroup of prime order q = (p - 1)/2.
+	"""
+	return (1 <= x < prime and jacobi(x, prime) == 1)
+
+# ============================================================================
+
+# ============================================================================
+# Core class (PartialDecryptionBatchVerifier):
+# ============================================================================
+
+class PartialDecryptionBatchVerifier:
+	"""
+	Verifies the proofs of many partial decryptions of the same trustee at once.
+
+	ThresholdDecryptionCombinator.add_partial_decryption(...) checks the two
+	equations of each proof of partial decryption block separately:
+
+		g^t == a*(g^{2P(j)})^c		and		gamma^t == b*(block^2)^c
+
+	This class instead collects all the blocks of all the partial decryptions
+	of a trustee (for example, for every answer of an election tally) and
+	checks them together, raising the equations of each block to a small
+	random exponent s and multiplying them:
+
+		g^{sum(s*t)} == prod(a^s) * (g^{2P(j)})^{sum(s*c)}
+		prod(gamma^{s*t}) == prod(b^s) * prod(block^{2*s*c})
+
+	The powers of g and of the partial public key are then computed once for
+	the whole batch, and the other powers have short exponents except for
+	gamma^{s*t}. If any block is invalid, the batch passes with probability
+	at most 2^{-params.BATCH_VERIFICATION_SECURITY_PARAMETER}. This requires
+	all values to be in the subgroup of quadratic residues, which is checked
+	first: blocks with values outside of it are verified individually instead.
+
+	(see Bellare, Garay and Rabin, "Fast Batch Verification for Modular
+	Exponentiation and Digital Signatures", EUROCRYPT 1998)
+
+	Attributes (public):
+		public_key::ThresholdPublicKey	-- The threshold public key used to
+										   encrypt the ciphertexts.
+		cryptosystem::EGCryptoSystem	-- The cryptosystem of public_key.
+	"""
+
+	def __init__(self, public_key, trustee):
+		"""
+		Constructs a PartialDecryptionBatchVerifier class.
+
+		Arguments:
+			public_key::ThresholdPublicKey	-- The threshold public key used to
+											   encrypt the ciphertexts.
+			trustee::int	-- The index within the threshold scheme of the
+							   trustee which generated the partial decryptions
+							   to be verified.
+							   (trustees are indexed from 0 to num_trustees - 1)
+		"""
+		self.public_key = public_key
+		self.cryptosystem = public_key.cryptosystem
+		self._trustee = trustee
+		self._partial_public_key = public_key.get_partial_public_key(trustee)
+		# (gamma, PartialDecryptionBlock) pairs to verify
+		self._blocks = []
+
+	def add_partial_decryption(self, ciphertext, partial_decryption):
+		"""
+		Adds a partial decryption of the given ciphertext to the batch.
+
+		Arguments:
+			ciphertext::Ciphertext	-- The ciphertext that was partially
+									   decrypted.
+			partial_decryption::PartialDecryption	--  The trustee's partial
+													    decryption.
+
+		Throws:
+			InvalidPartialDecryptionError -- The partial decryption does not
+											 have the size of the ciphertext.
+		"""
+		nbits = self.cryptosystem.get_nbits()
+
+		if(partial_decryption.nbits != nbits):
+			raise InvalidPartialDecryptionError("Invalid partial decryption " \
+				"for trustee %d: The bit size of the partial decryption's " \
+				"blocks (%d bits) does not match the bit size of the " \
+				"ciphertext blocks (%d bits)." % \
+				(self._trustee, partial_decryption.nbits, nbits))
+
+		num_pd_blocks = partial_decryption.get_length()
+		if(num_pd_blocks != ciphertext.get_length()):
+			raise InvalidPartialDecryptionError("Invalid partial decryption " \
+				"for trustee %d: The number of blocks in the partial " \
+				"decryption (%d) does not match the number of blocks in the " \
+				"ciphertext (%d)." % \
+				(self._trustee, num_pd_blocks, ciphertext.get_length()))
+
+		for b_index in range(0, num_pd_blocks):
+			gamma, delta = ciphertext[b_index]
+			self._blocks.append((gamma, partial_decryption[b_index]))
+
+	def get_length(self):
+		"""
+		Returns the number of partial decryption blocks in the batch.
+		"""
+		return len(self._blocks)
+
+	def _verify_block(self, gamma, pd_block):
+		"""
+		Checks the proof of a single partial decryption block, in the same way
+		as ThresholdDecryptionCombinator.add_partial_decryption(...).
+		"""
+		prime = self.cryptosystem.get_prime()
+		generator = self.cryptosystem.get_generator()
+		proof = pd_block.proof
+		c = _block_challenge(proof.a, proof.b, self._partial_public_key,
+							 pd_block.value)
+
+		# g^t == a*(g^{2P(j)})^c
+		if(powmod(generator, proof.t, prime) != \
+		   (proof.a*powmod(self._partial_public_key, c, prime)) % prime):
+			return False
+
+		# gamma^t == b*(block^2)^c
+		return (powmod(gamma, proof.t, prime) == \
+				(proof.b*powmod(pd_block.value, 2*c, prime)) % prime)
+
+	def verify(self):
+		"""
+		Verifies all the partial decryption blocks in the batch.
+
+		Returns:
+			result::bool	-- False if the proof of any block is invalid, True
+							   otherwise (up to the error probability given in
+							   the class documentation).
+		"""
+		prime = self.cryptosystem.get_prime()
+		generator = self.cryptosystem.get_generator()
+		ppub_key = self._partial_public_key
+		# Remember that prime is of the form p = 2*q + 1, with q prime.
+		q = (prime - 1)/2
+
+		batch = (_is_group_element(generator, prime) and
+				 _is_group_element(ppub_key, prime))
+
+		bits = params.BATCH_VERIFICATION_SECURITY_PARAMETER
+		random = StrongRandom()
+
+		# g^{t_sum} == prod(a^s) * (g^{2P(j)})^{c_sum}
+		t_sum = 0
+		c_sum = 0
+		a_bases = []
+		a_exponents = []
+		# prod(gamma^{s*t}) == prod(b^s) * prod(block^{2*s*c})
+		gamma_bases = []
+		gamma_exponents = []
+		b_bases = []
+		b_exponents = []
+
+		for gamma, pd_block in self._blocks:
+			proof = pd_block.proof
+
+			# Blocks outside of the subgroup are not covered by the small
+			# exponents test, check them on their own.
+			if(not (batch and
+					_is_group_element(gamma, prime) and
+					_is_group_element(proof.a, prime) and
+					_is_group_element(proof.b, prime) and
+					1 <= pd_block.value < prime)):
+				if(not self._verify_block(gamma, pd_block)):
+					return False
+				continue
+
+			c = _block_challenge(proof.a, proof.b, ppub_key, pd_block.value)
+			s = random.getrandbits(bits)
+
+			t_sum += s*proof.t
+			c_sum += s*c
+			a_bases.append(proof.a)
+			a_exponents.append(s)
+
+			gamma_bases.append(gamma)
+			gamma_exponents.append((s*proof.t) % q)
+			b_bases.extend([proof.b, pd_block.value])
+			b_exponents.extend([s, 2*s*c])
+
+		if(len(a_bases) == 0):
+			return True
+
+		lhs = powmod(generator, t_sum % q, prime)
+		rhs = multi_powmod(a_bases + [ppub_key], a_exponents + [c_sum % q],
+						   prime)
+		if(lhs != rhs):
+			return False
+
+		lhs = multi_powmod(gamma_bases, gamma_exponents, prime)
+		rhs = multi_powmod(b_bases, b_exponents, prime)
+		return (lhs == rhs)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+#
+# ============================================================================
+# About this file:
+# ============================================================================
+#
+#  ThresholdBulkDecryptionCombinator.py :
+#  A class used for combining the partial decryptions of many ciphertexts,
+#  such as all the answers of an election tally, at once.
+#
+#  Part of the PloneVote cryptographic library (PloneVoteCryptoLib)
+#
+# ============================================================================
+# LICENSE (MIT License - http://www.opensource.org/licenses/mit-license):
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ============================================================================
+
+
+# ============================================================================
+# Imports and constant definitions:
+# ============================================================================
+
+# Non crypto secure random, used only for shuffling lists of trustees
+import random
+
+from ..BitStream import BitStream
+from ..WorkerPool import WorkerPool
+from ..arithmetic import multi_powmod
+from ThresholdDecryptionCombinator import _lagrange_coefficient
+from ThresholdDecryptionCombinator import InvalidPartialDecryptionError
+from ThresholdDecryptionCombinator import InvalidPartialDecryptionProofError
+from ThresholdDecryptionCombinator import InsuficientPartialDecryptionsError
+from PartialDecryptionBatchVerifier import PartialDecryptionBatchVerifier
+
+__all__ = ["ThresholdBulkDecryptionCombinator"]
+
+# ============================================================================
+
+# ============================================================================
+# Helper functions:
+# ============================================================================
+
+def _combine_ciphertext(shared, index):
+	"""
+	Combines the partial decryptions of the index-th ciphertext into its
+	plaintext blocks, to be used with WorkerPool.map.
+	
+	shared is a (prime, exponents, ciphertexts) tuple, where each element of
+	ciphertexts is a list of (delta, values) pairs, one per block, with values
+	holding the partial decryption block of each selected trustee, in the
+	order of exponents.
+	"""
+	prime, exponents, ciphertexts = shared
+	blocks = []
+	for delta, values in ciphertexts[index]:
+		# m = delta * prod(value^{-2*lambda}), see
+		# ThresholdBulkDecryptionCombinator.decrypt_to_values(...)
+		inv_val = multi_powmod(values, exponents, prime)
+		blocks.append((delta*inv_val) % prime)
+	return blocks
+
+# ============================================================================
+
+# ============================================================================
+# Core class (ThresholdBulkDecryptionCombinator):
+# ============================================================================
+
+class ThresholdBulkDecryptionCombinator:
+	"""
+	Used for combining the partial decryptions of many ciphertexts at once.
+	
+	This does the same as one ThresholdDecryptionCombinator per ciphertext, 
+	but the trustees whose partial decryptions are combined are chosen once 
+	for all the ciphertexts, so their Lagrange coefficients are only 
+	calculated once. The proofs of partial decryption of each trustee are 
+	checked together with a PartialDecryptionBatchVerifier, and the 
+	ciphertexts can be combined in parallel, using the WorkerPool.
+	
+	Attributes (public):
+		public_key::ThresholdPublicKey	-- The threshold public key used to 
+										   encrypt the ciphertexts we seek to 
+										   decrypt.
+		ciphertexts::Ciphertext[]	-- The encrypted ciphertexts that this 
+									   combinator is set-up to decrypt.
+	"""
+	
+	def __init__(self, public_key, ciphertexts, num_trustees, threshold):
+		"""
+		Constructs a ThresholdBulkDecryptionCombinator class.
+		
+		Arguments:
+			public_key::ThresholdPublicKey	-- The threshold public key used to 
+											   encrypt the ciphertexts we seek 
+											   to decrypt.
+			ciphertexts::Ciphertext[]	-- The encrypted ciphertexts that this 
+										   combinator is set-up to decrypt.
+			num_trustees::int	-- Total number of trustees in the threshold 
+								   scheme. (the n in "k of n"-decryption)
+			threshold::int	-- Minimum number of trustees required to decrypt 
+							   threshold encrypted messages. 
+							   (the k in "k of n"-decryption)
+		"""
+		nbits = public_key.cryptosystem.get_nbits()
+		for ciphertext in ciphertexts:
+			if(ciphertext.nbits != nbits):
+				raise ValueError("Incompatible ciphertext and cryptosystem: " \
+								 "bit size mismatch.")
+		
+		self.public_key = public_key
+		self.cryptosystem = public_key.cryptosystem
+		self.ciphertexts = list(ciphertexts)
+		self._num_trustees = num_trustees
+		self._threshold = threshold
+		
+		# The list of partial decryptions of each trustee, or None if we 
+		# don't have them.
+		self._trustees_partial_decryptions = \
+			[None for i in range(0, num_trustees)]
+	
+	def add_partial_decryptions(self, trustee, partial_decryptions, 
+								verify=True):
+		"""
+		Adds the partial decryptions of all the ciphertexts for a trustee.
+		
+		Arguments:
+			trustee::int	-- The index within the threshold scheme of the 
+							   trustee which generated the partial decryptions.
+							   (trustees are indexed from 0 to num_trustees - 1)
+			partial_decryptions::PartialDecryption[]	--
+				The trustee's partial decryptions, one for each ciphertext, in 
+				the order of the ciphertexts.
+			verify::bool	-- Whether to check the proofs of partial 
+							   decryption. Only skip this for partial 
+							   decryptions that have already been verified.
+		
+		Throws:
+			InvalidPartialDecryptionError	-- If the partial decryptions do 
+											   not match the ciphertexts.
+			InvalidPartialDecryptionProofError	-- If the proof of any partial 
+												   decryption is invalid.
+		"""
+		if(not (0 <= trustee < self._num_trustees)):
+			raise ValueError("Invalid trustee index %d: trustees are " \
+							 "indexed from 0 to %d." % \
+							 (trustee, self._num_trustees - 1))
+		
+		if(len(partial_decryptions) != len(self.ciphertexts)):
+			raise InvalidPartialDecryptionError("Invalid partial decryptions " \
+					"for trustee %d: The number of partial decryptions (%d) " \
+					"does not match the number of ciphertexts (%d)." % \
+					(trustee, len(partial_decryptions), len(self.ciphertexts)))
+		
+		# The verifier also checks that each partial decryption has the size 
+		# of its ciphertext.
+		verifier = PartialDecryptionBatchVerifier(self.public_key, trustee)
+		for ciphertext, partial_decryption in \
+				zip(self.ciphertexts, partial_decryptions):
+			verifier.add_partial_decryption(ciphertext, partial_decryption)
+		
+		if(verify and not verifier.verify()):
+			raise InvalidPartialDecryptionProofError("Invalid partial " \
+					"decryptions for trustee %d: The proof of partial " \
+					"decryption of at least one block is invalid." % trustee)
+		
+		self._trustees_partial_decryptions[trustee] = list(partial_decryptions)
+	
+	def needs_partial_decryptions(self):
+		"""
+		Returns True while fewer than threshold trustees have their partial 
+		decryptions registered with this object.
+		
+		Only threshold trustees are used for decryption, so callers can stop 
+		adding (and verifying) partial decryptions once this returns False, and 
+		check the remaining ones later if they wish to.
+		"""
+		registered = [decryptions for decryptions in \
+					  self._trustees_partial_decryptions if decryptions != None]
+		return (len(registered) < self._threshold)
+	
+	def decrypt_to_values(self, parallel=False):
+		"""
+		Decrypt each ciphertext to the list of the values of its blocks.
+		
+		At least (threshold) trustees must have their partial decryptions 
+		registered with this instance in order for decryption to succeed.
+		
+		Arguments:
+			parallel::bool	-- Whether to combine the ciphertexts in the 
+							   WorkerPool. (see params.MIXNET_WORKER_PROCESSES)
+		
+		Returns:
+			values::long[][]	-- For each ciphertext, the decrypted value of 
+								   each of its blocks.
+		
+		Throws:
+			InsuficientPartialDecryptionsError	-- If there aren't enough 
+									partial decryptions registered with this 
+									object to perform combined decryption.
+		"""
+		# Get the indexes of all trustees for which we have registered
+		# partial decryptions. We use 1 based indexes here.
+		trustee_indexes = []
+		for trustee in range(1, self._num_trustees + 1):
+			if(self._trustees_partial_decryptions[trustee - 1] != None):
+				trustee_indexes.append(trustee)
+		
+		# Check that we have enough trustees.
+		if (len(trustee_indexes) < self._threshold):
+			raise InsuficientPartialDecryptionsError("Not enough partial " \
+					"decryptions have been registered with this object to " \
+					"create a combined decryption. Registered partial " \
+					"decryptions: %d. Required partial decryptions " \
+					"(threshold): %d." \
+					% (len(trustee_indexes), self._threshold))
+		
+		# We only need threshold trustees, exactly. Select those at random, 
+		# once for all the ciphertexts.
+		random.shuffle(trustee_indexes)
+		trustee_indexes = trustee_indexes[0:self._threshold]
+		
+		prime = self.cryptosystem.get_prime()
+		#  prime = 2q + 1 with q prime by construction (see EGCryptoSystem).
+		q = (prime - 1) / 2
+		
+		# ThresholdDecryptionCombinator.decrypt_to_bitstream(...) interpolates 
+		# val = g^{r2P(0)} = prod(block_i^{2*lambda_i(0)}) for each block and 
+		# then decrypts it as m = delta*(val)^{-1}. Here we raise each block to 
+		# -2*lambda_i(0) directly instead, which saves the inversion. The 
+		# exponents are taken mod p - 1 (the order of Z_{p}^{*}), and so are 
+		# valid for any partial decryption block, not only for those in the 
+		# subgroup of order q. The Lagrange coefficients are calculated in 
+		# Z_{q} once, for all the ciphertexts.
+		exponents = []
+		for trustee in trustee_indexes:
+			l_coeff = _lagrange_coefficient(trustee_indexes, trustee, 0, q)
+			exponents.append((-2*l_coeff) % (prime - 1))
+		
+		# For each ciphertext, (delta, values) for each block, with values 
+		# holding the partial decryption blocks of the selected trustees.
+		ciphertexts = []
+		for c_index in range(0, len(self.ciphertexts)):
+			ciphertext = self.ciphertexts[c_index]
+			blocks = []
+			for b_index in range(0, ciphertext.get_length()):
+				gamma, delta = ciphertext[b_index]
+				values = []
+				for trustee in trustee_indexes:
+					p_decryptions = \
+						self._trustees_partial_decryptions[trustee - 1]
+					values.append(p_decryptions[c_index][b_index].value)
+				blocks.append((delta, values))
+			ciphertexts.append(blocks)
+		
+		shared = (prime, exponents, ciphertexts)
+		indexes = range(0, len(ciphertexts))
+		if(parallel):
+			return WorkerPool.get().map(_combine_ciphertext, shared, indexes)
+		else:
+			return [_combine_ciphertext(shared, index) for index in indexes]
+	
+	def decrypt_to_bitstreams(self, parallel=False):
+		"""
+		Decrypt each ciphertext to a bitstream, using the partial decryptions.
+		
+		Arguments and exceptions are the same as for decrypt_to_values(...).
+		
+		Returns:
+			bitstreams::Bitstream[]	-- A bitstream containing the unencrypted 
+									   data of each ciphertext.
+		"""
+		# See PublicKey.encrypt_bitstream for why we use nbits - 1 as the block 
+		# size.
+		block_size = self.cryptosystem.get_nbits() - 1
+		
+		bitstreams = []
+		for blocks in self.decrypt_to_values(parallel):
+			bitstream = BitStream()
+			for m in blocks:
+				bitstream.put_num(m, block_size)
+			bitstreams.append(bitstream)
+		return bitstreams
@@ -44,6 +44,7 @@ from hashlib import sha256
 
 from ..PVCExceptions import ElectionSecurityError
 from ..BitStream import BitStream
+from ..arithmetic import powmod, multi_powmod, invert
 
 __all__ = ["ThresholdDecryptionCombinator", 
 		   "InsuficientPartialDecryptionsError"]
@@ -99,9 +100,7 @@ def _lagrange_coefficient(indexes, i, x, prime_modulus):
 	
 	numerator = numerator % prime_modulus
 	denominator = denominator % prime_modulus
-	# a^(p-2) is the inverse of a in Z_{p} with p prime. Proof:
-	# (a)(a^(p-2)) = a^(p-1) = 1
-	inv_denominator = pow(denominator, prime_modulus - 2, prime_modulus)
+	inv_denominator = invert(denominator, prime_modulus)
 	
 	result = (numerator*inv_denominator) % prime_modulus
 	return result
@@ -266,6 +265,18 @@ class ThresholdDecryptionCombinator:
 		# (See [TODO: Add reference])
 		ppub_key = self.public_key.get_partial_public_key(trustee)
 		
+		# The proofs are checked as g^t*(g^{2P(j)})^{-c} == a, computing both 
+		# powers in a single simultaneous exponentiation, so we invert the 
+		# partial public key once for all blocks. A key that is not invertible 
+		# (0 mod p) cannot be g^{2P(j)}, so no proof for it can be valid.
+		try:
+			ppub_key_inverse = invert(ppub_key, prime)
+		except ValueError:
+			raise InvalidPartialDecryptionProofError( \
+				"Invalid partial decryption for trustee %d: The partial " \
+				"public key of the trustee is not invertible, so no proof of " \
+				"partial decryption can be valid for it." % trustee)
+		
 		# Verify the proofs of partial decryption for each partial decryption's 
 		# block. (This is far more reliable than doing a ciphertext/public_key 
 		# fingerprint check and can also detect maliciously forged partial 
@@ -298,18 +309,22 @@ class ThresholdDecryptionCombinator:
 			proof_valid = True
 			
 			# (See [TODO: Add reference])
-			# verify that g^t == a*(g^{2P(j)})^c
-			lhs = pow(generator, t, prime)	# g^t
-			rhs = (a*pow(ppub_key, c, prime)) % prime	# a*(g^{2P(j)})^c
+			# verify that g^t == a*(g^{2P(j)})^c, as g^t*(g^{2P(j)})^{-c} == a
+			lhs = multi_powmod([generator, ppub_key_inverse], [t, c], prime)
 			
-			if(lhs != rhs):
+			if(lhs != a % prime):
 				proof_valid = False
 			
-			# verify gamma^t = b*(block^2)^c (since block = gamma^P(j))
-			lhs = pow(gamma, t, prime)	# g^t
-			rhs = (b*pow(pd_block.value, 2*c, prime)) % prime # b*(block^2)^c
+			# verify gamma^t = b*(block^2)^c (since block = gamma^P(j)), as 
+			# gamma^t*block^{-2c} == b
+			try:
+				lhs = multi_powmod([gamma, pd_block.value], [t, -2*c], prime)
+			except ValueError:
+				# block is not invertible (0 mod p), so it cannot be 
+				# gamma^P(j)
+				lhs = None
 			
-			if(lhs != rhs):
+			if(lhs != b % prime):
 				proof_valid = False
 			
 			if(not proof_valid):
@@ -324,6 +339,18 @@ class ThresholdDecryptionCombinator:
 		
 		self._trustees_partial_decryptions[trustee] = partial_decryption
 	
+	def needs_partial_decryptions(self):
+		"""
+		Returns True while fewer than threshold partial decryptions have been 
+		registered with this object.
+		
+		Only threshold partial decryptions are used for decryption, so callers 
+		can stop adding (and verifying) them once this returns False.
+		"""
+		registered = [decryption for decryption in \
+					  self._trustees_partial_decryptions if decryption != None]
+		return (len(registered) < self._threshold)
+	
 	def decrypt_to_bitstream(self, task_monitor=None):
 		"""
 		Decrypt the ciphertext to a bitstream, using the partial decryptions.
@@ -429,13 +456,13 @@ class ThresholdDecryptionCombinator:
 										  "should have been pre-calculated."
 				
 				# factor: $\left(g^{rP\left(i\right)}\right)^{2\lambda_{i}(0)}$
-				factor = pow(pd_block, 2*l_coeff, prime)
+				factor = powmod(pd_block, 2*l_coeff, prime)
 				
 				val = (val*factor) % prime
 			
 			# We decrypt a block of message as m = delta/val = delta*(val)^{-1}.
 			# (val)^{-1} the inverse of val in Z_{p}
-			inv_val = pow(val, prime - 2, prime)
+			inv_val = invert(val, prime)
 			m = (delta*inv_val) % prime
 			
 			# ... and add it to the bitstream.
@@ -50,6 +50,7 @@ from ThresholdKeyPair import ThresholdKeyPair
 from ..PVCExceptions import *
 
 from ..BitStream import BitStream
+from ..arithmetic import powmod
 
 
 class ThresholdEncryptionSetUp:
@@ -280,7 +281,7 @@ class ThresholdEncryptionSetUp:
 		# each coefficient of the polynomial).
 		public_coeficients = []
 		for coeff in polynomial.get_coefficients():
-			public_coeficients.append(pow(generator, coeff, prime)) 
+			public_coeficients.append(powmod(generator, coeff, prime)) 
 		
 		# 3. Generate the partial private keys for each trustee.
 		# The partial private key for trustee j is P_{i}(j+1), with i the   
@@ -350,7 +351,7 @@ class ThresholdEncryptionSetUp:
 					"commitment.")
 			
 			# factor is (g^{P_{i}(0)})^{2}
-			factor = pow(commitment.public_coefficients[0], 2, prime)
+			factor = powmod(commitment.public_coefficients[0], 2, prime)
 			# key holds the multiplication
 			key = (key * factor) % prime
 		
@@ -382,7 +383,7 @@ class ThresholdEncryptionSetUp:
 				# know a = b mod (p - 1) => x^a = x^b mod p (and 2q = p - 1).
 				ppub_key_fragment = 1
 				for k in range(0, self._threshold):
-					ppub_key_fragment *= pow(commitment.public_coefficients[k],\
+					ppub_key_fragment *= powmod(commitment.public_coefficients[k],\
 											 2*(trustee**k), prime)
 					ppub_key_fragment = ppub_key_fragment % prime
 				
@@ -483,7 +484,7 @@ class ThresholdEncryptionSetUp:
 			#  (TODO: Add reference).
 			
 			# g^(2*P_{j}(i))
-			left_hand_side = pow(generator, 2*pp_key, prime)
+			left_hand_side = powmod(generator, 2*pp_key, prime)
 			# Calculate \prod{(g^{c_{jk}})^{2(i^{k})} as the rhs
 			right_hand_side = 1
 			
@@ -493,7 +494,7 @@ class ThresholdEncryptionSetUp:
 				# g^{c_{jk}})^{2(i^{k}) [  p_coeff is g^{c_{jk}}   ]
 				#  Also, note that we need trustees to be indexed from 1 to n 
 				#  here, not 0 to (n-1), thus (current_trustee+1)
-				right_hand_side *= pow(p_coeff, 2*(current_trustee+1)**k, prime)
+				right_hand_side *= powmod(p_coeff, 2*(current_trustee+1)**k, prime)
 				right_hand_side = right_hand_side % prime
 			
 			if(left_hand_side != right_hand_side):
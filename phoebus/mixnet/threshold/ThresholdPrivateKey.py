@@ -55,6 +55,7 @@ from ..PVCExceptions import InvalidPloneVoteCryptoFileError, \
                                              IncompatibleCiphertextError
 from .. import serialize
 from ..EGCryptoSystem import EGCryptoSystem
+from ..arithmetic import powmod
 
 # ============================================================================
     
@@ -107,6 +108,9 @@ class ThresholdPrivateKey:
                                            this threshold private key is 
                                            associated.
     """
+
+    # Never shared with the worker processes (see WorkerPool.py)
+    SECRET = True
     
     def __init__(self, cryptosystem, num_trustees, threshold, 
                  threshold_public_key, private_key_value):
@@ -199,7 +203,7 @@ class ThresholdPrivateKey:
             # To calculate the value of the block, elevate gamma to the 
             # threshold private key. That is block.value = g^{rP(i)} for each 
             # nbits block of original plaintext.
-            value = pow(gamma, key, prime)
+            value = powmod(gamma, key, prime)
             
             # Generate the partial decryption proof for the block as a
             # Zero-Knowledge Discrete Logarithm Equality Test for 
@@ -211,10 +215,10 @@ class ThresholdPrivateKey:
             s = random.randint(1, q - 1)
             
             # a = g^{s} mod p
-            a = pow(generator, s, prime)
+            a = powmod(generator, s, prime)
             
             # b = gamma^{s} mod p
-            b = pow(gamma, s, prime)
+            b = powmod(gamma, s, prime)
             
             # c is SHA256(a, b, g^{2*P(j)}, block.value) the challenge
             # (We must use g^{2*P(j)} and not g^{P(j)}, because the first is 
@@ -223,7 +227,7 @@ class ThresholdPrivateKey:
             fingerprint = sha256()
             fingerprint.update(hex(a))
             fingerprint.update(hex(b))
-            fingerprint.update(hex(pow(generator, 2*key, prime)))
+            fingerprint.update(hex(powmod(generator, 2*key, prime)))
             fingerprint.update(hex(value))
             c = int(fingerprint.hexdigest(),16)
             
@@ -138,7 +138,44 @@ class ThresholdPublicKey(PublicKey):
         self.threshold = threshold
         self._partial_public_keys = verification_partial_public_keys
 
-        
+    def to_dict(self):
+        """
+        Returns a dictionary representation of this threshold public key,
+        without its cryptosystem. (see from_dict)
+        """
+        return {'num_trustees': self.num_trustees,
+                'threshold': self.threshold,
+                'key': self._key,
+                'partial_public_keys': list(self._partial_public_keys)}
+
+    @classmethod
+    def from_dict(cls, d, cryptosystem):
+        """
+        Loads a threshold public key stored with to_dict().
+
+        Since the cryptosystem is not stored, this avoids verifying it again
+        (as from_file does) when the key is loaded many times.
+
+        Arguments:
+            d::dict    -- The output of to_dict() for the key.
+            cryptosystem::EGCryptoSystem    -- The cryptosystem of the key.
+
+        Throws:
+            ValueError    -- If the stored values do not match cryptosystem.
+        """
+        prime = cryptosystem.get_prime()
+        key = long(d['key'])
+        partial_public_keys = [long(k) for k in d['partial_public_keys']]
+
+        for value in [key] + partial_public_keys:
+            if(not (1 <= value <= prime - 2)):
+                raise ValueError("Invalid stored threshold public key: the " \
+                                 "values of the key do not match the given " \
+                                 "cryptosystem.")
+
+        return cls(cryptosystem, int(d['num_trustees']), int(d['threshold']),
+                   key, partial_public_keys)
+
     def to_file(self, filename, SerializerClass=serialize.XMLSerializer):
         """
         Saves this threshold public key to a file.
@@ -15,6 +15,10 @@ from mixnet.EGCryptoSystem import EGCryptoSystem as MixCryptosystem
 from mixnet.PublicKey import PublicKey as MixPublicKey
 from mixnet.Ciphertext import Ciphertext as MixCiphertext
 from mixnet.CiphertextCollection import CiphertextCollection as MixCiphertextCollection
+from mixnet.ReencryptionFactorPool import ReencryptionFactorPool as MixReencryptionFactorPool
+from mixnet.arithmetic import powmod, multi_powmod, invert, is_prime, jacobi
+from mixnet import params as mix_params
+from Crypto.Random.random import StrongRandom
 
 """
 Question 1: Who is your candidate #1?
@@ -462,16 +466,64 @@ def prove_encryption(modulus, alpha, beta, randomness):
 
 def verify_encryption(modulus, base, alpha, beta, proof):
     commitment, challenge = hash_to_commitment_and_challenge(alpha, beta)
-    return (pow(base, proof, modulus) ==
-            (pow(base, commitment, modulus) *
-             pow(alpha, challenge, modulus) % modulus))
+    return (powmod(base, proof, modulus) ==
+            multi_powmod([base, alpha], [commitment, challenge], modulus))
+
+def verify_encryptions(modulus, base, encryptions):
+    """
+    Verify the proofs of many encryptions at once, given as a list of
+    (alpha, beta, proof) tuples. The equation of each proof is raised to a
+    small random exponent s and all of them are multiplied together:
+
+        base^sum(s*(proof - commitment)) == prod(alpha^(s*challenge))
+
+    so that base is raised only once for the whole batch, and the powers of
+    the alphas have short exponents. If any proof is invalid, the batch
+    passes with probability at most
+    2^-mix_params.BATCH_VERIFICATION_SECURITY_PARAMETER.
+
+    This requires the modulus to be a safe prime, as for the mixnet, and
+    the values to be quadratic residues: encryptions with other alphas are
+    verified one by one. Returns True if all proofs are valid, without
+    telling which one is not; use verify_encryption for that.
+    """
+    if jacobi(base, modulus) != 1:
+        for alpha, beta, proof in encryptions:
+            if not verify_encryption(modulus, base, alpha, beta, proof):
+                return False
+        return True
+
+    order = (modulus - 1) / 2
+    bits = mix_params.BATCH_VERIFICATION_SECURITY_PARAMETER
+    random = StrongRandom()
+
+    exponent = 0
+    alphas = []
+    exponents = []
+    for alpha, beta, proof in encryptions:
+        if not (1 <= alpha < modulus and jacobi(alpha, modulus) == 1):
+            if not verify_encryption(modulus, base, alpha, beta, proof):
+                return False
+            continue
+
+        commitment, challenge = hash_to_commitment_and_challenge(alpha, beta)
+        s = random.getrandbits(bits)
+        exponent += s * (proof - commitment)
+        alphas.append(alpha)
+        exponents.append(s * challenge)
+
+    if not alphas:
+        return True
+
+    return (powmod(base, exponent % order, modulus) ==
+            multi_powmod(alphas, exponents, modulus))
 
 
 def sign_message(modulus, base, order, key, message):
     while 1:
         w = number.getRandomRange(3, order)
-        r = pow(base, w, modulus) % order
-        w = number.inverse(w, order)
+        r = powmod(base, w, modulus) % order
+        w = invert(w, order)
         s = w * (message + r*key)
         if s != 0:
             break
@@ -487,7 +539,7 @@ def verify_signature(modulus, base, order, signature):
 
     u1 = (w * m) % order
     u2 = (w * r) % order
-    u = (pow(base, u1, modulus) * pow(base, u2, modulus)) % order
+    u = (powmod(base, u1, modulus) * powmod(base, u2, modulus)) % order
     if u != r:
         return 0
 
@@ -539,6 +591,44 @@ def mixnet_pk(elgamal_pk):
     return mix_pk, mix_nbits
 
 
+def shuffle_collection(mix_collection, checkpoint=None, factor_pool=None,
+                       proof_backend=None):
+    """
+    Shuffle a MixCiphertextCollection with a proof of shuffling. Returns the
+    shuffled collection and the proof.
+
+    The proof is not verified here: it is generated from a mapping checked
+    against both collections, and is verified by whoever audits the mix.
+
+    This does not verify the ciphertexts of the collection, which must be
+    trusted already: either loaded from ballots cast with Election.cast_votes
+    or checked by the caller.
+
+    proof_backend selects the kind of proof (see mixnet/ProofBackends.py),
+    the default one of mixnet/params.py is used if it is None.
+
+    If factor_pool is given, precomputed re-encryption factors are drawn
+    from it (see MixReencryptionFactorPool).
+
+    If checkpoint is given, the shuffle is saved as it progresses and
+    resumed from what was saved, through the methods
+    checkpoint.load(mix_collection) -> (mapping, rounds),
+    checkpoint.save_shuffle(mapping) and
+    checkpoint.save_round(index, collection, mapping)
+    (see MixCiphertextCollection.shuffle_with_proof).
+    """
+    if checkpoint is None:
+        mix_shuffled, mix_proof = mix_collection.shuffle_with_proof(
+            factor_pool=factor_pool, proof_backend=proof_backend)
+    else:
+        mapping, rounds = checkpoint.load(mix_collection)
+        mix_shuffled, mix_proof = mix_collection.shuffle_with_proof(
+            mapping, rounds, on_shuffle=checkpoint.save_shuffle,
+            on_round=checkpoint.save_round, factor_pool=factor_pool,
+            proof_backend=proof_backend)
+    return mix_shuffled, mix_proof
+
+
 class Election(object):
 
     candidates = None
@@ -608,17 +698,16 @@ class Election(object):
         self.init_mixnet()
 
     def validate_cryptosystem(self):
-        from Crypto.Util.number import isPrime
         pk = self.public_key
-        if pow(pk.g, pk.q, pk.p) != 1:
+        if powmod(pk.g, pk.q, pk.p) != 1:
             m = "g is not a generator, or q is not its order!"
             raise AssertionError(m)
 
-        if not isPrime(pk.p):
+        if not is_prime(pk.p):
             m = "modulus not prime!"
             raise AssertionError(m)
 
-        if not isPrime(pk.q):
+        if not is_prime(pk.q):
             m = "subgroup order not prime!"
             raise AssertionError(m)
 
@@ -714,7 +803,7 @@ class Election(object):
             return powers[n]
 
         pk = self.public_key
-        p = pow(pk.g, n, pk.p)
+        p = powmod(pk.g, n, pk.p)
         powers[n] = p
         self._logs[p] = n
         return p
@@ -732,7 +821,7 @@ class Election(object):
     def q_encode(self, m):
         pk = self.public_key
         m += 1 # this is to avoid element 0 when m == 0
-        legendre = pow(m, pk.q, pk.p)
+        legendre = powmod(m, pk.q, pk.p)
         if legendre == 1:
             return m
         else:
@@ -783,10 +872,18 @@ class Election(object):
 
         ballot_append = self.encrypted_ballots.append
 
+        # check all the proofs in one batch, and only look for the invalid
+        # one, vote by vote, if the batch fails
+        votes = list(votes)
+        proofs = [(eb['a'], eb['b'], eb['proof'])
+                  for eb in (vote.encrypted_ballot for vote in votes)
+                  if 'proof' in eb and eb['proof']]
+        verified = verify_encryptions(pk.p, pk.g, proofs)
+
         for vote in votes:
             owner = vote.owner
             eb = vote.encrypted_ballot
-            if 'proof' in eb and eb['proof']:
+            if not verified and 'proof' in eb and eb['proof']:
               if not verify_encryption(pk.p, pk.g, eb['a'], eb['b'], eb['proof']):
                   m = ("Invalid encryption proof for vote #%d, from %s"
                           % (len(owners), owner))
@@ -822,36 +919,34 @@ class Election(object):
         """
         Return a MixCipherCollection of the encrypted ballots.
         """
-        mix_pk = self.mix_pk
-        mix_nbits = self.mix_nbits
-        mix_pkfinger = mix_pk.get_fingerprint()
-
-        mix_collection = MixCiphertextCollection(mix_pk)
-        add_ciphertext = mix_collection.add_ciphertext
-        for v in self.encrypted_ballots:
-            ballot = v.encrypted_ballot
-            ct = MixCiphertext(mix_nbits, mix_pkfinger)
-            for x in ballot:
-                ct.append(x['a'], x['b'])
-            add_ciphertext(ct)
-        return mix_collection
-
-    def mix_ballots(self):
+        values = ([value for x in v.encrypted_ballot
+                   for value in (x['a'], x['b'])]
+                  for v in self.encrypted_ballots)
+        return MixCiphertextCollection.from_values(self.mix_pk,
+                                                   self.mix_nbits, values)
+
+    def mix_ballots(self, checkpoint=None, factor_pool=None,
+                    proof_backend=None):
+        """
+        Shuffle the encrypted ballots with a proof of shuffling.
+        (see shuffle_collection for the arguments)
+        """
         mix_collection = self.ballots_as_cipher_collection()
 
         # :mock-mixing, without reencryption, without proof
         # shuffle(ballots)
 
-        mix_shuffled, mix_proof = mix_collection.shuffle_with_proof()
-        mix_proof.verify(mix_collection, mix_shuffled)
+        mix_shuffled, mix_proof = shuffle_collection(mix_collection,
+                                                     checkpoint=checkpoint,
+                                                     factor_pool=factor_pool,
+                                                     proof_backend=proof_backend)
 
         ballots = []
         append = ballots.append
 
         for ct in mix_shuffled:
-            encrypted_ballot = []
-            for i in xrange(0, ct.get_length()):
-                encrypted_ballot.append({'a': ct.gamma[i], 'b': ct.delta[i]})
+            encrypted_ballot = [{'a': a, 'b': b}
+                                for a, b in zip(ct.gamma, ct.delta)]
             append(Ballot(self, encrypted_ballot=encrypted_ballot))
 
         self.mixed_ballots = ballots
@@ -211,6 +211,27 @@ HELIOS_VOTERS_EMAIL = True
 # are elections private by default?
 HELIOS_PRIVATE_DEFAULT = False
 
+# precompute re-encryption factors for the local mixnets of frozen elections
+# while voting is open, in tasks of HELIOS_MIXNET_FACTORS_PER_TASK factors
+HELIOS_MIXNET_PRECOMPUTE_FACTORS = (get_from_env('HELIOS_MIXNET_PRECOMPUTE_FACTORS', '1') == '1')
+HELIOS_MIXNET_FACTORS_PER_TASK = int(get_from_env('HELIOS_MIXNET_FACTORS_PER_TASK', '1000'))
+
+# a local mixnet's question claimed by a task that made no progress for this
+# many seconds is taken over by another task (eg. after a worker crash)
+HELIOS_MIXNET_CLAIM_TIMEOUT = int(get_from_env('HELIOS_MIXNET_CLAIM_TIMEOUT', '3600'))
+
+# checkpoints of a local mixnet's questions hold its secret shuffle mapping.
+# they are deleted once their question is mixed, or when the mixnet finishes
+# or is reset. a failed mix only keeps the checkpoints of the questions left
+# to mix, to resume from them: those of a mixnet that is not mixing are
+# deleted once older than this many seconds, as soon as any mixnet starts
+# mixing
+HELIOS_MIXNET_CHECKPOINT_TIMEOUT = int(get_from_env('HELIOS_MIXNET_CHECKPOINT_TIMEOUT', '604800'))
+
+# threshold elections combine the first valid partial decryptions they need,
+# the others are verified afterwards in a background task
+HELIOS_AUDIT_UNUSED_DECRYPTIONS = (get_from_env('HELIOS_AUDIT_UNUSED_DECRYPTIONS', '1') == '1')
+
 # authentication systems enabled
 #AUTH_ENABLED_AUTH_SYSTEMS = ['password','facebook','twitter', 'google', 'yahoo']
 AUTH_ENABLED_AUTH_SYSTEMS = get_from_env('AUTH_ENABLED_AUTH_SYSTEMS', 'google').split(",")
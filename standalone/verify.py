@@ -36,6 +36,8 @@ from mixnet.EGCryptoSystem import EGCryptoSystem
 from mixnet.PrivateKey import PrivateKey
 from mixnet.PublicKey import PublicKey
 from mixnet.ShufflingProof import ShufflingProof
+from mixnet.ProofBackends import proof_from_dict
+from mixnet.arithmetic import multi_powmod
 
 from mixnet.threshold.PartialDecryption import PartialDecryption, PartialDecryptionBlock, PartialDecryptionBlockProof
 from mixnet.threshold.ThresholdDecryptionCombinator import ThresholdDecryptionCombinator
@@ -101,7 +103,7 @@ for i in xrange(0, numMixnets):
 	index = numMixnets - i - 1
 	for q in xrange(0, numQuestions):
 		with statusCheck("Verifying mix " + str(index) + " question " + str(q)):
-			proof = ShufflingProof.from_dict(mixnets[index][1][q], pk, nbits)
+			proof = proof_from_dict(mixnets[index][1][q], pk, nbits)
 			
 			orig = CiphertextCollection(pk)
 			if i == 0:
@@ -125,9 +127,11 @@ for i in xrange(0, numMixnets):
 				shuf.add_ciphertext(ciphertext)
 			
 			# Check the challenge ourselves to provide a more informative error message
-			expected_challenge = proof._generate_challenge(orig, shuf)
-			if proof._challenge != expected_challenge:
-				raise VerificationException("Challenge is wrong")
+			# (shuffle arguments recompute their challenges when verified)
+			if isinstance(proof, ShufflingProof):
+				expected_challenge = proof._generate_challenge(orig, shuf)
+				if proof._challenge != expected_challenge:
+					raise VerificationException("Challenge is wrong")
 			
 			# Do the maths
 			if not proof.verify(orig, shuf):
@@ -161,15 +165,20 @@ if trusteeThreshold <= 0:
 						# Do the maths
 						T = long(proof["response"])
 						
-						GT = pow(cryptosystem.get_generator(), T, P)
-						AYC = (long(proof["commitment"]["A"]) * pow(long(trustees[j]["public_key"]["y"]), C, P)) % P
-						if GT != AYC:
+						# g^t = Ay^c is checked as g^t y^-c = A, with both powers computed together
+						try:
+							GTYC = multi_powmod([cryptosystem.get_generator(), long(trustees[j]["public_key"]["y"])], [T, -C], P)
+						except ValueError:
+							raise VerificationException("Trustee public key is not invertible (mod p)")
+						if GTYC != long(proof["commitment"]["A"]) % P:
 							raise VerificationException("g^t != Ay^c (mod p)")
 						
-						AT = pow(long(ballot["choices"][block]["alpha"]), T, P)
-						BFC = (long(proof["commitment"]["B"]) * pow(factor, C, P)) % P
+						try:
+							ATFC = multi_powmod([long(ballot["choices"][block]["alpha"]), factor], [T, -C], P)
+						except ValueError:
+							raise VerificationException("Decryption factor is not invertible (mod p)")
 
-						if AT != BFC:
+						if ATFC != long(proof["commitment"]["B"]) % P:
 							raise VerificationException("alpha^t != B(factor)^c (mod p)")
 						
 						decryption_factor_combination *= factor